@@ -1,5 +1,15 @@
+from datetime import timedelta
+
 from django.contrib import admin
-from .models import Producto, Contacto, Empresa, Etiqueta, Oportunidad, Actividad
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+
+from .instrumentacion import REPORTE_HORAS_MAXIMO, horas_reporte, reporte_vistas
+from .models import (
+    Producto, Contacto, Empresa, Etiqueta, Oportunidad, CambioEstado, Actividad, ActividadArchivada, CrmStats,
+    MuestraVista, Tarea,
+)
 
 # Register your models here.
 admin.site.register(Producto)
@@ -29,9 +39,77 @@ class OportunidadAdmin(admin.ModelAdmin):
     list_filter = ('estado', 'fecha_creacion', 'fecha_estimada_cierre')
     date_hierarchy = 'fecha_estimada_cierre'
 
+@admin.register(CambioEstado)
+class CambioEstadoAdmin(admin.ModelAdmin):
+    list_display = ('numero_oportunidad', 'oportunidad', 'estado_anterior', 'estado', 'valor', 'fecha')
+    list_filter = ('estado', 'estado_anterior')
+    date_hierarchy = 'fecha'
+    raw_id_fields = ('oportunidad',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(Actividad)
 class ActividadAdmin(admin.ModelAdmin):
     list_display = ('titulo', 'tipo', 'contacto', 'oportunidad', 'fecha', 'completada')
     search_fields = ('titulo', 'descripcion', 'contacto__nombre')
     list_filter = ('tipo', 'completada', 'fecha', 'fecha_creacion')
     date_hierarchy = 'fecha'
+
+@admin.register(ActividadArchivada)
+class ActividadArchivadaAdmin(admin.ModelAdmin):
+    list_display = ('titulo', 'tipo', 'contacto', 'oportunidad', 'fecha', 'fecha_archivado')
+    search_fields = ('titulo', 'descripcion', 'contacto__nombre')
+    list_filter = ('tipo', 'fecha')
+    date_hierarchy = 'fecha'
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(CrmStats)
+class CrmStatsAdmin(admin.ModelAdmin):
+    list_display = ('clave', 'cantidad', 'valor')
+    readonly_fields = ('clave', 'cantidad', 'valor')
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'estado', 'intentos', 'clave', 'disponible_desde', 'fecha_creacion')
+    list_filter = ('estado', 'nombre')
+    search_fields = ('nombre', 'clave')
+    readonly_fields = ('reclamada_por', 'reclamada_hasta', 'error')
+
+@admin.register(MuestraVista)
+class MuestraVistaAdmin(admin.ModelAdmin):
+    list_display = ('vista', 'metodo', 'estado', 'duracion_ms', 'consultas', 'consultas_repetidas', 'fecha')
+    list_filter = ('vista', 'metodo', 'estado')
+    date_hierarchy = 'fecha'
+    change_list_template = 'admin/home/muestravista/change_list.html'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('reporte/', self.admin_site.admin_view(self.reporte_view), name='home_muestravista_reporte'),
+        ] + super().get_urls()
+
+    def reporte_view(self, request):
+        try:
+            horas = horas_reporte(request.GET.get('horas', 24))
+        except ValueError:
+            horas = 24
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Vistas más lentas (p95)',
+            'horas': horas,
+            'horas_maximo': REPORTE_HORAS_MAXIMO,
+            'filas': reporte_vistas(timezone.now() - timedelta(hours=horas)),
+        }
+        return TemplateResponse(request, 'admin/home/muestravista/reporte.html', context)
@@ -0,0 +1,175 @@
+"""
+Analítica del embudo de ventas y pronóstico de ingresos.
+
+Cada vez que una oportunidad se crea o cambia de estado se agrega una fila a
+CambioEstado (señales de home/signals.py y cambiar_estado_oportunidades de
+home/lotes.py); la tabla nunca se actualiza y sobrevive a las oportunidades
+eliminadas, que se siguen agrupando por numero_oportunidad. Sobre ella se
+calculan:
+
+- la conversión entre estados: de las entradas a un estado, qué fracción
+  pasó después a cada otro;
+- el tiempo promedio en cada estado, hasta el siguiente cambio;
+- la probabilidad de ganar desde cada estado, entre las oportunidades cuyo
+  último cambio las cerró y que pasaron por él;
+- el pronóstico: valor de las oportunidades abiertas por mes de
+  fecha_estimada_cierre, ponderado por la probabilidad de su estado.
+
+Todo se agrega en la base de datos con GROUP BY sobre las columnas, así a
+Python solo llegan unas pocas filas por estado y mes. El reporte de cada
+periodo se guarda en la caché por omisión con una versión que las escrituras
+reemplazan (invalidar()) y expira con CRM_ANALITICA_TTL.
+"""
+import time
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, DateTimeField, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncMonth
+
+from .contadores import ESTADOS_ABIERTOS
+from .models import CambioEstado, Oportunidad
+
+ESTADOS_CERRADOS = ('ganado', 'perdido')
+
+CLAVE_VERSION = 'crm:analitica:version'
+
+
+def _version():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # Como en home/fragmentos.py: un valor que no repite versiones expulsadas
+        cache.add(CLAVE_VERSION, time.time_ns(), timeout=None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def invalidar():
+    """Cambia la versión: los reportes en caché se vuelven a calcular."""
+    # Como en home/fragmentos.py: set() y no incr()
+    cache.set(CLAVE_VERSION, time.time_ns(), timeout=None)
+
+
+def periodo_valido(texto):
+    """El año de ``texto`` ('2026') o None si no es un año."""
+    return int(texto) if texto.isdigit() and len(texto) == 4 else None
+
+
+def reporte(anio=None):
+    """Embudo y pronóstico del año ``anio`` (toda la historia si es None), desde la caché si está."""
+    clave = f'crm:analitica:{_version()}:{anio or "todo"}'
+    datos = cache.get(clave)
+    if datos is None:
+        datos = calcular(anio)
+        cache.set(clave, datos, getattr(settings, 'CRM_ANALITICA_TTL', 600))
+    return datos
+
+
+def calcular(anio=None):
+    """Calcula el reporte sin caché."""
+    cambios = CambioEstado.objects.order_by()
+    if anio:
+        cambios = cambios.filter(fecha__year=anio)
+    probabilidades = probabilidad_de_ganar()
+    return {
+        'anio': anio,
+        'embudo': embudo(cambios, probabilidades),
+        'pronostico': pronostico(probabilidades, anio),
+    }
+
+
+def transiciones(cambios):
+    """{(estado_anterior, estado): cantidad} de los cambios."""
+    return {
+        (fila['estado_anterior'], fila['estado']): fila['cantidad']
+        for fila in cambios.values('estado_anterior', 'estado').annotate(cantidad=Count('id'))
+    }
+
+
+def tiempo_en_estado(cambios):
+    """{estado: (días promedio, estancias)} hasta el siguiente cambio; las estancias abiertas no cuentan."""
+    siguiente = Subquery(
+        CambioEstado.objects.filter(numero_oportunidad=OuterRef('numero_oportunidad'), fecha__gt=OuterRef('fecha'))
+        .order_by('fecha', 'id').values('fecha')[:1],
+        output_field=DateTimeField(),
+    )
+    filas = (
+        cambios.annotate(siguiente=siguiente).filter(siguiente__isnull=False)
+        .values('estado').annotate(duracion=Avg(F('siguiente') - F('fecha')), cantidad=Count('id'))
+    )
+    return {fila['estado']: (fila['duracion'].total_seconds() / 86400, fila['cantidad']) for fila in filas}
+
+
+def probabilidad_de_ganar():
+    """
+    {estado: fracción ganada} entre las oportunidades cerradas que pasaron
+    por cada estado, también las eliminadas: el estado final es el del
+    último cambio. Un estado abierto sin historia cerrada usa la fracción
+    ganada de todas las cerradas.
+    """
+    final = Subquery(
+        CambioEstado.objects.filter(numero_oportunidad=OuterRef('numero_oportunidad'))
+        .order_by('-fecha', '-id').values('estado')[:1],
+    )
+    cerradas = CambioEstado.objects.order_by().annotate(final=final).filter(final__in=ESTADOS_CERRADOS)
+    conteos = {
+        'cerradas': Count('numero_oportunidad', distinct=True),
+        'ganadas': Count('numero_oportunidad', distinct=True, filter=Q(final='ganado')),
+    }
+    filas = cerradas.values('estado').annotate(**conteos)
+    probabilidades = {fila['estado']: fila['ganadas'] / fila['cerradas'] for fila in filas}
+    faltantes = [estado for estado in ESTADOS_ABIERTOS if estado not in probabilidades]
+    if faltantes:
+        total = cerradas.aggregate(**conteos)
+        for estado in faltantes:
+            probabilidades[estado] = total['ganadas'] / total['cerradas'] if total['cerradas'] else 0.0
+    probabilidades.update(ganado=1.0, perdido=0.0)
+    return probabilidades
+
+
+def embudo(cambios, probabilidades):
+    """Una fila por estado con sus entradas, la conversión a cada otro estado, el tiempo y la probabilidad."""
+    conteos = transiciones(cambios)
+    tiempos = tiempo_en_estado(cambios)
+    entradas = defaultdict(int)
+    for (_, estado), cantidad in conteos.items():
+        entradas[estado] += cantidad
+    filas = []
+    for estado, nombre in Oportunidad.ESTADO_CHOICES:
+        conversion = []
+        for destino, _ in Oportunidad.ESTADO_CHOICES:
+            cantidad = conteos.get((estado, destino), 0) if destino != estado else 0
+            conversion.append({
+                'estado': destino, 'cantidad': cantidad,
+                'fraccion': cantidad / entradas[estado] if entradas[estado] else None,
+            })
+        dias, estancias = tiempos.get(estado, (None, 0))
+        filas.append({
+            'estado': estado, 'nombre': nombre, 'entradas': entradas[estado], 'conversion': conversion,
+            'dias': dias, 'estancias': estancias, 'probabilidad': probabilidades.get(estado),
+        })
+    return filas
+
+
+def pronostico(probabilidades, anio=None):
+    """Valor de las oportunidades abiertas por mes de cierre estimado, total y ponderado."""
+    oportunidades = Oportunidad.objects.filter(estado__in=ESTADOS_ABIERTOS).order_by()
+    if anio:
+        oportunidades = oportunidades.filter(fecha_estimada_cierre__year=anio)
+    filas = (
+        oportunidades.annotate(mes=TruncMonth('fecha_estimada_cierre')).values('mes', 'estado')
+        .annotate(cantidad=Count('id'), valor=Sum('valor'))
+    )
+    meses = {}
+    for fila in filas:
+        mes = meses.setdefault(fila['mes'], {
+            'mes': fila['mes'], 'cantidad': 0, 'valor': Decimal('0'), 'ponderado': Decimal('0'),
+        })
+        probabilidad = Decimal(str(round(probabilidades.get(fila['estado'], 0), 4)))
+        mes['cantidad'] += fila['cantidad']
+        mes['valor'] += fila['valor']
+        mes['ponderado'] += (fila['valor'] * probabilidad).quantize(Decimal('0.01'))
+    return sorted(meses.values(), key=lambda mes: mes['mes'] or date.min)
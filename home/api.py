@@ -0,0 +1,260 @@
+"""
+API JSON de solo lectura (v1) sobre contactos, empresas, oportunidades y actividades.
+
+    GET crm/api/v1/<recurso>/?fields=id,nombre&embed=empresa&limit=50&cursor=...
+    GET crm/api/v1/<recurso>/<id>/?fields=...&embed=...
+
+``fields`` limita las columnas que se leen y ``embed`` agrega relaciones con
+prefetch_related: una consulta por relación, sin importar el tamaño de la
+página. Las listas aceptan los mismos filtros y el mismo cursor que las
+vistas HTML; un cursor que no se puede usar responde 400.
+
+Cada respuesta lleva un ETag fuerte calculado con el id y la
+fecha_actualizacion de las filas y de las relaciones incluidas (de una
+relación muchos a muchos, la mayor entre las del objeto). Si coincide con
+If-None-Match se responde 304 antes de cargar relaciones y serializar. Las
+señales de home/signals.py cambian la fecha de los contactos cuando cambian
+sus etiquetas o se elimina su empresa.
+"""
+import datetime
+import decimal
+import hashlib
+import json
+
+from django.db.models import F, Max, OuterRef, Prefetch, Subquery, prefetch_related_objects
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+
+from . import views
+from .models import Actividad, Contacto, Empresa, Etiqueta, Oportunidad
+from .pagination import CursorInvalido, KeysetPaginator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LIMITE = 50
+MAXIMO = 200
+
+
+class Recurso:
+
+    def __init__(self, modelo, campos, relaciones=None, filtrar=None, orden=('id',)):
+        self.modelo = modelo
+        self.campos = campos
+        self.relaciones = relaciones or {}
+        self.filtrar = filtrar
+        self.orden = orden
+
+    def columna(self, campo):
+        # empresa_id -> empresa, que es lo que entiende only()
+        return self.modelo._meta.get_field(campo).name
+
+    def versionado(self):
+        return any(f.name == 'fecha_actualizacion' for f in self.modelo._meta.concrete_fields)
+
+
+ETIQUETAS = Recurso(Etiqueta, ('id', 'nombre', 'color'), orden=('nombre', 'id'))
+EMPRESAS = Recurso(
+    Empresa,
+    ('id', 'nombre', 'sitio_web', 'direccion', 'telefono', 'fecha_creacion', 'fecha_actualizacion'),
+    orden=('nombre', 'id'),
+)
+CONTACTOS = Recurso(
+    Contacto,
+    (
+        'id', 'nombre', 'correo', 'telefono', 'empresa_id', 'notas', 'fecha_creacion', 'fecha_actualizacion',
+        'oportunidades_abiertas', 'valor_abierto', 'actividades_total', 'ultima_actividad',
+    ),
+    relaciones={'empresa': EMPRESAS, 'etiquetas': ETIQUETAS},
+    filtrar=views.filtrar_contactos,
+    orden=views.ORDEN_PAGINACION['contactos_list'],
+)
+OPORTUNIDADES = Recurso(
+    Oportunidad,
+    (
+        'id', 'titulo', 'contacto_id', 'valor', 'estado', 'fecha_estimada_cierre', 'notas',
+        'fecha_creacion', 'fecha_actualizacion',
+    ),
+    relaciones={'contacto': CONTACTOS},
+    filtrar=views.filtrar_oportunidades,
+    orden=views.ORDEN_PAGINACION['oportunidades_list'],
+)
+ACTIVIDADES = Recurso(
+    Actividad,
+    (
+        'id', 'tipo', 'titulo', 'descripcion', 'fecha', 'contacto_id', 'oportunidad_id', 'completada',
+        'fecha_creacion', 'fecha_actualizacion',
+    ),
+    relaciones={'contacto': CONTACTOS, 'oportunidad': OPORTUNIDADES},
+    filtrar=views.filtrar_actividades,
+    orden=views.ORDEN_PAGINACION['actividades_list'],
+)
+
+RECURSOS = {
+    'contactos': CONTACTOS,
+    'empresas': EMPRESAS,
+    'oportunidades': OPORTUNIDADES,
+    'actividades': ACTIVIDADES,
+}
+
+
+def _lista(request, parametro):
+    return [valor.strip() for valor in request.GET.get(parametro, '').split(',') if valor.strip()]
+
+
+def _pedido(request, recurso):
+    """Campos y relaciones pedidos, validados contra el recurso."""
+    campos = _lista(request, 'fields') or list(recurso.campos)
+    desconocidos = [campo for campo in campos if campo not in recurso.campos]
+    if desconocidos:
+        raise ValueError(f'Campos desconocidos: {", ".join(desconocidos)}')
+    if 'id' not in campos:
+        campos.insert(0, 'id')
+    embebidos = _lista(request, 'embed')
+    desconocidos = [nombre for nombre in embebidos if nombre not in recurso.relaciones]
+    if desconocidos:
+        raise ValueError(f'Relaciones desconocidas: {", ".join(desconocidos)}')
+    return campos, embebidos
+
+
+def _es_fk(recurso, nombre):
+    return not recurso.modelo._meta.get_field(nombre).many_to_many
+
+
+def _queryset(recurso, queryset, campos, embebidos):
+    columnas = {recurso.columna(campo) for campo in campos}
+    if recurso.versionado():
+        columnas.add('fecha_actualizacion')
+    versiones = {}
+    for nombre in embebidos:
+        if _es_fk(recurso, nombre):
+            columnas.add(nombre)
+            if recurso.relaciones[nombre].versionado():
+                versiones[f'_version_{nombre}'] = F(f'{nombre}__fecha_actualizacion')
+        elif recurso.relaciones[nombre].versionado():
+            versiones[f'_version_{nombre}'] = _version_m2m(recurso, nombre)
+    return queryset.only(*columnas).annotate(**versiones)
+
+
+def _version_m2m(recurso, nombre):
+    # Subconsulta sobre la tabla intermedia: no reutiliza los joins de los filtros
+    campo = recurso.modelo._meta.get_field(nombre)
+    origen, destino = campo.m2m_field_name(), campo.m2m_reverse_field_name()
+    intermedia = campo.remote_field.through.objects.filter(**{origen: OuterRef('pk')}).order_by()
+    return Subquery(intermedia.values(origen).annotate(version=Max(f'{destino}__fecha_actualizacion')).values('version'))
+
+
+def _etag(recurso, filas, campos, embebidos, *extra):
+    partes = [recurso.modelo._meta.model_name, ','.join(campos), ','.join(embebidos), *map(str, extra)]
+    for fila in filas:
+        partes.append(str(fila.pk))
+        partes.append(str(getattr(fila, 'fecha_actualizacion', '')))
+        partes.extend(str(getattr(fila, f'_version_{nombre}', '')) for nombre in embebidos)
+    return '"%s"' % hashlib.sha1('|'.join(partes).encode()).hexdigest()
+
+
+def _cargar_relaciones(recurso, filas, embebidos):
+    prefetches = []
+    for nombre in embebidos:
+        relacionado = recurso.relaciones[nombre]
+        columnas = [relacionado.columna(campo) for campo in relacionado.campos]
+        queryset = relacionado.modelo.objects.only(*columnas)
+        if not _es_fk(recurso, nombre):
+            queryset = queryset.order_by(*relacionado.orden)
+        prefetches.append(Prefetch(nombre, queryset=queryset))
+    prefetch_related_objects(filas, *prefetches)
+
+
+def _valor(valor):
+    if isinstance(valor, (datetime.datetime, datetime.date)):
+        return valor.isoformat()
+    if isinstance(valor, decimal.Decimal):
+        return str(valor)
+    return valor
+
+
+def _serializar(recurso, objeto, campos, embebidos=()):
+    datos = {campo: _valor(getattr(objeto, campo)) for campo in campos}
+    for nombre in embebidos:
+        relacionado = recurso.relaciones[nombre]
+        if _es_fk(recurso, nombre):
+            valor = getattr(objeto, nombre)
+            datos[nombre] = _serializar(relacionado, valor, relacionado.campos) if valor else None
+        else:
+            datos[nombre] = [
+                _serializar(relacionado, item, relacionado.campos) for item in getattr(objeto, nombre).all()
+            ]
+    return datos
+
+
+def _json(datos):
+    if orjson is not None:
+        return orjson.dumps(datos)
+    return json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def _responder(request, recurso, filas, campos, embebidos, armar, *extra):
+    etag = _etag(recurso, filas, campos, embebidos, *extra)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        _cargar_relaciones(recurso, filas, embebidos)
+        response = HttpResponse(_json(armar(filas)), content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@require_safe
+def lista(request, recurso):
+    if recurso not in RECURSOS:
+        return JsonResponse({'error': 'Recurso no válido'}, status=404)
+    recurso = RECURSOS[recurso]
+    queryset = recurso.modelo.objects.all()
+    try:
+        campos, embebidos = _pedido(request, recurso)
+        limite = min(max(int(request.GET.get('limit', LIMITE)), 1), MAXIMO)
+        # filter() valida los ids de los filtros (?empresa=abc)
+        if recurso.filtrar:
+            queryset = recurso.filtrar(queryset, request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    # La búsqueda y los grupos ordenan por algo que no sirve de cursor
+    orden = None if request.GET.get('q') or request.GET.get('grupo') else recurso.orden
+    queryset = _queryset(recurso, queryset, campos, embebidos)
+    paginator = KeysetPaginator(queryset, limite, orden=orden, total=False, estricto=True)
+    try:
+        pagina = paginator.get_page(request.GET.get('cursor'))
+    except CursorInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    def armar(filas):
+        return {
+            'resultados': [_serializar(recurso, fila, campos, embebidos) for fila in filas],
+            'siguiente': pagina.next_cursor,
+            'anterior': pagina.previous_cursor,
+        }
+
+    return _responder(
+        request, recurso, pagina.object_list, campos, embebidos, armar, pagina.next_cursor, pagina.previous_cursor,
+    )
+
+
+@require_safe
+def detalle(request, recurso, pk):
+    if recurso not in RECURSOS:
+        return JsonResponse({'error': 'Recurso no válido'}, status=404)
+    recurso = RECURSOS[recurso]
+    try:
+        campos, embebidos = _pedido(request, recurso)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    filas = list(_queryset(recurso, recurso.modelo.objects.filter(pk=pk), campos, embebidos))
+    if not filas:
+        return JsonResponse({'error': 'No encontrado'}, status=404)
+    return _responder(
+        request, recurso, filas, campos, embebidos, lambda filas: _serializar(recurso, filas[0], campos, embebidos),
+    )
@@ -3,6 +3,7 @@ from django.apps import AppConfig
 
 class HomeConfig(AppConfig):
     name = 'home'
+    default_auto_field = 'django.db.models.AutoField'
 
-
-
+    def ready(self):
+        from . import signals  # noqa: F401
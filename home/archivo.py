@@ -0,0 +1,74 @@
+"""
+Archivo de actividades históricas.
+
+Las actividades completadas con fecha anterior al horizonte (CRM_ARCHIVO_DIAS)
+se mueven por lotes a ActividadArchivada, así la tabla que recorren la lista,
+el dashboard y el detalle de contacto no crece sin límite. Cada lote es una
+transacción: INSERT en el archivo y DELETE en Actividad de las mismas filas.
+
+Las listas siguen leyendo solo Actividad salvo que un filtro de fecha llegue
+hasta la actividad archivada más reciente; en ese caso se pagina la unión de
+ambas tablas (KeysetPaginatorUnion).
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .listas import invalidar
+from .lotes import borrar_sin_senales
+from .models import Actividad, ActividadArchivada
+
+LOTE = 1000
+
+CAMPOS = [
+    'id', 'tipo', 'titulo', 'descripcion', 'fecha', 'contacto_id', 'oportunidad_id',
+    'completada', 'fecha_creacion', 'fecha_actualizacion',
+]
+
+
+def horizonte(dias=None):
+    """Fecha antes de la cual una actividad completada se archiva."""
+    if dias is None:
+        dias = getattr(settings, 'CRM_ARCHIVO_DIAS', 365)
+    return timezone.now() - timedelta(days=dias)
+
+
+@transaction.atomic
+def archivar_lote(corte, tamano=LOTE):
+    """Archiva hasta ``tamano`` actividades completadas anteriores a ``corte``; devuelve cuántas."""
+    filas = list(
+        Actividad.objects.select_for_update().filter(completada=True, fecha__lt=corte)
+        .order_by('fecha', 'id').values(*CAMPOS)[:tamano]
+    )
+    if not filas:
+        return 0
+    ActividadArchivada.objects.bulk_create([ActividadArchivada(**fila) for fila in filas])
+    # Sin las señales de cada actividad: los contadores del contacto incluyen las archivadas
+    borrar_sin_senales(Actividad.objects.filter(id__in=[fila['id'] for fila in filas]))
+    invalidar('actividad')
+    return len(filas)
+
+
+def limite_archivo():
+    """Fecha de la actividad archivada más reciente, o None si el archivo está vacío."""
+    return ActividadArchivada.objects.order_by('-fecha').values_list('fecha', flat=True).first()
+
+
+def _fecha(params, nombre):
+    try:
+        return timezone.make_aware(datetime.strptime(params.get(nombre, ''), '%Y-%m-%d'))
+    except ValueError:
+        return None
+
+
+def alcanza_archivo(params):
+    """Si los filtros de una lista de actividades (ver views.filtrar_actividades) incluyen filas archivadas."""
+    if params.get('completadas') == 'no':
+        return False
+    desde, hasta = _fecha(params, 'fecha_desde'), _fecha(params, 'fecha_hasta')
+    if desde is None and hasta is None:
+        return False
+    limite = limite_archivo()
+    return limite is not None and (desde is None or desde <= limite)
@@ -0,0 +1,73 @@
+"""
+Preparación de cada worker al cargar thelightspeed/wsgi.py.
+
+preparar_worker resuelve el URLconf (importa las vistas y arma los índices
+de reverse) y, con CRM_PRECOMPILAR_PLANTILLAS, compila todas las plantillas
+de home/templates para que queden en el cargador en caché antes del primer
+pedido. Los tiempos de cada etapa quedan en TIEMPOS y en el log; el comando
+startup_report los mide en un proceso nuevo.
+"""
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.template import TemplateSyntaxError, engines
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+# Milisegundos por etapa del último arranque de este proceso
+TIEMPOS = {}
+
+
+def plantillas_de_home():
+    """Nombres (relativos a home/templates) de todas las plantillas de la app."""
+    raiz = os.path.join(apps.get_app_config('home').path, 'templates')
+    nombres = []
+    for directorio, _, archivos in os.walk(raiz):
+        for archivo in archivos:
+            if archivo.endswith('.html'):
+                nombres.append(os.path.relpath(os.path.join(directorio, archivo), raiz).replace(os.sep, '/'))
+    return sorted(nombres)
+
+
+def precompilar_plantillas():
+    """Compila las plantillas de home/templates; devuelve cuántas se compilaron."""
+    motor = engines['django']
+    compiladas = 0
+    for nombre in plantillas_de_home():
+        try:
+            motor.get_template(nombre)
+        except TemplateSyntaxError:
+            # Se informa aquí y vuelve a fallar en el pedido que la use
+            logger.exception('No se pudo precompilar %s', nombre)
+            continue
+        compiladas += 1
+    return compiladas
+
+
+def preparar_worker(inicio):
+    """Completa el arranque iniciado en ``inicio`` (time.perf_counter) y registra sus tiempos."""
+    TIEMPOS['importacion_ms'] = (time.perf_counter() - inicio) * 1000
+
+    etapa = time.perf_counter()
+    resolver = get_resolver()
+    resolver.url_patterns
+    resolver.reverse_dict
+    TIEMPOS['urlconf_ms'] = (time.perf_counter() - etapa) * 1000
+
+    TIEMPOS['plantillas'] = 0
+    TIEMPOS['plantillas_ms'] = 0.0
+    if getattr(settings, 'CRM_PRECOMPILAR_PLANTILLAS', False):
+        etapa = time.perf_counter()
+        TIEMPOS['plantillas'] = precompilar_plantillas()
+        TIEMPOS['plantillas_ms'] = (time.perf_counter() - etapa) * 1000
+
+    TIEMPOS['total_ms'] = (time.perf_counter() - inicio) * 1000
+    logger.info(
+        'Arranque del worker: importación %.0fms, URLconf %.0fms, %d plantillas en %.0fms, total %.0fms',
+        TIEMPOS['importacion_ms'], TIEMPOS['urlconf_ms'], TIEMPOS['plantillas'],
+        TIEMPOS['plantillas_ms'], TIEMPOS['total_ms'],
+    )
@@ -0,0 +1,140 @@
+"""
+Contadores desnormalizados de cada contacto.
+
+Contacto guarda cuántas oportunidades abiertas tiene y su valor, cuántas
+actividades (incluidas las archivadas) y la fecha de la última, para que
+listas y detalle no recorran Oportunidad y Actividad por contacto. Las
+señales de home/signals.py y las operaciones por lote de home/lotes.py los
+ajustan con ajustar(), un solo UPDATE con deltas sobre las columnas, y el
+comando rebuild_contact_counters los compara con las tablas y corrige los
+que se hayan desviado.
+
+Cada ajuste también cambia fecha_actualizacion: los contadores se muestran
+en fragmentos en caché y en la API, que se versionan con ella. Si cambia la
+última actividad también cambia la generación de contactos de la caché de
+listas (home/listas.py), que ordena por ella.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.query import QuerySet
+from django.utils import timezone
+
+from .listas import invalidar
+from .models import Actividad, ActividadArchivada, Contacto, Oportunidad
+
+ESTADOS_ABIERTOS = ('nuevo', 'en_progreso')
+
+CAMPOS = ['oportunidades_abiertas', 'valor_abierto', 'actividades_total', 'ultima_actividad']
+
+LOTE = 1000
+
+_DECIMAL = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _ultima_actividad():
+    vivas = Subquery(Actividad.objects.filter(contacto_id=OuterRef('pk')).order_by('-fecha').values('fecha')[:1])
+    archivadas = Subquery(
+        ActividadArchivada.objects.filter(contacto_id=OuterRef('pk')).order_by('-fecha').values('fecha')[:1]
+    )
+    # GREATEST de SQLite devuelve NULL si algún argumento lo es
+    return Greatest(Coalesce(vivas, archivadas), Coalesce(archivadas, vivas))
+
+
+def _contar(queryset):
+    return Coalesce(Subquery(queryset.annotate(n=Count('id')).values('n')), 0)
+
+
+def valores_reales():
+    """Expresiones con el valor correcto de cada contador, para annotate() o update()."""
+    abiertas = (
+        Oportunidad.objects.filter(contacto_id=OuterRef('pk'), estado__in=ESTADOS_ABIERTOS)
+        .order_by().values('contacto_id')
+    )
+    vivas = Actividad.objects.filter(contacto_id=OuterRef('pk')).order_by().values('contacto_id')
+    archivadas = ActividadArchivada.objects.filter(contacto_id=OuterRef('pk')).order_by().values('contacto_id')
+    return {
+        'oportunidades_abiertas': _contar(abiertas),
+        'valor_abierto': Coalesce(
+            Subquery(abiertas.annotate(v=Sum('valor')).values('v')), Value(Decimal('0')), output_field=_DECIMAL,
+        ),
+        'actividades_total': _contar(vivas) + _contar(archivadas),
+        'ultima_actividad': _ultima_actividad(),
+    }
+
+
+def sumar_oportunidad(deltas, fila, signo):
+    """Suma a ``deltas`` el aporte de una oportunidad (contacto_id, estado, valor) con ``signo``."""
+    if fila and fila[1] in ESTADOS_ABIERTOS:
+        abiertas, valor, actividades = deltas.get(fila[0], (0, 0, 0))
+        deltas[fila[0]] = (abiertas + signo, valor + signo * fila[2], actividades)
+
+
+def sumar_actividades(deltas, contacto_id, cantidad):
+    abiertas, valor, actividades = deltas.get(contacto_id, (0, 0, 0))
+    deltas[contacto_id] = (abiertas, valor, actividades + cantidad)
+
+
+def ajustar(deltas, ultima=()):
+    """
+    Suma a cada contacto sus ``deltas`` {contacto_id: (abiertas, valor,
+    actividades)} y recalcula la última actividad de los contactos en
+    ``ultima``, todo en un solo UPDATE.
+    """
+    deltas = {contacto_id: delta for contacto_id, delta in deltas.items() if contacto_id is not None and any(delta)}
+    ultima = {contacto_id for contacto_id in ultima if contacto_id is not None}
+    ids = set(deltas) | ultima
+    if not ids:
+        return
+    cambios = {'fecha_actualizacion': timezone.now()}
+    for posicion, campo, salida in [
+        (0, 'oportunidades_abiertas', IntegerField()),
+        (1, 'valor_abierto', _DECIMAL),
+        (2, 'actividades_total', IntegerField()),
+    ]:
+        casos = [
+            When(pk=contacto_id, then=Value(delta[posicion]))
+            for contacto_id, delta in deltas.items() if delta[posicion]
+        ]
+        if casos:
+            cambios[campo] = F(campo) + Case(*casos, default=Value(0), output_field=salida)
+    if ultima == ids:
+        cambios['ultima_actividad'] = _ultima_actividad()
+    elif ultima:
+        cambios['ultima_actividad'] = Case(When(pk__in=ultima, then=_ultima_actividad()), default=F('ultima_actividad'))
+    Contacto.objects.filter(pk__in=ids).update(**cambios)
+    if ultima:
+        invalidar('contacto')
+
+
+def por_borrado_de_contacto(origin):
+    """Si un post_delete viene del borrado de contactos: sus contadores ya no importan."""
+    if isinstance(origin, QuerySet):
+        return origin.model is Contacto
+    return isinstance(origin, Contacto)
+
+
+def recalcular(ids):
+    """Recalcula desde las tablas los contadores de los contactos ``ids``."""
+    Contacto.objects.filter(pk__in=ids).update(**valores_reales(), fecha_actualizacion=timezone.now())
+    invalidar('contacto')
+
+
+def revisar_lote(desde=0, tamano=LOTE, corregir=True):
+    """
+    Compara los contadores de hasta ``tamano`` contactos con id mayor que
+    ``desde`` y, con ``corregir``, recalcula los que no coinciden. Devuelve
+    el último id revisado (None si no quedaban) y los ids con diferencias.
+    """
+    reales = valores_reales()
+    filas = list(
+        Contacto.objects.filter(pk__gt=desde).order_by('pk')
+        .values('pk', *CAMPOS, **{f'real_{campo}': expresion for campo, expresion in reales.items()})[:tamano]
+    )
+    if not filas:
+        return None, []
+    distintos = [fila['pk'] for fila in filas if any(fila[campo] != fila[f'real_{campo}'] for campo in CAMPOS)]
+    if distintos and corregir:
+        recalcular(distintos)
+    return filas[-1]['pk'], distintos
@@ -0,0 +1,120 @@
+"""
+Exportación de las listas del CRM en CSV o JSONL.
+
+Las filas se leen con ``.iterator(chunk_size=...)`` (un cursor del lado del
+servidor en PostgreSQL, lecturas por bloques en SQLite) y se escriben una a
+una en la respuesta, así que la memoria no depende de cuántas filas haya.
+Los filtros son los mismos de las vistas de lista.
+"""
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Prefetch
+
+from .models import Etiqueta
+
+TAMANO_BLOQUE = 2000
+SEPARADOR_ETIQUETAS = ';'
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+TIPOS_JSONL = ('application/x-ndjson', 'application/jsonl', 'application/json-lines')
+
+COLUMNAS_CONTACTOS = ['id', 'nombre', 'correo', 'telefono', 'empresa', 'etiquetas', 'notas', 'fecha_creacion']
+COLUMNAS_OPORTUNIDADES = [
+    'id', 'titulo', 'contacto_id', 'contacto', 'valor', 'estado', 'fecha_estimada_cierre',
+    'notas', 'fecha_creacion', 'fecha_actualizacion',
+]
+COLUMNAS_ACTIVIDADES = [
+    'id', 'tipo', 'titulo', 'descripcion', 'fecha', 'contacto_id', 'contacto',
+    'oportunidad_id', 'oportunidad', 'completada', 'fecha_creacion',
+]
+
+
+def formato_pedido(request):
+    """``?formato=csv|jsonl`` manda; si no, se mira el encabezado Accept. Por omisión, CSV."""
+    formato = request.GET.get('formato', '').lower()
+    if formato in FORMATOS:
+        return formato
+    aceptados = request.headers.get('Accept', '')
+    if any(tipo in aceptados for tipo in TIPOS_JSONL):
+        return 'jsonl'
+    return 'csv'
+
+
+def filas_contactos(contactos, tamano_bloque=TAMANO_BLOQUE):
+    # Con chunk_size, prefetch_related se resuelve por bloque
+    contactos = contactos.select_related('empresa').only(
+        'id', 'nombre', 'correo', 'telefono', 'notas', 'fecha_creacion', 'empresa__nombre'
+    ).prefetch_related(Prefetch('etiquetas', queryset=Etiqueta.objects.only('id', 'nombre')))
+    for contacto in contactos.iterator(chunk_size=tamano_bloque):
+        yield {
+            'id': contacto.id,
+            'nombre': contacto.nombre,
+            'correo': contacto.correo,
+            'telefono': contacto.telefono,
+            'empresa': contacto.empresa.nombre if contacto.empresa else None,
+            'etiquetas': [etiqueta.nombre for etiqueta in contacto.etiquetas.all()],
+            'notas': contacto.notas,
+            'fecha_creacion': contacto.fecha_creacion,
+        }
+
+
+def filas_oportunidades(oportunidades, tamano_bloque=TAMANO_BLOQUE):
+    filas = oportunidades.values(
+        'id', 'titulo', 'contacto_id', 'valor', 'estado', 'fecha_estimada_cierre',
+        'notas', 'fecha_creacion', 'fecha_actualizacion', contacto_nombre=F('contacto__nombre'),
+    )
+    for fila in filas.iterator(chunk_size=tamano_bloque):
+        fila['contacto'] = fila.pop('contacto_nombre')
+        yield fila
+
+
+def filas_actividades(actividades, tamano_bloque=TAMANO_BLOQUE):
+    filas = actividades.values(
+        'id', 'tipo', 'titulo', 'descripcion', 'fecha', 'contacto_id', 'oportunidad_id',
+        'completada', 'fecha_creacion',
+        contacto_nombre=F('contacto__nombre'), oportunidad_titulo=F('oportunidad__titulo'),
+    )
+    for fila in filas.iterator(chunk_size=tamano_bloque):
+        fila['contacto'] = fila.pop('contacto_nombre')
+        fila['oportunidad'] = fila.pop('oportunidad_titulo')
+        yield fila
+
+
+class _Eco:
+    """Pseudo archivo para csv.writer: devuelve lo escrito en lugar de guardarlo."""
+
+    def write(self, valor):
+        return valor
+
+
+def _celda_csv(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, list):
+        return SEPARADOR_ETIQUETAS.join(valor)
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return valor
+
+
+def escribir_csv(filas, columnas):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(columnas)
+    for fila in filas:
+        yield escritor.writerow([_celda_csv(fila[columna]) for columna in columnas])
+
+
+def escribir_jsonl(filas, columnas):
+    codificador = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for fila in filas:
+        yield codificador.encode({columna: fila[columna] for columna in columnas}) + '\n'
+
+
+ESCRITORES = {
+    'csv': escribir_csv,
+    'jsonl': escribir_jsonl,
+}
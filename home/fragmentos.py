@@ -0,0 +1,82 @@
+"""
+Caché de fragmentos de plantilla del CRM.
+
+Las filas de contactos_list, las tarjetas del pipeline y las actividades
+recientes del dashboard se guardan con {% cache %} en el alias 'fragmentos'.
+La clave de cada fragmento lleva el pk y la fecha_actualizacion del objeto y
+la versión de los modelos relacionados que muestra (nombre de la empresa,
+etiquetas, nombre del contacto). Las versiones son marcas de tiempo en la
+misma caché que las señales de home/signals.py reemplazan; los fragmentos
+con una versión vieja dejan de coincidir y expiran con CRM_FRAGMENTOS_TTL.
+
+LocMemCacheMedida y FileBasedCacheMedida cuentan los aciertos y fallos de
+get() en la medición de InstrumentacionMiddleware, así que la tasa de
+aciertos por vista aparece en slow_views y en el reporte del admin.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from .instrumentacion import contar_fragmento
+
+ALIAS = 'fragmentos'
+MODELOS = ('empresa', 'etiqueta', 'contacto')
+
+_AUSENTE = object()
+
+
+def _clave_version(modelo):
+    return f'version:{modelo}'
+
+
+def versiones():
+    """Contexto para {% cache %}: el ttl y la versión actual de cada modelo de MODELOS."""
+    cache = caches[ALIAS]
+    claves = [_clave_version(modelo) for modelo in MODELOS]
+    guardadas = cache.get_many(claves)
+    faltantes = [clave for clave in claves if clave not in guardadas]
+    if faltantes:
+        # Si la versión se expulsó, se reinicia con un valor que no puede
+        # coincidir con el de fragmentos viejos que sigan en la caché
+        for clave in faltantes:
+            cache.add(clave, time.time_ns(), timeout=None)
+        guardadas.update(cache.get_many(faltantes))
+    contexto = {modelo: guardadas.get(_clave_version(modelo)) for modelo in MODELOS}
+    contexto['ttl'] = getattr(settings, 'CRM_FRAGMENTOS_TTL', 600)
+    return contexto
+
+
+def invalidar(modelo):
+    """Cambia la versión de ``modelo``: los fragmentos que dependen de él se vuelven a renderizar."""
+    cache = caches[ALIAS]
+    # Un valor nuevo en lugar de incr(): en FileBasedCache incr() lee y
+    # escribe sin bloqueo y dos procesos pueden perder un incremento
+    cache.set(_clave_version(modelo), time.time_ns(), timeout=None)
+
+
+class _Medida:
+
+    def get(self, key, default=None, version=None):
+        valor = super().get(key, _AUSENTE, version)
+        contar_fragmento(valor is not _AUSENTE)
+        return default if valor is _AUSENTE else valor
+
+    def get_many(self, keys, version=None):
+        # Con get_many se leen las versiones, que no cuentan como fragmentos
+        valores = {}
+        for clave in keys:
+            valor = super().get(clave, _AUSENTE, version)
+            if valor is not _AUSENTE:
+                valores[clave] = valor
+        return valores
+
+
+class LocMemCacheMedida(_Medida, LocMemCache):
+    pass
+
+
+class FileBasedCacheMedida(_Medida, FileBasedCache):
+    pass
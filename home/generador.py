@@ -0,0 +1,185 @@
+"""
+Datos sintéticos del CRM para pruebas de carga y benchmarks.
+
+Con la misma semilla sobre una base vacía se generan los mismos datos; las
+fechas son relativas a ``referencia`` (por omisión, el momento de generar).
+Cada contacto recibe una cantidad aleatoria de etiquetas, oportunidades y
+actividades con proporciones parecidas a las de producción, y cada
+oportunidad una historia de estados que termina en el actual. Todo se inserta
+por lotes con bulk_create y, como eso no emite señales, cada lote recalcula
+los contadores de sus contactos y al final se reconstruyen los acumulados
+del dashboard y el índice de búsqueda.
+"""
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .contadores import recalcular
+from .listas import DEPENDENCIAS, invalidar
+from .models import Actividad, ActividadArchivada, CambioEstado, Contacto, Empresa, Etiqueta, Oportunidad
+from .search import reconstruir_indice
+from .stats import reconstruir_estadisticas
+
+TAMANO_LOTE = 2000
+CONTACTOS_POR_EMPRESA = 25
+
+NOMBRES = [
+    'Ana', 'Luis', 'María', 'José', 'Carmen', 'Juan', 'Lucía', 'Pedro', 'Sofía', 'Miguel',
+    'Elena', 'Jorge', 'Paula', 'Diego', 'Laura', 'Andrés', 'Marta', 'Pablo', 'Valeria', 'Raúl',
+]
+APELLIDOS = [
+    'García', 'López', 'Martínez', 'Hernández', 'González', 'Pérez', 'Rodríguez', 'Sánchez',
+    'Ramírez', 'Torres', 'Flores', 'Rivera', 'Gómez', 'Díaz', 'Morales', 'Ruiz', 'Ortiz', 'Castro',
+]
+EMPRESAS = ['Grupo', 'Industrias', 'Servicios', 'Comercial', 'Tecnologías', 'Distribuidora', 'Consultores']
+REGIONES = ['del Norte', 'del Sur', 'del Pacífico', 'del Golfo', 'Central', 'del Bajío', 'Peninsular']
+ETIQUETAS = [
+    'cliente', 'prospecto', 'vip', 'proveedor', 'socio', 'inactivo', 'referido', 'evento',
+    'web', 'llamada-fria', 'gobierno', 'educacion', 'salud', 'retail', 'manufactura',
+]
+
+# (valor, peso) de cuántos elementos recibe cada contacto
+ETIQUETAS_POR_CONTACTO = [(0, 30), (1, 40), (2, 20), (3, 10)]
+OPORTUNIDADES_POR_CONTACTO = [(0, 40), (1, 35), (2, 15), (3, 10)]
+ACTIVIDADES_POR_CONTACTO = [(0, 20), (1, 25), (2, 20), (3, 15), (4, 10), (6, 10)]
+ESTADOS = [('nuevo', 40), ('en_progreso', 30), ('ganado', 18), ('perdido', 12)]
+# Fracción de las oportunidades cerradas que pasaron antes por en_progreso
+CERRADAS_EN_PROGRESO = 0.7
+
+
+class GeneradorCrm:
+
+    def __init__(self, semilla=1, tamano_lote=TAMANO_LOTE, referencia=None):
+        self.azar = random.Random(semilla)
+        self.tamano_lote = tamano_lote
+        self.ahora = referencia or timezone.now()
+
+    def _cantidad(self, pesos):
+        valores, pesos = zip(*pesos)
+        return self.azar.choices(valores, pesos)[0]
+
+    def generar(self, contactos, al_terminar_lote=None):
+        """Agrega ``contactos`` contactos con sus relaciones; devuelve un dict con lo creado."""
+        inicio = time.perf_counter()
+        creados = {'empresas': 0, 'contactos': 0, 'oportunidades': 0, 'actividades': 0}
+        etiquetas = [Etiqueta.objects.get_or_create(nombre=nombre)[0].pk for nombre in ETIQUETAS]
+        empresas = self._empresas(max(contactos // CONTACTOS_POR_EMPRESA, 1))
+        creados['empresas'] = len(empresas)
+        desplazamiento = Contacto.objects.count()
+
+        for desde in range(0, contactos, self.tamano_lote):
+            hasta = min(desde + self.tamano_lote, contactos)
+            lote = self._lote(range(desplazamiento + desde, desplazamiento + hasta), empresas, etiquetas)
+            for clave, cantidad in lote.items():
+                creados[clave] += cantidad
+            if al_terminar_lote:
+                al_terminar_lote(hasta, contactos)
+
+        reconstruir_estadisticas()
+        reconstruir_indice()
+        creados['duracion'] = time.perf_counter() - inicio
+        return creados
+
+    def _empresas(self, cantidad):
+        nuevas = [
+            Empresa(
+                nombre=f'{self.azar.choice(EMPRESAS)} {self.azar.choice(REGIONES)} {i}',
+                telefono=f'55{self.azar.randrange(10**8):08d}' if self.azar.random() < 0.7 else None,
+            )
+            for i in range(cantidad)
+        ]
+        return [empresa.pk for empresa in Empresa.objects.bulk_create(nuevas, batch_size=self.tamano_lote)]
+
+    @transaction.atomic
+    def _lote(self, numeros, empresas, etiquetas):
+        azar = self.azar
+        contactos = []
+        for i in numeros:
+            nombre, apellido = azar.choice(NOMBRES), azar.choice(APELLIDOS)
+            contactos.append(Contacto(
+                nombre=f'{nombre} {apellido}',
+                correo=f'{nombre.lower()}.{apellido.lower()}{i}@example.com',
+                telefono=f'55{azar.randrange(10**8):08d}' if azar.random() < 0.6 else None,
+                empresa_id=azar.choice(empresas) if azar.random() < 0.85 else None,
+                notas='Contacto generado para pruebas de carga.' if azar.random() < 0.1 else None,
+            ))
+        contactos = Contacto.objects.bulk_create(contactos)
+
+        Relacion = Contacto.etiquetas.through
+        relaciones = []
+        oportunidades = []
+        for contacto in contactos:
+            for etiqueta_id in azar.sample(etiquetas, self._cantidad(ETIQUETAS_POR_CONTACTO)):
+                relaciones.append(Relacion(contacto_id=contacto.pk, etiqueta_id=etiqueta_id))
+            for n in range(self._cantidad(OPORTUNIDADES_POR_CONTACTO)):
+                estado = self._cantidad(ESTADOS)
+                oportunidades.append(Oportunidad(
+                    contacto_id=contacto.pk,
+                    titulo=f'Oportunidad {n + 1} - {contacto.nombre}',
+                    valor=Decimal(azar.randint(500, 250000)),
+                    estado=estado,
+                    fecha_estimada_cierre=(self.ahora + timedelta(days=azar.randint(-180, 180))).date(),
+                ))
+        Relacion.objects.bulk_create(relaciones)
+        oportunidades = Oportunidad.objects.bulk_create(oportunidades)
+
+        por_contacto = {}
+        for oportunidad in oportunidades:
+            por_contacto.setdefault(oportunidad.contacto_id, []).append(oportunidad.pk)
+        actividades = []
+        for contacto in contactos:
+            propias = por_contacto.get(contacto.pk, [])
+            for n in range(self._cantidad(ACTIVIDADES_POR_CONTACTO)):
+                fecha = self.ahora - timedelta(minutes=azar.randint(-30 * 24 * 60, 365 * 24 * 60))
+                tipo = azar.choice(Actividad.TIPO_CHOICES)[0]
+                actividades.append(Actividad(
+                    tipo=tipo,
+                    titulo=f'{tipo.capitalize()} con {contacto.nombre}',
+                    fecha=fecha,
+                    contacto_id=contacto.pk,
+                    oportunidad_id=azar.choice(propias) if propias and azar.random() < 0.5 else None,
+                    completada=fecha < self.ahora and azar.random() < 0.7,
+                ))
+        Actividad.objects.bulk_create(actividades)
+        CambioEstado.objects.bulk_create(
+            [cambio for oportunidad in oportunidades for cambio in self._historia(oportunidad)],
+            batch_size=self.tamano_lote,
+        )
+        recalcular([contacto.pk for contacto in contactos])
+        invalidar('contacto', 'oportunidad', 'actividad')
+        return {'contactos': len(contactos), 'oportunidades': len(oportunidades), 'actividades': len(actividades)}
+
+    def _historia(self, oportunidad):
+        """Cambios de estado de ``oportunidad`` desde su alta, con fechas en el último año."""
+        azar = self.azar
+        estados = ['nuevo']
+        if oportunidad.estado == 'en_progreso' or (
+            oportunidad.estado in ('ganado', 'perdido') and azar.random() < CERRADAS_EN_PROGRESO
+        ):
+            estados.append('en_progreso')
+        if oportunidad.estado != estados[-1]:
+            estados.append(oportunidad.estado)
+        fecha = self.ahora - timedelta(minutes=azar.randint(30 * 24 * 60, 365 * 24 * 60))
+        cambios = []
+        for anterior, estado in zip([''] + estados, estados):
+            cambios.append(CambioEstado(
+                oportunidad_id=oportunidad.pk, numero_oportunidad=oportunidad.pk, estado_anterior=anterior,
+                estado=estado, valor=oportunidad.valor, fecha=fecha,
+            ))
+            fecha += (self.ahora - fecha) * azar.uniform(0.1, 0.6)
+        return cambios
+
+
+def vaciar_crm():
+    """Borra todos los datos del CRM sin pasar por las señales (un DELETE por tabla)."""
+    modelos = [Actividad, ActividadArchivada, CambioEstado, Oportunidad, Contacto.etiquetas.through, Contacto, Empresa, Etiqueta]
+    with transaction.atomic(), connection.cursor() as cursor:
+        for modelo in modelos:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(modelo._meta.db_table)}')
+    reconstruir_estadisticas()
+    reconstruir_indice()
+    invalidar(*{modelo for modelos in DEPENDENCIAS.values() for modelo in modelos})
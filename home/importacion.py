@@ -0,0 +1,162 @@
+"""
+Importación masiva de contactos desde CSV o JSONL.
+
+El archivo se lee fila por fila y se inserta en lotes con bulk_create, así
+que la memoria depende del tamaño del lote y no del archivo. Las empresas y
+etiquetas se resuelven por nombre con un mapa en memoria y se crean las que
+falten. Como bulk_create no emite señales, al final de cada lote se
+actualizan los acumulados del dashboard y el índice de búsqueda.
+"""
+import csv
+import io
+import json
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from .listas import invalidar
+from .models import Contacto, Empresa, Etiqueta
+from .search import indexar_contactos
+from .stats import CLAVE_CONTACTOS, aplicar_delta
+
+TAMANO_LOTE = 1000
+MAXIMO_ERRORES_GUARDADOS = 1000
+SEPARADOR_ETIQUETAS = ';'
+
+
+def leer_filas(archivo, formato):
+    """Genera (número de línea, dict) desde un archivo binario o de texto."""
+    if isinstance(archivo.read(0), bytes):
+        archivo = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    if formato == 'csv':
+        lector = csv.DictReader(archivo)
+        for fila in lector:
+            yield lector.line_num, fila
+    elif formato == 'jsonl':
+        for numero, linea in enumerate(archivo, start=1):
+            if not linea.strip():
+                continue
+            try:
+                fila = json.loads(linea)
+            except ValueError as e:
+                yield numero, ValueError(f'JSON no válido: {e}')
+                continue
+            yield numero, fila if isinstance(fila, dict) else ValueError('Se esperaba un objeto JSON')
+    else:
+        raise ValueError(f'Formato no soportado: {formato}')
+
+
+def _texto(fila, campo):
+    # Una fila JSONL puede traer números, listas u objetos en lugar de texto
+    valor = fila.get(campo)
+    if valor is None:
+        return ''
+    if not isinstance(valor, str):
+        raise ValueError(f'{campo}: se esperaba texto')
+    return valor
+
+
+class ResultadoImportacion:
+
+    def __init__(self):
+        self.filas = 0
+        self.creados = 0
+        self.total_errores = 0
+        self.errores = []
+        self.inicio = time.perf_counter()
+        self.duracion = 0.0
+
+    def agregar_error(self, linea, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < MAXIMO_ERRORES_GUARDADOS:
+            self.errores.append((linea, mensaje))
+
+    @property
+    def filas_por_segundo(self):
+        return self.filas / self.duracion if self.duracion else 0.0
+
+
+class ImportadorContactos:
+
+    def __init__(self, tamano_lote=TAMANO_LOTE):
+        self.tamano_lote = tamano_lote
+        self.empresas = {}
+        self.etiquetas = {}
+
+    def importar(self, filas, al_terminar_lote=None):
+        self.empresas = {nombre.lower(): pk for pk, nombre in Empresa.objects.values_list('id', 'nombre')}
+        self.etiquetas = {nombre.lower(): pk for pk, nombre in Etiqueta.objects.values_list('id', 'nombre')}
+        resultado = ResultadoImportacion()
+        lote = []
+        for linea, fila in filas:
+            resultado.filas += 1
+            try:
+                lote.append(self._contacto(fila))
+            except (ValueError, ValidationError) as e:
+                mensaje = '; '.join(e.messages) if isinstance(e, ValidationError) else str(e)
+                resultado.agregar_error(linea, mensaje)
+                continue
+            if len(lote) >= self.tamano_lote:
+                resultado.creados += self._guardar(lote)
+                lote = []
+                if al_terminar_lote:
+                    al_terminar_lote(resultado)
+        if lote:
+            resultado.creados += self._guardar(lote)
+        resultado.duracion = time.perf_counter() - resultado.inicio
+        return resultado
+
+    def _contacto(self, fila):
+        if isinstance(fila, Exception):
+            raise fila
+        nombre = _texto(fila, 'nombre').strip()
+        correo = _texto(fila, 'correo').strip()
+        if not nombre:
+            raise ValueError('Falta el nombre')
+        validate_email(correo)
+        contacto = Contacto(
+            nombre=nombre[:200],
+            correo=correo,
+            telefono=_texto(fila, 'telefono').strip()[:20] or None,
+            notas=_texto(fila, 'notas') or None,
+        )
+        empresa = _texto(fila, 'empresa').strip()
+        contacto.empresa_id = self._empresa(empresa) if empresa else None
+
+        etiquetas = fila.get('etiquetas') or []
+        if isinstance(etiquetas, str):
+            etiquetas = etiquetas.split(SEPARADOR_ETIQUETAS)
+        if not isinstance(etiquetas, list) or not all(isinstance(e, str) for e in etiquetas):
+            raise ValueError('etiquetas: se esperaba texto o una lista de textos')
+        contacto._etiquetas_ids = {self._etiqueta(e.strip()) for e in etiquetas if e.strip()}
+        return contacto
+
+    def _empresa(self, nombre):
+        clave = nombre.lower()
+        if clave not in self.empresas:
+            self.empresas[clave] = Empresa.objects.create(nombre=nombre[:200]).pk
+        return self.empresas[clave]
+
+    def _etiqueta(self, nombre):
+        clave = nombre.lower()
+        if clave not in self.etiquetas:
+            etiqueta, _ = Etiqueta.objects.get_or_create(nombre=nombre[:50])
+            self.etiquetas[clave] = etiqueta.pk
+        return self.etiquetas[clave]
+
+    @transaction.atomic
+    def _guardar(self, lote):
+        creados = Contacto.objects.bulk_create(lote)
+        Relacion = Contacto.etiquetas.through
+        Relacion.objects.bulk_create([
+            Relacion(contacto_id=contacto.pk, etiqueta_id=etiqueta_id)
+            for contacto in creados
+            for etiqueta_id in contacto._etiquetas_ids
+        ])
+        # bulk_create no emite post_save
+        aplicar_delta(CLAVE_CONTACTOS, cantidad=len(creados))
+        indexar_contactos(Contacto.objects.filter(id__in=[contacto.pk for contacto in creados]))
+        invalidar('contacto')
+        return len(creados)
@@ -0,0 +1,290 @@
+"""
+Medición por vista: consultas, tiempo de SQL, consultas repetidas (N+1),
+tiempo de plantillas y tamaño de la respuesta.
+
+InstrumentacionMiddleware mide una fracción de los pedidos
+(CRM_INSTRUMENTACION_MUESTREO) y arma una MuestraVista por pedido medido;
+los demás pasan sin costo. Las consultas se cuentan con medir_consulta,
+que home/signals.py instala en cada conexión y que solo mide cuando hay una
+medición activa en el contexto del pedido (también en los hilos de
+sync_to_async), y las plantillas con el backend DjangoTemplatesMedidos. El
+tiempo de plantillas incluye las consultas perezosas que se ejecutan al
+renderizar. Los backends de home/fragmentos.py suman aquí sus aciertos y
+fallos con contar_fragmento.
+
+Las muestras se acumulan en memoria y guardar_pendientes() las escribe con
+un solo INSERT después de responder (request_finished, en home/signals.py),
+cuando hay CRM_INSTRUMENTACION_LOTE o la más vieja esperó
+CRM_INSTRUMENTACION_ESPERA segundos: el pedido medido no espera el candado
+de escritura de SQLite. Las pendientes de un proceso que termina se pierden.
+Al escribir se borran, a lo sumo una vez por hora, las muestras con más de
+CRM_INSTRUMENTACION_DIAS días.
+
+El reporte agrupa las muestras por nombre de URL y ordena por p95; lo usan
+el comando slow_views y la página de reporte del admin.
+"""
+import collections
+import contextvars
+import itertools
+import logging
+import math
+import random
+import re
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError
+from django.template.backends.django import DjangoTemplates
+from django.utils import timezone
+
+from .models import MuestraVista
+
+logger = logging.getLogger(__name__)
+
+_medicion = contextvars.ContextVar('medicion', default=None)
+
+_LISTA_PARAMETROS = re.compile(r'\((?:%s|\?)(?:\s*,\s*(?:%s|\?))*\)')
+_NUMERO = re.compile(r'\b\d+\b')
+
+# Muestras todavía sin escribir, de todos los hilos del proceso
+_pendientes = []
+_candado_pendientes = threading.Lock()
+_ultima_purga = None
+
+
+def huella(sql):
+    """SQL normalizado: las listas IN (%s, %s, ...) y los números literales se colapsan."""
+    return _NUMERO.sub('?', _LISTA_PARAMETROS.sub('(...)', sql))
+
+
+class Medicion:
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_sql = 0.0
+        self.tiempo_plantillas = 0.0
+        self.fragmentos_aciertos = 0
+        self.fragmentos_fallos = 0
+        self.huellas = collections.Counter()
+        # Las vistas asíncronas consultan desde varios hilos a la vez
+        self._candado = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            with self._candado:
+                self.tiempo_sql += duracion
+                self.consultas += 1
+                self.huellas[huella(sql)] += 1
+
+    def repetidas(self):
+        """Consultas de más por huellas repetidas y la huella que más se repite."""
+        repetidas = sum(cantidad - 1 for cantidad in self.huellas.values() if cantidad > 1)
+        if not repetidas:
+            return 0, ''
+        sql, cantidad = self.huellas.most_common(1)[0]
+        return repetidas, f'{cantidad}x {sql}'
+
+
+class PlantillaMedida:
+    """Envuelve una plantilla del backend y suma su tiempo a la medición activa."""
+
+    def __init__(self, plantilla):
+        self.plantilla = plantilla
+
+    def __getattr__(self, nombre):
+        return getattr(self.plantilla, nombre)
+
+    def render(self, context=None, request=None):
+        medicion = _medicion.get()
+        if medicion is None:
+            return self.plantilla.render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return self.plantilla.render(context, request)
+        finally:
+            medicion.tiempo_plantillas += time.perf_counter() - inicio
+
+
+class DjangoTemplatesMedidos(DjangoTemplates):
+
+    def from_string(self, template_code):
+        return PlantillaMedida(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return PlantillaMedida(super().get_template(template_name))
+
+
+def medir_consulta(execute, sql, params, many, context):
+    """execute_wrapper permanente de cada conexión: mide si el pedido actual tiene una medición."""
+    medicion = _medicion.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    return medicion(execute, sql, params, many, context)
+
+
+def contar_fragmento(acierto):
+    """Anota un acierto o fallo de la caché de fragmentos en la medición activa, si la hay."""
+    medicion = _medicion.get()
+    if medicion is None:
+        return
+    if acierto:
+        medicion.fragmentos_aciertos += 1
+    else:
+        medicion.fragmentos_fallos += 1
+
+
+class InstrumentacionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _muestrear(self):
+        muestreo = getattr(settings, 'CRM_INSTRUMENTACION_MUESTREO', 0)
+        return muestreo > 0 and random.random() < muestreo
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._muestrear():
+            return self.get_response(request)
+
+        medicion = Medicion()
+        token = _medicion.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            duracion = time.perf_counter() - inicio
+            _medicion.reset(token)
+        self._guardar(request, response, medicion, duracion)
+        return response
+
+    async def __acall__(self, request):
+        if not self._muestrear():
+            return await self.get_response(request)
+
+        medicion = Medicion()
+        token = _medicion.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            duracion = time.perf_counter() - inicio
+            _medicion.reset(token)
+        self._guardar(request, response, medicion, duracion)
+        return response
+
+    def _guardar(self, request, response, medicion, duracion):
+        coincidencia = request.resolver_match
+        if coincidencia is None:
+            return
+        repetidas, peor = medicion.repetidas()
+        muestra = MuestraVista(
+            vista=coincidencia.view_name,
+            metodo=request.method,
+            estado=response.status_code,
+            duracion_ms=duracion * 1000,
+            consultas=medicion.consultas,
+            tiempo_sql_ms=medicion.tiempo_sql * 1000,
+            consultas_repetidas=repetidas,
+            huella_repetida=peor,
+            tiempo_plantillas_ms=medicion.tiempo_plantillas * 1000,
+            fragmentos_aciertos=medicion.fragmentos_aciertos,
+            fragmentos_fallos=medicion.fragmentos_fallos,
+            tamano_respuesta=None if response.streaming else len(response.content),
+        )
+        with _candado_pendientes:
+            _pendientes.append(muestra)
+
+
+def guardar_pendientes():
+    """Escribe las muestras acumuladas si el lote está lleno o la más vieja esperó demasiado; devuelve cuántas."""
+    lote = getattr(settings, 'CRM_INSTRUMENTACION_LOTE', 50)
+    espera = timedelta(seconds=getattr(settings, 'CRM_INSTRUMENTACION_ESPERA', 60))
+    with _candado_pendientes:
+        if not _pendientes:
+            return 0
+        if len(_pendientes) < lote and timezone.now() - _pendientes[0].fecha < espera:
+            return 0
+        muestras = _pendientes[:]
+        _pendientes.clear()
+    try:
+        MuestraVista.objects.bulk_create(muestras)
+        _purgar()
+    except DatabaseError:
+        logger.exception('No se pudieron guardar %d muestras', len(muestras))
+        return 0
+    return len(muestras)
+
+
+def _purgar():
+    global _ultima_purga
+    dias = getattr(settings, 'CRM_INSTRUMENTACION_DIAS', 7)
+    if not dias or (_ultima_purga is not None and time.monotonic() - _ultima_purga < 3600):
+        return
+    _ultima_purga = time.monotonic()
+    MuestraVista.objects.filter(fecha__lt=timezone.now() - timedelta(days=dias)).delete()
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano de una lista ordenada."""
+    if not valores:
+        return 0
+    return valores[max(math.ceil(p / 100 * len(valores)) - 1, 0)]
+
+
+REPORTE_HORAS_MAXIMO = 24 * 90
+
+
+def horas_reporte(valor):
+    """Ventana del reporte en horas enteras entre 1 y 90 días; ValueError si no es un entero."""
+    # int() rechaza inf, nan y 1e20, que desbordan timedelta
+    return min(max(int(valor), 1), REPORTE_HORAS_MAXIMO)
+
+
+def reporte_vistas(desde=None, limite=20):
+    """Una fila por vista con las muestras desde ``desde``, ordenadas por p95 de duración."""
+    muestras = MuestraVista.objects.order_by('vista')
+    if desde is not None:
+        muestras = muestras.filter(fecha__gte=desde)
+    muestras = muestras.values_list(
+        'vista', 'duracion_ms', 'consultas', 'tiempo_sql_ms', 'consultas_repetidas',
+        'huella_repetida', 'tiempo_plantillas_ms', 'tamano_respuesta',
+        'fragmentos_aciertos', 'fragmentos_fallos',
+    )
+    filas = []
+    for vista, grupo in itertools.groupby(muestras.iterator(), key=lambda muestra: muestra[0]):
+        grupo = list(grupo)
+        n = len(grupo)
+        duraciones = sorted(muestra[1] for muestra in grupo)
+        consultas = sorted(muestra[2] for muestra in grupo)
+        huellas = collections.Counter(muestra[5] for muestra in grupo if muestra[5])
+        tamanos = [muestra[7] for muestra in grupo if muestra[7] is not None]
+        aciertos = sum(muestra[8] for muestra in grupo)
+        fragmentos = aciertos + sum(muestra[9] for muestra in grupo)
+        filas.append({
+            'vista': vista,
+            'muestras': n,
+            'p50_ms': percentil(duraciones, 50),
+            'p95_ms': percentil(duraciones, 95),
+            'consultas_p95': percentil(consultas, 95),
+            'sql_ms': sum(muestra[3] for muestra in grupo) / n,
+            'repetidas_max': max(muestra[4] for muestra in grupo),
+            'huella_repetida': huellas.most_common(1)[0][0] if huellas else '',
+            'plantillas_ms': sum(muestra[6] for muestra in grupo) / n,
+            'tamano': sum(tamanos) / len(tamanos) if tamanos else None,
+            'fragmentos_aciertos': aciertos / fragmentos if fragmentos else None,
+        })
+    filas.sort(key=lambda fila: fila['p95_ms'], reverse=True)
+    return filas[:limite]
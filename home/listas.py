@@ -0,0 +1,104 @@
+"""
+Caché de resultados de las listas del CRM.
+
+Las listas de contactos, oportunidades y actividades se piden una y otra vez
+con los mismos filtros. Para cada combinación normalizada de filtros y
+cursor se guarda en el alias 'listas' la página ya resuelta: los ids de sus
+filas, los cursores vecinos y el total. Un acierto cuesta una consulta por
+pk__in (más los prefetch de la vista) en lugar del filtro, el orden y el
+COUNT(*).
+
+La clave lleva la generación de cada modelo del que depende la lista. Las
+generaciones son marcas de tiempo en la misma caché que las señales de
+home/signals.py y las operaciones por lote reemplazan con invalidar(); las
+entradas con una generación vieja no se vuelven a leer y salen por LRU
+(MAX_ENTRIES) o al vencer CRM_LISTAS_TTL. Las listas no dependen del
+usuario, así que la caché se comparte entre sesiones.
+"""
+import hashlib
+import time
+
+from django.core.cache import caches
+
+from .pagination import PaginaCursor
+
+ALIAS = 'listas'
+
+# Lista -> modelos cuyos cambios pueden alterar qué filas aparecen o su orden
+DEPENDENCIAS = {
+    'contactos_list': ('contacto', 'empresa', 'etiqueta'),
+    'oportunidades_list': ('oportunidad',),
+    'actividades_list': ('actividad',),
+}
+
+# Lista -> parámetros de request.GET que determinan la página
+PARAMETROS = {
+    'contactos_list': ('q', 'empresa', 'etiqueta', 'grupo', 'orden', 'cursor'),
+    'oportunidades_list': ('estado', 'contacto', 'cursor'),
+    'actividades_list': ('tipo', 'contacto', 'oportunidad', 'fecha_desde', 'fecha_hasta', 'completadas', 'cursor'),
+}
+
+
+def _clave_generacion(modelo):
+    return f'generacion:{modelo}'
+
+
+def generaciones(modelos):
+    cache = caches[ALIAS]
+    claves = [_clave_generacion(modelo) for modelo in modelos]
+    guardadas = cache.get_many(claves)
+    faltantes = [clave for clave in claves if clave not in guardadas]
+    if faltantes:
+        # Como en home/fragmentos.py: una generación expulsada no repite valores viejos
+        for clave in faltantes:
+            cache.add(clave, time.time_ns(), timeout=None)
+        guardadas.update(cache.get_many(faltantes))
+    return tuple(guardadas.get(clave) for clave in claves)
+
+
+def invalidar(*modelos):
+    """Cambia la generación de ``modelos``: las páginas que dependen de ellos se recalculan."""
+    cache = caches[ALIAS]
+    # Como en home/fragmentos.py: set() y no incr(), que no es atómico en FileBasedCache
+    cache.set_many({_clave_generacion(modelo): time.time_ns() for modelo in modelos}, timeout=None)
+
+
+def filtros(lista, params):
+    """Tupla normalizada de los filtros de ``lista``: sin vacíos ni parámetros ajenos."""
+    valores = ((nombre, params.get(nombre, '').strip()) for nombre in PARAMETROS[lista])
+    return tuple((nombre, valor) for nombre, valor in valores if valor)
+
+
+def _clave(lista, params):
+    texto = repr((filtros(lista, params), generaciones(DEPENDENCIAS[lista])))
+    return f'{lista}:' + hashlib.sha1(texto.encode()).hexdigest()
+
+
+def pagina(lista, params, paginator, querysets):
+    """
+    La página del ``paginator`` para ``params``, desde la caché si está. En
+    un acierto las filas se leen por pk de ``querysets`` (el de la vista sin
+    filtros; varios si el paginador une tablas) y se devuelven en el orden
+    guardado.
+    """
+    cache = caches[ALIAS]
+    clave = _clave(lista, params)
+    guardada = cache.get(clave)
+    if guardada is not None:
+        filas, siguiente, anterior, total = guardada
+        return PaginaCursor(_leer(querysets, filas), siguiente, anterior, total)
+    resultado = paginator.get_page(params.get('cursor'))
+    modelos = [queryset.model for queryset in querysets]
+    filas = [(modelos.index(type(objeto)), objeto.pk) for objeto in resultado]
+    # El timeout por omisión del alias es CRM_LISTAS_TTL
+    cache.set(clave, (filas, resultado.next_cursor, resultado.previous_cursor, resultado.total))
+    return resultado
+
+
+def _leer(querysets, filas):
+    objetos = {}
+    for indice, queryset in enumerate(querysets):
+        ids = [pk for fila_indice, pk in filas if fila_indice == indice]
+        if ids:
+            objetos.update(((indice, objeto.pk), objeto) for objeto in queryset.filter(pk__in=ids))
+    return [objetos[fila] for fila in filas if fila in objetos]
@@ -0,0 +1,151 @@
+"""
+Operaciones por lote sobre oportunidades y actividades.
+
+Cada operación es una transacción con un solo UPDATE (o DELETE) por tabla
+sobre la lista de ids, en lugar de un get + save() por fila. Como update() y
+los borrados sin señales no pasan por home/signals.py, aquí mismo se ponen al
+día fecha_actualizacion (ETag de la API, caché de fragmentos), los
+acumulados de CrmStats, los contadores de cada contacto, la historia de
+estados de home/analitica.py y las generaciones de home/listas.py.
+
+Los borrados van sin Collector (borrar_sin_senales): las relaciones de cada
+modelo se resuelven a mano y están listadas en RELACIONES_RESUELTAS.
+"""
+from decimal import Decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+from . import analitica, contadores, listas
+from .models import Actividad, ActividadArchivada, CambioEstado, Oportunidad
+from .stats import aplicar_delta, clave_oportunidades
+
+LOTE_MAXIMO = 1000
+
+# Relaciones que resuelven a mano quienes borran con borrar_sin_senales
+RELACIONES_RESUELTAS = {
+    Oportunidad: {'actividades', 'actividades_archivadas', 'cambios_estado'},
+    Actividad: set(),
+    ActividadArchivada: set(),
+}
+
+
+def relaciones_sin_resolver(modelo):
+    """Nombres de las relaciones de ``modelo`` que un borrado sin Collector dejaría colgadas."""
+    relaciones = [relacion.name for relacion in modelo._meta.related_objects]
+    relaciones += [campo.name for campo in modelo._meta.many_to_many]
+    return sorted(set(relaciones) - RELACIONES_RESUELTAS.get(modelo, set()))
+
+
+def borrar_sin_senales(queryset):
+    """
+    Un solo DELETE del queryset, sin Collector ni post_delete (que ajustaría
+    CrmStats y los contadores fila por fila). Quien llama resuelve antes las
+    relaciones de RELACIONES_RESUELTAS; si el modelo tiene otras, se niega.
+    """
+    pendientes = relaciones_sin_resolver(queryset.model)
+    if pendientes:
+        raise ImproperlyConfigured(
+            f'{queryset.model.__name__}: relaciones sin resolver al borrar por lote: {", ".join(pendientes)}'
+        )
+    return queryset._raw_delete(queryset.db)
+
+
+def _por_estado(filas):
+    """{estado: (cantidad, valor)} de filas (id, estado, valor, contacto_id)."""
+    totales = {}
+    for _, estado, valor, _ in filas:
+        cantidad, suma = totales.get(estado, (0, Decimal('0')))
+        totales[estado] = (cantidad + 1, suma + valor)
+    return totales
+
+
+@transaction.atomic
+def cambiar_estado_oportunidades(ids, estado):
+    """Mueve las oportunidades a ``estado``; devuelve cuántas cambiaron."""
+    filas = list(
+        Oportunidad.objects.select_for_update().filter(id__in=ids).exclude(estado=estado)
+        .values_list('id', 'estado', 'valor', 'contacto_id')
+    )
+    if not filas:
+        return 0
+    ahora = timezone.now()
+    Oportunidad.objects.filter(id__in=[fila[0] for fila in filas]).update(estado=estado, fecha_actualizacion=ahora)
+    CambioEstado.objects.bulk_create([
+        CambioEstado(
+            oportunidad_id=pk, numero_oportunidad=pk, estado_anterior=anterior, estado=estado, valor=valor, fecha=ahora,
+        )
+        for pk, anterior, valor, _ in filas
+    ])
+    analitica.invalidar()
+    listas.invalidar('oportunidad')
+    deltas = {}
+    for _, anterior, valor, contacto_id in filas:
+        contadores.sumar_oportunidad(deltas, (contacto_id, anterior, valor), -1)
+        contadores.sumar_oportunidad(deltas, (contacto_id, estado, valor), 1)
+    contadores.ajustar(deltas)
+    for anterior, (cantidad, valor) in _por_estado(filas).items():
+        aplicar_delta(clave_oportunidades(anterior), cantidad=-cantidad, valor=-valor)
+    aplicar_delta(clave_oportunidades(estado), cantidad=len(filas), valor=sum(fila[2] for fila in filas))
+    return len(filas)
+
+
+@transaction.atomic
+def eliminar_oportunidades(ids):
+    """Borra las oportunidades y sus actividades; devuelve cuántas oportunidades se borraron."""
+    filas = list(
+        Oportunidad.objects.select_for_update().filter(id__in=ids)
+        .values_list('id', 'estado', 'valor', 'contacto_id')
+    )
+    if not filas:
+        return 0
+    ids = [fila[0] for fila in filas]
+    deltas = {}
+    for _, estado, valor, contacto_id in filas:
+        contadores.sumar_oportunidad(deltas, (contacto_id, estado, valor), -1)
+    # CASCADE a mano, un DELETE por tabla sin las señales de cada actividad
+    contactos = _borrar_actividades(deltas, Actividad.objects.filter(oportunidad_id__in=ids))
+    contactos |= _borrar_actividades(deltas, ActividadArchivada.objects.filter(oportunidad_id__in=ids))
+    # La historia de estados se queda para la analítica (SET_NULL a mano)
+    CambioEstado.objects.filter(oportunidad_id__in=ids).update(oportunidad=None)
+    borrar_sin_senales(Oportunidad.objects.filter(id__in=ids))
+    for estado, (cantidad, valor) in _por_estado(filas).items():
+        aplicar_delta(clave_oportunidades(estado), cantidad=-cantidad, valor=-valor)
+    contadores.ajustar(deltas, ultima=contactos)
+    analitica.invalidar()
+    listas.invalidar('oportunidad')
+    return len(filas)
+
+
+@transaction.atomic
+def marcar_actividades(ids, completada):
+    """Marca las actividades como completadas o pendientes; devuelve cuántas cambiaron."""
+    cambiadas = Actividad.objects.filter(id__in=ids).exclude(completada=completada).update(
+        completada=completada, fecha_actualizacion=timezone.now(),
+    )
+    if cambiadas:
+        listas.invalidar('actividad')
+    return cambiadas
+
+
+@transaction.atomic
+def eliminar_actividades(ids):
+    """Borra las actividades; devuelve cuántas se borraron."""
+    deltas = {}
+    contactos = _borrar_actividades(deltas, Actividad.objects.filter(id__in=ids))
+    contadores.ajustar(deltas, ultima=contactos)
+    return sum(-delta[2] for delta in deltas.values())
+
+
+def _borrar_actividades(deltas, actividades):
+    """Borra las actividades sin señales y suma a ``deltas`` las de cada contacto; devuelve esos contactos."""
+    por_contacto = {}
+    for contacto_id in actividades.values_list('contacto_id', flat=True):
+        por_contacto[contacto_id] = por_contacto.get(contacto_id, 0) + 1
+    if por_contacto:
+        borrar_sin_senales(actividades)
+        listas.invalidar('actividad')
+    for contacto_id, cantidad in por_contacto.items():
+        contadores.sumar_actividades(deltas, contacto_id, -cantidad)
+    return set(por_contacto)
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from home.archivo import LOTE, archivar_lote, horizonte
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve a ActividadArchivada las actividades completadas anteriores al horizonte '
+        '(CRM_ARCHIVO_DIAS), por lotes de una transacción cada uno. Se puede interrumpir y '
+        'volver a ejecutar: cada corrida sigue desde las filas que quedan.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, help='Antigüedad mínima en días (por omisión CRM_ARCHIVO_DIAS).')
+        parser.add_argument('--lote', type=int, default=LOTE, help='Actividades por transacción.')
+        parser.add_argument('--max-lotes', type=int, help='Detenerse después de esta cantidad de lotes.')
+        parser.add_argument(
+            '--pausa', type=float, default=0,
+            help='Segundos entre lotes, para dejar pasar a otros escritores.',
+        )
+
+    def handle(self, *args, **options):
+        corte = horizonte(options['dias'])
+        total = lotes = 0
+        while options['max_lotes'] is None or lotes < options['max_lotes']:
+            archivadas = archivar_lote(corte, options['lote'])
+            if not archivadas:
+                break
+            total += archivadas
+            lotes += 1
+            self.stdout.write(f'lote {lotes}: {archivadas} actividades')
+            if archivadas < options['lote']:
+                break
+            time.sleep(options['pausa'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} actividades archivadas en {lotes} lotes (anteriores a {corte:%Y-%m-%d %H:%M}).'
+        ))
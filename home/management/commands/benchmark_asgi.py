@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from home.instrumentacion import percentil
+from home.models import Contacto
+
+RUTAS = ['crm_dashboard', 'contacto_detail']
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara la latencia de crm_dashboard y contacto_detail servidas por WSGI (vistas síncronas, '
+        'un hilo por cliente) y por ASGI (vistas asíncronas con consultas concurrentes) bajo carga concurrente. '
+        'El cliente de pruebas no cierra conexiones entre pedidos; para comparar en igualdad ejecute con '
+        'CRM_DB_CONN_MAX_AGE mayor que 0, así las vistas asíncronas también reutilizan las suyas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrencia', type=int, default=8, help='Clientes simultáneos.')
+        parser.add_argument('--pedidos', type=int, default=400, help='Pedidos por ruta y servidor.')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] in ('', ':memory:'):
+            raise CommandError('Se necesita una base en archivo para medir concurrencia.')
+        contacto = Contacto.objects.order_by('pk').values_list('pk', flat=True).first()
+        if contacto is None:
+            raise CommandError('No hay datos; ejecute generate_crm_data.')
+        urls = {
+            'crm_dashboard': reverse('crm_dashboard'),
+            'contacto_detail': reverse('contacto_detail', args=[contacto]),
+        }
+
+        self.stdout.write(
+            f'conexiones: CONN_MAX_AGE={connection.settings_dict["CONN_MAX_AGE"]}, '
+            f'{options["concurrencia"]} clientes, {options["pedidos"]} pedidos por ruta'
+        )
+        with override_settings(ALLOWED_HOSTS=['testserver'], CRM_INSTRUMENTACION_MUESTREO=0):
+            for nombre in RUTAS:
+                for servidor, medir in [('wsgi', self._wsgi), ('asgi', self._asgi)]:
+                    tiempos, duracion = medir(urls[nombre], options)
+                    connections.close_all()
+                    tiempos.sort()
+                    self.stdout.write(
+                        f'{nombre:<18} {servidor}: p50={percentil(tiempos, 50):>7.2f}ms '
+                        f'p95={percentil(tiempos, 95):>7.2f}ms {len(tiempos) / duracion:>7.0f} pedidos/s'
+                    )
+
+    def _repartir(self, options):
+        base, resto = divmod(options['pedidos'], options['concurrencia'])
+        return [base + (1 if i < resto else 0) for i in range(options['concurrencia'])]
+
+    def _wsgi(self, url, options):
+        tiempos = []
+        candado = threading.Lock()
+
+        def cliente(cantidad):
+            propio = Client()
+            propios = []
+            try:
+                for _ in range(cantidad):
+                    inicio = time.perf_counter()
+                    response = propio.get(url)
+                    propios.append((time.perf_counter() - inicio) * 1000)
+                    if response.status_code != 200:
+                        raise CommandError(f'{url} respondió {response.status_code}')
+            finally:
+                connections.close_all()
+            with candado:
+                tiempos.extend(propios)
+
+        hilos = [threading.Thread(target=cliente, args=(cantidad,)) for cantidad in self._repartir(options)]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return tiempos, time.perf_counter() - inicio
+
+    def _asgi(self, url, options):
+        tiempos = []
+
+        async def cliente(cantidad):
+            propio = AsyncClient()
+            for _ in range(cantidad):
+                inicio = time.perf_counter()
+                response = await propio.get(url)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f'{url} respondió {response.status_code}')
+
+        async def todos():
+            await asyncio.gather(*(cliente(cantidad) for cantidad in self._repartir(options)))
+
+        with override_settings(ROOT_URLCONF='thelightspeed.urls_asgi'):
+            inicio = time.perf_counter()
+            asyncio.run(todos())
+            return tiempos, time.perf_counter() - inicio
@@ -0,0 +1,43 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from home import views
+
+VISTAS = {
+    'contactos': views.contactos_exportar,
+    'oportunidades': views.oportunidades_exportar,
+    'actividades': views.actividades_exportar,
+}
+
+
+class Command(BaseCommand):
+    help = 'Recorre la exportación completa de una lista sobre la base actual y mide filas/s y memoria pico.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('lista', choices=sorted(VISTAS))
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--cada', type=int, default=100000, help='Informa el progreso cada N filas.')
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get('/', {'formato': options['formato']})
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        response = VISTAS[options['lista']](request)
+        filas = -1 if options['formato'] == 'csv' else 0
+        tamano = 0
+        for parte in response.streaming_content:
+            filas += 1
+            tamano += len(parte)
+            if filas and filas % options['cada'] == 0:
+                actual, pico = tracemalloc.get_traced_memory()
+                self.stdout.write(f'{filas} filas: memoria actual={actual / 2**20:.1f}MB pico={pico / 2**20:.1f}MB')
+        duracion = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f'{filas} filas, {tamano / 2**20:.1f}MB en {duracion:.1f}s '
+            f'({filas / duracion if duracion else 0:.0f} filas/s), memoria pico={pico / 2**20:.1f}MB'
+        )
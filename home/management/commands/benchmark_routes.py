@@ -0,0 +1,183 @@
+import contextlib
+import json
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from home import urls
+from home.instrumentacion import percentil
+from home.models import Actividad, Contacto, Empresa, Oportunidad
+
+# Cómo pedir cada ruta de home/urls.py. Los modelos se reemplazan por el
+# primer id de la tabla. Las rutas que escriben se piden dentro de una
+# transacción que se revierte.
+RUTAS = {
+    'index': {},
+    'productos_ordenados': {},
+    'crm_dashboard': {},
+    'autocompletar': {'kwargs': {'modelo': 'contactos'}, 'params': {'q': 'mar'}},
+    'api_lista': {'kwargs': {'recurso': 'contactos'}, 'params': {'embed': 'empresa,etiquetas'}},
+    'api_detalle': {'kwargs': {'recurso': 'oportunidades', 'pk': Oportunidad}, 'params': {'embed': 'contacto'}},
+    'contactos_list': {},
+    'contacto_create': {},
+    'contactos_importar': {},
+    'contactos_exportar': {'params': {'empresa': Empresa}},
+    'contacto_detail': {'kwargs': {'pk': Contacto}},
+    'contacto_edit': {'kwargs': {'pk': Contacto}},
+    'contacto_delete': {'kwargs': {'pk': Contacto}},
+    'oportunidades_list': {},
+    'oportunidades_pipeline': {},
+    'oportunidades_pipeline_columna': {'kwargs': {'estado': 'nuevo'}, 'params': {'offset': 20}},
+    'oportunidades_analitica': {},
+    'oportunidades_exportar': {'params': {'contacto': Contacto}},
+    'oportunidad_create': {},
+    'oportunidad_edit': {'kwargs': {'pk': Oportunidad}},
+    'oportunidad_delete': {'kwargs': {'pk': Oportunidad}},
+    'oportunidad_update_estado': {'metodo': 'post', 'kwargs': {'pk': Oportunidad}, 'datos': {'estado': 'en_progreso'}},
+    'oportunidades_lote': {'metodo': 'post', 'datos': {'accion': 'estado', 'estado': 'ganado', 'ids': Oportunidad}},
+    'actividades_list': {},
+    'actividades_exportar': {'params': {'contacto': Contacto}},
+    'actividad_create': {},
+    'actividad_edit': {'kwargs': {'pk': Actividad}},
+    'actividad_delete': {'kwargs': {'pk': Actividad}},
+    'actividad_toggle_completada': {'metodo': 'post', 'kwargs': {'pk': Actividad}},
+    'actividades_lote': {'metodo': 'post', 'datos': {'accion': 'completar', 'ids': Actividad}},
+}
+
+
+def _resolver(valores):
+    resueltos = {}
+    for clave, valor in valores.items():
+        if isinstance(valor, type) and issubclass(valor, models.Model):
+            pk = valor.objects.order_by('pk').values_list('pk', flat=True).first()
+            if pk is None:
+                raise CommandError(f'No hay filas de {valor.__name__}; ejecute generate_crm_data.')
+            valor = pk
+        resueltos[clave] = valor
+    return resueltos
+
+
+class Command(BaseCommand):
+    help = (
+        'Pide cada ruta de home/urls.py con el cliente de pruebas y mide latencia (p50/p95) y consultas. '
+        'Guarda los resultados como línea base en JSON o los compara con una y falla si alguna ruta empeora.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rutas', nargs='*', help='Solo estas rutas (por nombre).')
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--calentamiento', type=int, default=2)
+        parser.add_argument('--guardar', metavar='ARCHIVO', help='Escribe los resultados como línea base.')
+        parser.add_argument('--comparar', metavar='ARCHIVO', help='Compara con una línea base guardada.')
+        parser.add_argument(
+            '--umbral', type=float, default=0.25,
+            help='Aumento relativo del p95 que cuenta como regresión (0.25 = 25%%).',
+        )
+        parser.add_argument(
+            '--margen-ms', type=float, default=2.0,
+            help='Aumento absoluto mínimo del p95 para considerarlo regresión (ruido).',
+        )
+
+    def handle(self, *args, **options):
+        nombres = [patron.name for patron in urls.urlpatterns]
+        sin_receta = [nombre for nombre in nombres if nombre not in RUTAS]
+        if sin_receta:
+            raise CommandError(f'Rutas sin receta en RUTAS: {", ".join(sin_receta)}')
+        if options['rutas']:
+            desconocidas = set(options['rutas']) - set(nombres)
+            if desconocidas:
+                raise CommandError(f'Rutas desconocidas: {", ".join(sorted(desconocidas))}')
+            nombres = [nombre for nombre in nombres if nombre in options['rutas']]
+
+        resultados = {
+            'fecha': timezone.now().isoformat(),
+            'datos': {
+                'contactos': Contacto.objects.count(),
+                'oportunidades': Oportunidad.objects.count(),
+                'actividades': Actividad.objects.count(),
+            },
+            'rutas': {},
+        }
+        cache.clear()
+        with override_settings(ALLOWED_HOSTS=['testserver'], CRM_INSTRUMENTACION_MUESTREO=0):
+            cliente = Client()
+            for nombre in nombres:
+                resultados['rutas'][nombre] = self._medir(cliente, nombre, RUTAS[nombre], options)
+                self._mostrar(nombre, resultados['rutas'][nombre])
+
+        if options['guardar']:
+            with open(options['guardar'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f'Línea base guardada en {options["guardar"]}')
+        if options['comparar']:
+            self._comparar(resultados, options)
+
+    def _medir(self, cliente, nombre, receta, options):
+        url = reverse(nombre, kwargs=_resolver(receta.get('kwargs', {})))
+        params = _resolver(receta.get('params', {}))
+        metodo = receta.get('metodo', 'get')
+        pedir = getattr(cliente, metodo)
+        datos = _resolver(receta.get('datos', {})) if metodo == 'post' else params
+
+        tiempos = []
+        consultas = 0
+        for i in range(options['calentamiento'] + options['repeticiones']):
+            with transaction.atomic() if metodo != 'get' else contextlib.nullcontext():
+                with CaptureQueriesContext(connection) as capturadas:
+                    inicio = time.perf_counter()
+                    response = pedir(url, datos)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    duracion = (time.perf_counter() - inicio) * 1000
+                if metodo != 'get':
+                    transaction.set_rollback(True)
+            if i >= options['calentamiento']:
+                tiempos.append(duracion)
+                consultas = max(consultas, len(capturadas))
+        tiempos.sort()
+        return {
+            'metodo': metodo.upper(),
+            'url': url,
+            'estado': response.status_code,
+            'p50_ms': round(percentil(tiempos, 50), 3),
+            'p95_ms': round(percentil(tiempos, 95), 3),
+            'max_ms': round(tiempos[-1], 3),
+            'consultas': consultas,
+        }
+
+    def _mostrar(self, nombre, medida):
+        self.stdout.write(
+            f'{nombre:<32} {medida["estado"]:>3} p50={medida["p50_ms"]:>8.2f}ms '
+            f'p95={medida["p95_ms"]:>8.2f}ms consultas={medida["consultas"]}'
+        )
+
+    def _comparar(self, resultados, options):
+        with open(options['comparar'], encoding='utf-8') as archivo:
+            base = json.load(archivo)
+        if base.get('datos') != resultados['datos']:
+            self.stderr.write(f'Aviso: la línea base se midió con otros datos ({base.get("datos")}).')
+
+        regresiones = []
+        for nombre, medida in resultados['rutas'].items():
+            anterior = base['rutas'].get(nombre)
+            if anterior is None:
+                continue
+            if medida['estado'] >= 400 and anterior['estado'] < 400:
+                regresiones.append(f'{nombre}: estado {anterior["estado"]} -> {medida["estado"]}')
+            if medida['consultas'] > anterior['consultas']:
+                regresiones.append(f'{nombre}: consultas {anterior["consultas"]} -> {medida["consultas"]}')
+            limite = max(anterior['p95_ms'] * (1 + options['umbral']), anterior['p95_ms'] + options['margen_ms'])
+            if medida['p95_ms'] > limite:
+                regresiones.append(f'{nombre}: p95 {anterior["p95_ms"]:.2f}ms -> {medida["p95_ms"]:.2f}ms')
+
+        for regresion in regresiones:
+            self.stderr.write(regresion)
+        if regresiones:
+            raise CommandError(f'{len(regresiones)} regresiones respecto de {options["comparar"]}.')
+        self.stdout.write(self.style.SUCCESS('Sin regresiones respecto de la línea base.'))
@@ -0,0 +1,33 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from home.models import Contacto
+from home.search import buscar_contactos
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia de la búsqueda de contactos (primera página y conteo) sobre la base actual.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('consultas', nargs='*', default=['ana', 'garcia', 'lopez mar', 'example'])
+        parser.add_argument('--repeticiones', type=int, default=50)
+        parser.add_argument('--por-pagina', type=int, default=20)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{Contacto.objects.count()} contactos')
+        for texto in options['consultas']:
+            tiempos = []
+            for _ in range(options['repeticiones']):
+                inicio = time.perf_counter()
+                queryset = buscar_contactos(Contacto.objects.all(), texto)
+                total = queryset.count()
+                list(queryset[:options['por_pagina']])
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            tiempos.sort()
+            p95 = tiempos[max(int(len(tiempos) * 0.95) - 1, 0)]
+            self.stdout.write(
+                f'{texto!r}: {total} resultados, p50={statistics.median(tiempos):.2f}ms '
+                f'p95={p95:.2f}ms max={tiempos[-1]:.2f}ms'
+            )
@@ -0,0 +1,104 @@
+import logging
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from home.instrumentacion import percentil
+from home.models import Actividad, Oportunidad
+
+# Perfil sin ajustes: los valores por omisión de SQLite (la espera ante
+# bloqueos queda en los 5 s del módulo sqlite3). journal_mode se guarda en el
+# archivo, así que se fija explícitamente en ambos sentidos.
+SQLITE_PREDETERMINADO = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide escrituras concurrentes (actividad_toggle_completada y oportunidad_update_estado) '
+        'con varios hilos sobre la base actual: operaciones por segundo, p95 y errores de bloqueo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8)
+        parser.add_argument('--operaciones', type=int, default=200, help='Escrituras por hilo.')
+        parser.add_argument(
+            '--perfil', choices=['ajustado', 'predeterminado'], default='ajustado',
+            help='En SQLite: los PRAGMA de CRM_SQLITE_PRAGMAS o los valores por omisión.',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] in ('', ':memory:'):
+            raise CommandError('Se necesita una base en archivo para medir concurrencia.')
+        actividades = list(Actividad.objects.order_by('id').values_list('id', flat=True)[:1000])
+        oportunidades = list(Oportunidad.objects.order_by('id').values_list('id', flat=True)[:1000])
+        if not actividades or not oportunidades:
+            raise CommandError('No hay datos; ejecute generate_crm_data.')
+
+        ajustes = {'ALLOWED_HOSTS': ['testserver'], 'CRM_INSTRUMENTACION_MUESTREO': 0}
+        if options['perfil'] == 'predeterminado':
+            ajustes['CRM_SQLITE_PRAGMAS'] = SQLITE_PREDETERMINADO
+
+        tiempos = []
+        errores = []
+        candado = threading.Lock()
+
+        def trabajar(numero):
+            azar = random.Random(numero)
+            cliente = Client()
+            propios, fallidos = [], []
+            try:
+                for _ in range(options['operaciones']):
+                    if azar.random() < 0.5:
+                        url = reverse('actividad_toggle_completada', args=[azar.choice(actividades)])
+                        datos = {}
+                    else:
+                        url = reverse('oportunidad_update_estado', args=[azar.choice(oportunidades)])
+                        datos = {'estado': azar.choice(Oportunidad.ESTADO_CHOICES)[0]}
+                    inicio = time.perf_counter()
+                    try:
+                        cliente.post(url, datos)
+                    except OperationalError as e:
+                        fallidos.append(str(e))
+                        continue
+                    propios.append((time.perf_counter() - inicio) * 1000)
+            finally:
+                connections.close_all()
+            with candado:
+                tiempos.extend(propios)
+                errores.extend(fallidos)
+
+        with override_settings(**ajustes):
+            # Se reabre la conexión antes de los hilos para que el cambio de
+            # journal_mode no compita con ellos
+            connections.close_all()
+            connection.ensure_connection()
+            connections.close_all()
+            hilos = [threading.Thread(target=trabajar, args=(i,)) for i in range(options['hilos'])]
+            # Los errores se cuentan aquí; sin el traceback de django.request por cada uno
+            logging.disable(logging.ERROR)
+            inicio = time.perf_counter()
+            try:
+                for hilo in hilos:
+                    hilo.start()
+                for hilo in hilos:
+                    hilo.join()
+            finally:
+                duracion = time.perf_counter() - inicio
+                logging.disable(logging.NOTSET)
+            connections.close_all()
+
+        tiempos.sort()
+        self.stdout.write(
+            f'{connection.vendor} ({options["perfil"]}), {options["hilos"]} hilos: '
+            f'{len(tiempos)} escrituras en {duracion:.2f}s ({len(tiempos) / duracion:.0f}/s), '
+            f'p50={percentil(tiempos, 50):.1f}ms p95={percentil(tiempos, 95):.1f}ms, '
+            f'{len(errores)} errores'
+        )
+        for mensaje in sorted(set(errores)):
+            self.stdout.write(f'    {errores.count(mensaje)}x {mensaje}')
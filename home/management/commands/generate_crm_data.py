@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from home.generador import GeneradorCrm, vaciar_crm
+
+
+def cantidad(valor):
+    """Acepta 10000, 10k, 100k o 1m."""
+    multiplicadores = {'k': 1000, 'm': 1000000}
+    valor = valor.strip().lower()
+    try:
+        if valor[-1:] in multiplicadores:
+            return int(float(valor[:-1]) * multiplicadores[valor[-1]])
+        return int(valor)
+    except ValueError:
+        raise CommandError(f'Cantidad no válida: {valor}')
+
+
+class Command(BaseCommand):
+    help = 'Genera contactos sintéticos con empresas, etiquetas, oportunidades y actividades (reproducible por semilla).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('contactos', help='Cantidad de contactos: 10k, 100k, 1m o un número.')
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--lote', type=int, default=2000, help='Contactos por transacción.')
+        parser.add_argument('--vaciar', action='store_true', help='Borra antes todos los datos del CRM.')
+
+    def handle(self, *args, **options):
+        contactos = cantidad(options['contactos'])
+        if options['vaciar']:
+            vaciar_crm()
+
+        def progreso(hechos, total):
+            if options['verbosity'] > 1 or hechos == total or hechos % (options['lote'] * 50) == 0:
+                self.stdout.write(f'{hechos}/{total} contactos')
+
+        creados = GeneradorCrm(options['semilla'], options['lote']).generar(contactos, progreso)
+        self.stdout.write(self.style.SUCCESS(
+            f'{creados["contactos"]} contactos, {creados["empresas"]} empresas, '
+            f'{creados["oportunidades"]} oportunidades y {creados["actividades"]} actividades '
+            f'en {creados["duracion"]:.1f}s'
+        ))
@@ -0,0 +1,36 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home.importacion import TAMANO_LOTE, ImportadorContactos, leer_filas
+
+
+class Command(BaseCommand):
+    help = 'Importa contactos desde un archivo CSV o JSONL en lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help='Por defecto se deduce de la extensión.')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE)
+
+    def handle(self, *args, **options):
+        ruta = options['archivo']
+        formato = options['formato'] or os.path.splitext(ruta)[1].lstrip('.').lower()
+        if formato not in ('csv', 'jsonl'):
+            raise CommandError('Indique --formato csv o jsonl.')
+
+        def progreso(resultado):
+            self.stdout.write(f'{resultado.filas} filas leídas, {resultado.creados} contactos creados')
+
+        with open(ruta, 'rb') as archivo:
+            resultado = ImportadorContactos(options['lote']).importar(leer_filas(archivo, formato), progreso)
+
+        for linea, mensaje in resultado.errores:
+            self.stderr.write(f'Línea {linea}: {mensaje}')
+        if resultado.total_errores > len(resultado.errores):
+            self.stderr.write(f'... y {resultado.total_errores - len(resultado.errores)} errores más')
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.creados} contactos creados de {resultado.filas} filas '
+            f'({resultado.total_errores} errores) en {resultado.duracion:.1f}s, '
+            f'{resultado.filas_por_segundo:.0f} filas/s'
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from home.contadores import LOTE, revisar_lote
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara los contadores desnormalizados de cada contacto (oportunidades abiertas, valor abierto, '
+        'actividades y última actividad) con las tablas, por lotes de contactos, y corrige los que no coinciden.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Solo informa los contactos con diferencias; falla si hay alguno.',
+        )
+        parser.add_argument('--lote', type=int, default=LOTE, help='Contactos por consulta.')
+
+    def handle(self, *args, **options):
+        desde, distintos = 0, []
+        while True:
+            ultimo, lote = revisar_lote(desde, options['lote'], corregir=not options['check'])
+            if ultimo is None:
+                break
+            distintos += lote
+            desde = ultimo
+            if options['verbosity'] > 1:
+                self.stdout.write(f'hasta el contacto {ultimo}: {len(lote)} con diferencias')
+        if options['check']:
+            if distintos:
+                muestra = ', '.join(map(str, distintos[:20]))
+                raise CommandError(
+                    f'{len(distintos)} contactos con contadores desviados ({muestra}); ejecute rebuild_contact_counters.'
+                )
+            self.stdout.write(self.style.SUCCESS('Los contadores coinciden con las tablas.'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'{len(distintos)} contactos corregidos.'))
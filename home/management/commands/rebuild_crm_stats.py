@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from home.stats import diferencias_estadisticas, reconstruir_estadisticas
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los acumulados del dashboard (CrmStats) o verifica que coincidan con las tablas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Solo compara los acumulados con los agregados reales; falla si hay diferencias.',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            diferencias = diferencias_estadisticas()
+            for clave, acumulada, real in diferencias:
+                self.stdout.write(f'{clave}: acumulado={acumulada[0]} (${acumulada[1]}) real={real[0]} (${real[1]})')
+            if diferencias:
+                raise CommandError(f'{len(diferencias)} acumulados no coinciden; ejecute rebuild_crm_stats.')
+            self.stdout.write(self.style.SUCCESS('Los acumulados coinciden con las tablas.'))
+            return
+
+        estadisticas = reconstruir_estadisticas()
+        self.stdout.write(self.style.SUCCESS(f'{len(estadisticas)} acumulados reconstruidos.'))
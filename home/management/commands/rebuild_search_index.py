@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from home.search import backend, reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de texto completo de contactos.'
+
+    def handle(self, *args, **options):
+        if backend() is None:
+            self.stdout.write('Este motor de base de datos no usa índice de búsqueda (se usa icontains).')
+            return
+        total = reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f'{total} contactos indexados.'))
@@ -0,0 +1,109 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from home.tareas import ejecutar, ejecutar_en_proceso, reclamar, terminar
+
+
+def _iniciar_proceso():
+    # Con fork el hijo hereda Django ya configurado; con spawn hay que configurarlo
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        'Ejecuta las tareas encoladas en home.tareas (tabla Tarea) con un pool de procesos. '
+        'Con --procesos 0 las ejecuta en este mismo proceso.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 2, help='Procesos del pool.')
+        parser.add_argument('--intervalo', type=float, default=1.0, help='Segundos entre consultas si la cola está vacía.')
+        parser.add_argument('--una-vez', action='store_true', help='Terminar cuando no queden tareas disponibles.')
+
+    def handle(self, *args, **options):
+        if options['procesos'] <= 0:
+            hechas, fallidas = self._en_este_proceso(options)
+        else:
+            hechas, fallidas = self._con_pool(options)
+        self.stdout.write(f'{hechas} tareas terminadas, {fallidas} con error.')
+
+    def _registrar(self, tarea, error):
+        terminar(tarea, error)
+        if error is None:
+            self.stdout.write(f'tarea {tarea.pk} {tarea.nombre}: ok')
+        else:
+            self.stderr.write(f'tarea {tarea.pk} {tarea.nombre}: error (intento {tarea.intentos})')
+        return error is None
+
+    def _en_este_proceso(self, options):
+        hechas = fallidas = 0
+        while True:
+            tareas = reclamar(1)
+            if not tareas:
+                if options['una_vez']:
+                    return hechas, fallidas
+                time.sleep(options['intervalo'])
+                continue
+            for tarea in tareas:
+                if self._registrar(tarea, ejecutar(tarea.nombre, tarea.argumentos)):
+                    hechas += 1
+                else:
+                    fallidas += 1
+
+    def _pool(self, options):
+        # Los hijos no deben heredar conexiones abiertas del padre
+        connections.close_all()
+        return ProcessPoolExecutor(max_workers=options['procesos'], initializer=_iniciar_proceso)
+
+    def _con_pool(self, options):
+        hechas = fallidas = 0
+        pool = self._pool(options)
+        en_curso = {}
+        try:
+            while True:
+                libres = options['procesos'] - len(en_curso)
+                if libres:
+                    reclamadas = reclamar(libres)
+                    for i, tarea in enumerate(reclamadas):
+                        try:
+                            en_curso[pool.submit(ejecutar_en_proceso, tarea.nombre, tarea.argumentos)] = tarea
+                        except BrokenProcessPool as e:
+                            # Un hijo murió (OOM, señal) y el pool ya no acepta trabajo: las
+                            # tareas reclamadas que no se enviaron se registran como fallidas
+                            # y las que estaban en curso terminan con el mismo error en wait()
+                            for pendiente in reclamadas[i:]:
+                                self._registrar(pendiente, f'El pool de procesos se rompió: {e!r}')
+                                fallidas += 1
+                            self.stderr.write('El pool de procesos se rompió; se crea uno nuevo.')
+                            pool.shutdown(wait=False, cancel_futures=True)
+                            pool = self._pool(options)
+                            break
+                if not en_curso:
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    continue
+                terminados, _ = wait(en_curso, timeout=options['intervalo'], return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    tarea = en_curso.pop(futuro)
+                    try:
+                        error = futuro.result()
+                    except Exception as e:
+                        # El proceso hijo murió: la tarea cuenta como fallida
+                        error = repr(e)
+                    if self._registrar(tarea, error):
+                        hechas += 1
+                    else:
+                        fallidas += 1
+        except KeyboardInterrupt:
+            # Las tareas sin terminar vuelven a la cola al vencer su plazo
+            self.stderr.write(f'Interrumpido con {len(en_curso)} tareas en curso.')
+        finally:
+            pool.shutdown()
+        return hechas, fallidas
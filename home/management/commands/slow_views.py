@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from home.instrumentacion import horas_reporte, reporte_vistas
+from home.models import MuestraVista
+
+
+class Command(BaseCommand):
+    help = 'Lista las vistas más lentas por p95 según las muestras de InstrumentacionMiddleware.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas', type=horas_reporte, default=24, help='Ventana de muestras a considerar (1 a 2160 horas).',
+        )
+        parser.add_argument('--limite', type=int, default=20)
+        parser.add_argument('--purgar-dias', type=int, help='Borra antes las muestras más viejas que N días.')
+
+    def handle(self, *args, **options):
+        if options['purgar_dias'] is not None:
+            limite = timezone.now() - timedelta(days=options['purgar_dias'])
+            borradas, _ = MuestraVista.objects.filter(fecha__lt=limite).delete()
+            self.stdout.write(f'{borradas} muestras borradas.')
+
+        filas = reporte_vistas(timezone.now() - timedelta(hours=options['horas']), options['limite'])
+        if not filas:
+            self.stdout.write('Sin muestras en la ventana pedida.')
+            return
+        self.stdout.write(
+            f'{"vista":<32} {"n":>6} {"p50 ms":>8} {"p95 ms":>8} {"cons p95":>8} '
+            f'{"sql ms":>8} {"rep max":>7} {"tpl ms":>8} {"bytes":>9} {"frag %":>6}'
+        )
+        for fila in filas:
+            tamano = f'{fila["tamano"]:.0f}' if fila['tamano'] is not None else '-'
+            aciertos = f'{fila["fragmentos_aciertos"] * 100:.0f}' if fila['fragmentos_aciertos'] is not None else '-'
+            self.stdout.write(
+                f'{fila["vista"]:<32} {fila["muestras"]:>6} {fila["p50_ms"]:>8.1f} {fila["p95_ms"]:>8.1f} '
+                f'{fila["consultas_p95"]:>8} {fila["sql_ms"]:>8.1f} {fila["repetidas_max"]:>7} '
+                f'{fila["plantillas_ms"]:>8.1f} {tamano:>9} {aciertos:>6}'
+            )
+            if fila['huella_repetida']:
+                self.stdout.write(f'    N+1: {fila["huella_repetida"][:160]}')
@@ -0,0 +1,64 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Se ejecuta en un proceso nuevo: importa la aplicación WSGI como un worker y
+# después pide todas las plantillas, que es lo que pagaría el primer pedido
+# si no estuvieran precompiladas.
+PROGRAMA = """
+import json, time
+import thelightspeed.wsgi
+from django.template import engines
+from home.arranque import TIEMPOS, plantillas_de_home
+inicio = time.perf_counter()
+for nombre in plantillas_de_home():
+    engines['django'].get_template(nombre)
+TIEMPOS['primer_uso_ms'] = (time.perf_counter() - inicio) * 1000
+print(json.dumps(TIEMPOS))
+"""
+
+COLUMNAS = ['importacion_ms', 'urlconf_ms', 'plantillas_ms', 'total_ms', 'primer_uso_ms']
+
+
+class Command(BaseCommand):
+    help = (
+        'Arranca workers WSGI en procesos nuevos con el perfil de producción y muestra cuánto tardan '
+        'la importación, el URLconf y la precompilación de plantillas, con y sin precompilar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=5, help='Procesos por variante (se informa la mediana).')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"variante":<16} {"import ms":>9} {"urlconf ms":>10} {"plantillas":>10} '
+            f'{"tpl ms":>8} {"total ms":>8} {"1er uso ms":>10}'
+        )
+        for variante, precompilar in [('sin precompilar', '0'), ('precompiladas', '1')]:
+            entorno = {
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'thelightspeed.settings'),
+                'CRM_PERFIL': 'produccion',
+                'CRM_PRECOMPILAR_PLANTILLAS': precompilar,
+            }
+            medidas = [self._arrancar(entorno) for _ in range(options['repeticiones'])]
+            mediana = {columna: statistics.median(medida[columna] for medida in medidas) for columna in COLUMNAS}
+            self.stdout.write(
+                f'{variante:<16} {mediana["importacion_ms"]:>9.1f} {mediana["urlconf_ms"]:>10.1f} '
+                f'{medidas[0]["plantillas"]:>10} {mediana["plantillas_ms"]:>8.1f} '
+                f'{mediana["total_ms"]:>8.1f} {mediana["primer_uso_ms"]:>10.1f}'
+            )
+
+    def _arrancar(self, entorno):
+        resultado = subprocess.run(
+            [sys.executable, '-c', PROGRAMA], env=entorno, cwd=settings.BASE_DIR,
+            capture_output=True, text=True,
+        )
+        if resultado.returncode != 0:
+            raise CommandError(f'El worker no arrancó:\n{resultado.stderr}')
+        return json.loads(resultado.stdout.strip().splitlines()[-1])
@@ -0,0 +1,26 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Copia la base SQLite principal sobre cada réplica de CRM_REPLICAS (para probar réplicas en local).'
+
+    def handle(self, *args, **options):
+        principal = connections['default']
+        if principal.vendor != 'sqlite':
+            raise CommandError('Solo para SQLite; en PostgreSQL la replicación la hace el servidor.')
+        if not settings.CRM_REPLICAS:
+            raise CommandError('No hay réplicas configuradas (CRM_DB_REPLICAS).')
+        principal.ensure_connection()
+        for alias in settings.CRM_REPLICAS:
+            connections[alias].close()
+            destino = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                # La API de respaldo copia una foto consistente aunque haya escrituras
+                principal.connection.backup(destino)
+            finally:
+                destino.close()
+            self.stdout.write(f'{alias}: {connections[alias].settings_dict["NAME"]}')
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:30
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def poblar_estadisticas(apps, schema_editor):
+    Contacto = apps.get_model('home', 'Contacto')
+    Oportunidad = apps.get_model('home', 'Oportunidad')
+    CrmStats = apps.get_model('home', 'CrmStats')
+    estadisticas = [CrmStats(clave='contactos', cantidad=Contacto.objects.count())]
+    for fila in Oportunidad.objects.order_by().values('estado').annotate(cantidad=Count('id'), valor=Sum('valor')):
+        estadisticas.append(CrmStats(
+            clave=f"oportunidades:{fila['estado']}", cantidad=fila['cantidad'], valor=fila['valor'] or 0,
+        ))
+    CrmStats.objects.bulk_create(estadisticas)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrmStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=50, unique=True)),
+                ('cantidad', models.BigIntegerField(default=0)),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'verbose_name_plural': 'Estadísticas CRM',
+            },
+        ),
+        migrations.RunPython(poblar_estadisticas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations
+
+# SQL fijo a la fecha de la migración: no depende de home.search, que puede
+# cambiar después sin alterar lo que hace esta migración.
+CREAR = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS home_contacto_fts USING fts5("
+        "nombre, correo, telefono, empresa, tokenize='unicode61 remove_diacritics 2')",
+        "INSERT INTO home_contacto_fts (rowid, nombre, correo, telefono, empresa) "
+        "SELECT c.id, c.nombre, c.correo, COALESCE(c.telefono, ''), COALESCE(e.nombre, '') "
+        "FROM home_contacto c LEFT JOIN home_empresa e ON e.id = c.empresa_id",
+    ],
+    'postgresql': [
+        "CREATE TABLE IF NOT EXISTS home_contacto_busqueda ("
+        "contacto_id integer PRIMARY KEY REFERENCES home_contacto (id) ON DELETE CASCADE "
+        "DEFERRABLE INITIALLY DEFERRED, documento tsvector NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS home_contacto_busqueda_gin ON home_contacto_busqueda USING gin (documento)",
+        "INSERT INTO home_contacto_busqueda (contacto_id, documento) "
+        "SELECT c.id, "
+        "setweight(to_tsvector('simple', COALESCE(c.nombre, '')), 'A') || "
+        "setweight(to_tsvector('simple', COALESCE(c.correo, '')), 'B') || "
+        "setweight(to_tsvector('simple', COALESCE(c.telefono, '')), 'B') || "
+        "setweight(to_tsvector('simple', COALESCE(e.nombre, '')), 'C') "
+        "FROM home_contacto c LEFT JOIN home_empresa e ON e.id = c.empresa_id",
+    ],
+}
+
+ELIMINAR = {
+    'sqlite': ['DROP TABLE IF EXISTS home_contacto_fts'],
+    'postgresql': ['DROP TABLE IF EXISTS home_contacto_busqueda'],
+}
+
+
+def _ejecutar(sentencias, schema_editor):
+    # En otros motores no hay índice: la búsqueda usa icontains
+    for sentencia in sentencias.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sentencia)
+
+
+def crear_indice(apps, schema_editor):
+    _ejecutar(CREAR, schema_editor)
+
+
+def eliminar_indice(apps, schema_editor):
+    _ejecutar(ELIMINAR, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0002_crmstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
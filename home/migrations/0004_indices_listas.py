@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0003_contacto_busqueda'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='actividad',
+            name='contacto',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='actividades', to='home.contacto'),
+        ),
+        migrations.AlterField(
+            model_name='actividad',
+            name='oportunidad',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='actividades', to='home.oportunidad'),
+        ),
+        migrations.AlterField(
+            model_name='contacto',
+            name='empresa',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='contactos', to='home.empresa'),
+        ),
+        migrations.AlterField(
+            model_name='oportunidad',
+            name='contacto',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='oportunidades', to='home.contacto'),
+        ),
+        migrations.AddIndex(
+            model_name='actividad',
+            index=models.Index(fields=['fecha', 'id'], name='actividad_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actividad',
+            index=models.Index(fields=['completada', 'fecha', 'id'], name='actividad_completada_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actividad',
+            index=models.Index(fields=['tipo', 'fecha', 'id'], name='actividad_tipo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actividad',
+            index=models.Index(fields=['contacto', 'fecha', 'id'], name='actividad_contacto_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actividad',
+            index=models.Index(fields=['oportunidad', 'fecha', 'id'], name='actividad_oport_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contacto',
+            index=models.Index(fields=['nombre', 'id'], name='contacto_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contacto',
+            index=models.Index(fields=['empresa', 'nombre', 'id'], name='contacto_empresa_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='empresa',
+            index=models.Index(fields=['nombre'], name='empresa_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='oportunidad',
+            index=models.Index(fields=['fecha_creacion', 'id'], name='oport_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='oportunidad',
+            index=models.Index(fields=['estado', 'fecha_creacion', 'id'], name='oport_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='oportunidad',
+            index=models.Index(fields=['contacto', 'fecha_creacion', 'id'], name='oport_contacto_fecha_idx'),
+        ),
+    ]
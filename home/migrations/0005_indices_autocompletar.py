@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:36
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0004_indices_listas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='empresa',
+            index=models.Index(django.db.models.functions.text.Lower('nombre'), name='empresa_nombre_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='oportunidad',
+            index=models.Index(django.db.models.functions.text.Lower('titulo'), name='oport_titulo_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0006_fecha_actualizacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MuestraVista',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vista', models.CharField(max_length=200)),
+                ('metodo', models.CharField(max_length=10)),
+                ('estado', models.PositiveSmallIntegerField()),
+                ('duracion_ms', models.FloatField()),
+                ('consultas', models.PositiveIntegerField()),
+                ('tiempo_sql_ms', models.FloatField()),
+                ('consultas_repetidas', models.PositiveIntegerField()),
+                ('huella_repetida', models.TextField(blank=True)),
+                ('tiempo_plantillas_ms', models.FloatField()),
+                ('tamano_respuesta', models.PositiveIntegerField(null=True)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'Muestras de vistas',
+                'indexes': [models.Index(fields=['fecha'], name='muestra_fecha_idx'), models.Index(fields=['vista', 'fecha'], name='muestra_vista_fecha_idx')],
+            },
+        ),
+    ]
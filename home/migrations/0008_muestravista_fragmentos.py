@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0007_muestravista'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='muestravista',
+            name='fragmentos_aciertos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='muestravista',
+            name='fragmentos_fallos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0008_muestravista_fragmentos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActividadArchivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('llamada', 'Llamada'), ('correo', 'Correo'), ('reunion', 'Reunión'), ('tarea', 'Tarea')], max_length=20)),
+                ('titulo', models.CharField(max_length=200)),
+                ('descripcion', models.TextField(blank=True, null=True)),
+                ('fecha', models.DateTimeField()),
+                ('completada', models.BooleanField(default=True)),
+                ('fecha_creacion', models.DateTimeField()),
+                ('fecha_actualizacion', models.DateTimeField()),
+                ('fecha_archivado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('contacto', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='actividades_archivadas', to='home.contacto')),
+                ('oportunidad', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='actividades_archivadas', to='home.oportunidad')),
+            ],
+            options={
+                'verbose_name_plural': 'Actividades archivadas',
+                'ordering': ['-fecha'],
+                'indexes': [models.Index(fields=['fecha', 'id'], name='archivada_fecha_idx'), models.Index(fields=['tipo', 'fecha', 'id'], name='archivada_tipo_fecha_idx'), models.Index(fields=['contacto', 'fecha', 'id'], name='archivada_contacto_fecha_idx'), models.Index(fields=['oportunidad', 'fecha', 'id'], name='archivada_oport_fecha_idx')],
+            },
+        ),
+    ]
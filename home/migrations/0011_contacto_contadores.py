@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:35
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def poblar_contadores(apps, schema_editor):
+    Contacto = apps.get_model('home', 'Contacto')
+    Oportunidad = apps.get_model('home', 'Oportunidad')
+    Actividad = apps.get_model('home', 'Actividad')
+    ActividadArchivada = apps.get_model('home', 'ActividadArchivada')
+    abiertas = Oportunidad.objects.filter(
+        contacto_id=OuterRef('pk'), estado__in=['nuevo', 'en_progreso'],
+    ).order_by().values('contacto_id')
+    actividades = [
+        modelo.objects.filter(contacto_id=OuterRef('pk')).order_by().values('contacto_id')
+        for modelo in (Actividad, ActividadArchivada)
+    ]
+    ultimas = [
+        Subquery(modelo.objects.filter(contacto_id=OuterRef('pk')).order_by('-fecha').values('fecha')[:1])
+        for modelo in (Actividad, ActividadArchivada)
+    ]
+    Contacto.objects.update(
+        oportunidades_abiertas=Coalesce(Subquery(abiertas.annotate(n=Count('id')).values('n')), 0),
+        valor_abierto=Coalesce(
+            Subquery(abiertas.annotate(v=Sum('valor')).values('v')), Value(0),
+            output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        ),
+        actividades_total=(
+            Coalesce(Subquery(actividades[0].annotate(n=Count('id')).values('n')), 0)
+            + Coalesce(Subquery(actividades[1].annotate(n=Count('id')).values('n')), 0)
+        ),
+        ultima_actividad=Greatest(Coalesce(*ultimas), Coalesce(*reversed(ultimas))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0010_tarea'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contacto',
+            name='actividades_total',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='contacto',
+            name='oportunidades_abiertas',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='contacto',
+            name='ultima_actividad',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='contacto',
+            name='valor_abierto',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddIndex(
+            model_name='contacto',
+            index=models.Index(fields=['ultima_actividad', 'id'], name='contacto_ultima_actividad_idx'),
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def poblar_cambios(apps, schema_editor):
+    # Sin historia previa: cada oportunidad se da de alta como nueva en su
+    # fecha de creación y, si ya no lo es, pasa a su estado actual en su
+    # última actualización
+    Oportunidad = apps.get_model('home', 'Oportunidad')
+    CambioEstado = apps.get_model('home', 'CambioEstado')
+    cambios = schema_editor.quote_name(CambioEstado._meta.db_table)
+    oportunidades = schema_editor.quote_name(Oportunidad._meta.db_table)
+    columnas = '(oportunidad_id, estado_anterior, estado, valor, fecha)'
+    schema_editor.execute(
+        f"INSERT INTO {cambios} {columnas} SELECT id, '', 'nuevo', valor, fecha_creacion FROM {oportunidades}"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {cambios} {columnas} SELECT id, 'nuevo', estado, valor, fecha_actualizacion "
+        f"FROM {oportunidades} WHERE estado <> 'nuevo'"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0011_contacto_contadores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioEstado',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado_anterior', models.CharField(blank=True, choices=[('nuevo', 'Nuevo'), ('en_progreso', 'En Progreso'), ('ganado', 'Ganado'), ('perdido', 'Perdido')], max_length=20)),
+                ('estado', models.CharField(choices=[('nuevo', 'Nuevo'), ('en_progreso', 'En Progreso'), ('ganado', 'Ganado'), ('perdido', 'Perdido')], max_length=20)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('oportunidad', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='cambios_estado', to='home.oportunidad')),
+            ],
+            options={
+                'verbose_name_plural': 'Cambios de estado',
+                'ordering': ['fecha', 'id'],
+                'indexes': [models.Index(fields=['fecha', 'id'], name='cambio_fecha_idx'), models.Index(fields=['oportunidad', 'fecha', 'id'], name='cambio_oport_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_cambios, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0012_cambioestado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='etiqueta',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copiar_numero(apps, schema_editor):
+    CambioEstado = apps.get_model('home', 'CambioEstado')
+    CambioEstado.objects.update(numero_oportunidad=models.F('oportunidad_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0013_etiqueta_fecha_actualizacion'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cambioestado',
+            name='cambio_oport_fecha_idx',
+        ),
+        migrations.AddField(
+            model_name='cambioestado',
+            name='numero_oportunidad',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.RunPython(copiar_numero, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='cambioestado',
+            name='numero_oportunidad',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='cambioestado',
+            name='oportunidad',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cambios_estado', to='home.oportunidad'),
+        ),
+        migrations.AddIndex(
+            model_name='cambioestado',
+            index=models.Index(fields=['numero_oportunidad', 'fecha', 'id'], name='cambio_numero_fecha_idx'),
+        ),
+    ]
@@ -1,4 +1,9 @@
+import datetime
+
+from django.conf import settings
 from django.db import models
+from django.db.models.functions import Lower
+from django.core.exceptions import ValidationError
 from django.core.validators import EmailValidator
 from django.utils import timezone
 
@@ -13,15 +18,88 @@ class Producto(models.Model):
 
 # Modelos del CRM
 
-class Empresa(models.Model):
+def _normalizar(campo, valor):
+    # Las vistas asignan los textos de request.POST tal como llegan
+    try:
+        valor = campo.to_python(valor)
+    except ValidationError:
+        return valor
+    if isinstance(valor, datetime.datetime) and settings.USE_TZ and timezone.is_naive(valor):
+        valor = timezone.make_aware(valor)
+    return valor
+
+
+class CamposModificadosMixin:
+    """
+    Guarda solo las columnas que cambiaron desde que la fila se leyó.
+
+    En una instancia cargada de la base, save() sin update_fields pasa como
+    update_fields las columnas modificadas más las auto_now; si no cambió
+    nada, no hay UPDATE ni señales.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._recordar_originales()
+        return instancia
+
+    def _recordar_originales(self, campos=None):
+        if not hasattr(self, '_originales'):
+            self._originales = {}
+        for campo in self._meta.concrete_fields:
+            # Los diferidos (only/defer) no se cargaron y no se recuerdan
+            if campo.attname in self.__dict__ and (campos is None or {campo.name, campo.attname} & set(campos)):
+                # Normalizados como en campos_modificados: las señales los restan y comparan
+                self._originales[campo.attname] = _normalizar(campo, getattr(self, campo.attname))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        # Lo recargado pasa a ser el valor original
+        self._recordar_originales(fields)
+
+    def campos_modificados(self):
+        """Nombres de los campos que cambiaron, o None si la instancia no vino de la base."""
+        originales = getattr(self, '_originales', None)
+        if originales is None:
+            return None
+        return [
+            campo.name for campo in self._meta.concrete_fields
+            if not campo.primary_key and campo.attname in self.__dict__ and (
+                campo.attname not in originales
+                or _normalizar(campo, getattr(self, campo.attname)) != originales[campo.attname]
+            )
+        ]
+
+    def save(self, **kwargs):
+        if kwargs.get('update_fields') is None and not kwargs.get('force_insert') and not self._state.adding:
+            modificados = self.campos_modificados()
+            if modificados:
+                modificados += [
+                    campo.name for campo in self._meta.concrete_fields
+                    if getattr(campo, 'auto_now', False) and campo.name not in modificados
+                ]
+            if modificados is not None:
+                kwargs['update_fields'] = modificados
+        super().save(**kwargs)
+        self._recordar_originales(kwargs.get('update_fields'))
+
+
+class Empresa(CamposModificadosMixin, models.Model):
     nombre = models.CharField(max_length=200)
     sitio_web = models.URLField(blank=True, null=True)
     direccion = models.TextField(blank=True, null=True)
     telefono = models.CharField(max_length=20, blank=True, null=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['nombre']
+        indexes = [
+            models.Index(fields=['nombre'], name='empresa_nombre_idx'),
+            # Búsqueda por prefijo sin distinguir mayúsculas (autocompletado)
+            models.Index(Lower('nombre'), name='empresa_nombre_lower_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -30,6 +108,7 @@ class Empresa(models.Model):
 class Etiqueta(models.Model):
     nombre = models.CharField(max_length=50, unique=True)
     color = models.CharField(max_length=7, default='#3498db')  # Color hexadecimal
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['nombre']
@@ -38,24 +117,36 @@ class Etiqueta(models.Model):
         return self.nombre
 
 
-class Contacto(models.Model):
+class Contacto(CamposModificadosMixin, models.Model):
     nombre = models.CharField(max_length=200)
     correo = models.EmailField(validators=[EmailValidator()])
     telefono = models.CharField(max_length=20, blank=True, null=True)
-    empresa = models.ForeignKey(Empresa, on_delete=models.SET_NULL, null=True, blank=True, related_name='contactos')
+    empresa = models.ForeignKey(Empresa, on_delete=models.SET_NULL, null=True, blank=True, related_name='contactos', db_index=False)
     notas = models.TextField(blank=True, null=True)
     etiquetas = models.ManyToManyField(Etiqueta, blank=True, related_name='contactos')
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
+    # Contadores desnormalizados, mantenidos por home/contadores.py
+    oportunidades_abiertas = models.IntegerField(default=0, editable=False)
+    valor_abierto = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    actividades_total = models.IntegerField(default=0, editable=False)
+    ultima_actividad = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['nombre']
+        # Cada índice sigue un filtro de contactos_list más el orden del cursor;
+        # el de empresa también sirve de índice de la llave foránea
+        indexes = [
+            models.Index(fields=['nombre', 'id'], name='contacto_nombre_idx'),
+            models.Index(fields=['empresa', 'nombre', 'id'], name='contacto_empresa_nombre_idx'),
+            models.Index(fields=['ultima_actividad', 'id'], name='contacto_ultima_actividad_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
 
 
-class Oportunidad(models.Model):
+class Oportunidad(CamposModificadosMixin, models.Model):
     ESTADO_CHOICES = [
         ('nuevo', 'Nuevo'),
         ('en_progreso', 'En Progreso'),
@@ -67,7 +158,7 @@ class Oportunidad(models.Model):
     valor = models.DecimalField(max_digits=12, decimal_places=2)
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='nuevo')
     fecha_estimada_cierre = models.DateField()
-    contacto = models.ForeignKey(Contacto, on_delete=models.CASCADE, related_name='oportunidades')
+    contacto = models.ForeignKey(Contacto, on_delete=models.CASCADE, related_name='oportunidades', db_index=False)
     notas = models.TextField(blank=True, null=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
@@ -75,12 +166,43 @@ class Oportunidad(models.Model):
     class Meta:
         ordering = ['-fecha_creacion']
         verbose_name_plural = 'Oportunidades'
+        indexes = [
+            models.Index(fields=['fecha_creacion', 'id'], name='oport_fecha_idx'),
+            models.Index(fields=['estado', 'fecha_creacion', 'id'], name='oport_estado_fecha_idx'),
+            models.Index(fields=['contacto', 'fecha_creacion', 'id'], name='oport_contacto_fecha_idx'),
+            models.Index(Lower('titulo'), name='oport_titulo_lower_idx'),
+        ]
 
     def __str__(self):
         return f"{self.titulo} - {self.get_estado_display()}"
 
 
-class Actividad(models.Model):
+class CambioEstado(models.Model):
+    """Registro de solo inserción de los estados por los que pasa cada oportunidad (home/analitica.py)."""
+    # La historia sobrevive a la oportunidad: el FK queda nulo y el número la sigue agrupando
+    oportunidad = models.ForeignKey(
+        Oportunidad, on_delete=models.SET_NULL, null=True, blank=True, related_name='cambios_estado',
+    )
+    numero_oportunidad = models.PositiveIntegerField()
+    # Vacío en el registro de alta de la oportunidad
+    estado_anterior = models.CharField(max_length=20, choices=Oportunidad.ESTADO_CHOICES, blank=True)
+    estado = models.CharField(max_length=20, choices=Oportunidad.ESTADO_CHOICES)
+    valor = models.DecimalField(max_digits=12, decimal_places=2)
+    fecha = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['fecha', 'id']
+        verbose_name_plural = 'Cambios de estado'
+        indexes = [
+            models.Index(fields=['fecha', 'id'], name='cambio_fecha_idx'),
+            models.Index(fields=['numero_oportunidad', 'fecha', 'id'], name='cambio_numero_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.numero_oportunidad}: {self.estado_anterior or '-'} -> {self.estado}"
+
+
+class Actividad(CamposModificadosMixin, models.Model):
     TIPO_CHOICES = [
         ('llamada', 'Llamada'),
         ('correo', 'Correo'),
@@ -92,14 +214,134 @@ class Actividad(models.Model):
     titulo = models.CharField(max_length=200)
     descripcion = models.TextField(blank=True, null=True)
     fecha = models.DateTimeField(default=timezone.now)
-    contacto = models.ForeignKey(Contacto, on_delete=models.CASCADE, null=True, blank=True, related_name='actividades')
-    oportunidad = models.ForeignKey(Oportunidad, on_delete=models.CASCADE, null=True, blank=True, related_name='actividades')
+    contacto = models.ForeignKey(Contacto, on_delete=models.CASCADE, null=True, blank=True, related_name='actividades', db_index=False)
+    oportunidad = models.ForeignKey(Oportunidad, on_delete=models.CASCADE, null=True, blank=True, related_name='actividades', db_index=False)
     completada = models.BooleanField(default=False)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-fecha']
         verbose_name_plural = 'Actividades'
+        indexes = [
+            models.Index(fields=['fecha', 'id'], name='actividad_fecha_idx'),
+            models.Index(fields=['completada', 'fecha', 'id'], name='actividad_completada_fecha_idx'),
+            models.Index(fields=['tipo', 'fecha', 'id'], name='actividad_tipo_fecha_idx'),
+            models.Index(fields=['contacto', 'fecha', 'id'], name='actividad_contacto_fecha_idx'),
+            models.Index(fields=['oportunidad', 'fecha', 'id'], name='actividad_oport_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_tipo_display()} - {self.titulo}"
+
+
+class ActividadArchivada(models.Model):
+    """
+    Actividad completada más antigua que CRM_ARCHIVO_DIAS, movida aquí por
+    home.archivo.archivar_lote. Conserva el id original; las listas solo la
+    consultan cuando un filtro de fecha llega hasta el archivo.
+    """
+    archivada = True
+
+    id = models.BigIntegerField(primary_key=True)
+    tipo = models.CharField(max_length=20, choices=Actividad.TIPO_CHOICES)
+    titulo = models.CharField(max_length=200)
+    descripcion = models.TextField(blank=True, null=True)
+    fecha = models.DateTimeField()
+    contacto = models.ForeignKey(Contacto, on_delete=models.CASCADE, null=True, blank=True, related_name='actividades_archivadas', db_index=False)
+    oportunidad = models.ForeignKey(Oportunidad, on_delete=models.CASCADE, null=True, blank=True, related_name='actividades_archivadas', db_index=False)
+    completada = models.BooleanField(default=True)
+    fecha_creacion = models.DateTimeField()
+    fecha_actualizacion = models.DateTimeField()
+    fecha_archivado = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-fecha']
+        verbose_name_plural = 'Actividades archivadas'
+        indexes = [
+            models.Index(fields=['fecha', 'id'], name='archivada_fecha_idx'),
+            models.Index(fields=['tipo', 'fecha', 'id'], name='archivada_tipo_fecha_idx'),
+            models.Index(fields=['contacto', 'fecha', 'id'], name='archivada_contacto_fecha_idx'),
+            models.Index(fields=['oportunidad', 'fecha', 'id'], name='archivada_oport_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} - {self.titulo} (archivada)"
+
+
+class CrmStats(models.Model):
+    """Acumulados del dashboard, mantenidos por señales en home/signals.py."""
+    clave = models.CharField(max_length=50, unique=True)
+    cantidad = models.BigIntegerField(default=0)
+    valor = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'Estadísticas CRM'
+
+    def __str__(self):
+        return f"{self.clave}: {self.cantidad} (${self.valor})"
+
+
+class MuestraVista(models.Model):
+    """Medición de un pedido muestreado por home.instrumentacion.InstrumentacionMiddleware."""
+    vista = models.CharField(max_length=200)
+    metodo = models.CharField(max_length=10)
+    estado = models.PositiveSmallIntegerField()
+    duracion_ms = models.FloatField()
+    consultas = models.PositiveIntegerField()
+    tiempo_sql_ms = models.FloatField()
+    consultas_repetidas = models.PositiveIntegerField()
+    huella_repetida = models.TextField(blank=True)
+    tiempo_plantillas_ms = models.FloatField()
+    tamano_respuesta = models.PositiveIntegerField(null=True)
+    fragmentos_aciertos = models.PositiveIntegerField(default=0)
+    fragmentos_fallos = models.PositiveIntegerField(default=0)
+    fecha = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = 'Muestras de vistas'
+        indexes = [
+            models.Index(fields=['fecha'], name='muestra_fecha_idx'),
+            models.Index(fields=['vista', 'fecha'], name='muestra_vista_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.vista}: {self.duracion_ms:.1f}ms, {self.consultas} consultas"
+
+
+class Tarea(models.Model):
+    """Trabajo diferido de home.tareas; lo ejecuta el comando run_worker y se borra al terminar bien."""
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_curso', 'En curso'),
+        ('fallida', 'Fallida'),
+    ]
+
+    nombre = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict, blank=True)
+    clave = models.CharField(max_length=200, null=True, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=5)
+    disponible_desde = models.DateTimeField(default=timezone.now)
+    reclamada_por = models.CharField(max_length=64, blank=True)
+    reclamada_hasta = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['disponible_desde', 'id']
+        indexes = [
+            models.Index(fields=['estado', 'disponible_desde', 'id'], name='tarea_estado_disponible_idx'),
+        ]
+        constraints = [
+            # Clave de idempotencia: una sola tarea pendiente por clave (las
+            # en curso no cuentan, ver home/tareas.py)
+            models.UniqueConstraint(
+                fields=['clave'], condition=models.Q(estado='pendiente'), name='tarea_clave_pendiente_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre} ({self.get_estado_display()}, {self.intentos} intentos)"
@@ -0,0 +1,251 @@
+"""
+Paginación por cursor (keyset) para las listas del CRM.
+
+En lugar de OFFSET, cada página se pide con un cursor opaco que guarda los
+valores de orden de la última (o primera) fila vista, y la consulta busca
+directamente a partir de ellos: WHERE (orden, id) > (valores) LIMIT n. El
+costo de una página no depende de qué tan lejos esté del inicio.
+
+Cuando la lista se ordena por algo que no puede usarse como clave (una
+relación o el rango de búsqueda), el mismo cursor guarda un offset.
+
+Un cursor que no se puede leer, o cuyos valores no sirven para los campos de
+orden, lleva a la primera página; con ``estricto=True`` (la API) se rechaza
+con CursorInvalido.
+"""
+import base64
+import datetime
+import decimal
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db.models import Q
+
+TOTALES = getattr(settings, 'CRM_PAGINACION_TOTALES', True)
+TOTALES_TTL = getattr(settings, 'CRM_PAGINACION_TOTALES_TTL', 60)
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def _serializar(valor):
+    # Las fechas conservan los microsegundos: el cursor debe ser exacto
+    if isinstance(valor, (datetime.datetime, datetime.date)):
+        return valor.isoformat()
+    if isinstance(valor, decimal.Decimal):
+        return str(valor)
+    raise TypeError(f'{type(valor).__name__} no se puede usar en un cursor')
+
+
+def codificar_cursor(datos):
+    texto = json.dumps(datos, default=_serializar, separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode())
+    except (ValueError, TypeError):
+        return None
+    return datos if isinstance(datos, dict) else None
+
+
+def contar_cacheado(queryset, ttl=TOTALES_TTL):
+    """COUNT(*) del queryset, guardado en caché por la consulta SQL exacta."""
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        # queryset.none(): no hay consulta que hacer
+        return 0
+    clave = 'crm:total:' + hashlib.sha1(f'{sql}{params!r}'.encode()).hexdigest()
+    total = cache.get(clave)
+    if total is None:
+        total = queryset.count()
+        cache.set(clave, total, ttl)
+    return total
+
+
+class PaginaCursor:
+
+    def __init__(self, object_list, next_cursor, previous_cursor, total):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Pagina un queryset por los campos de ``orden`` (p. ej. ('-fecha', '-id')).
+    El último campo debe ser único para que el orden sea total.
+
+    Con ``orden=None`` se conserva el orden del queryset y el cursor guarda
+    un offset. ``total=False`` evita el COUNT(*); si se pide, se guarda en caché.
+    ``estricto=True`` lanza CursorInvalido en lugar de volver a la primera página.
+    """
+
+    def __init__(self, queryset, per_page, orden=None, total=TOTALES, estricto=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.orden = tuple(orden) if orden else None
+        self.total = total
+        self.estricto = estricto
+        if self.orden:
+            self.queryset = queryset.order_by(*self.orden)
+            # Los campos del cursor deben cargarse aunque la vista use only()
+            campos, diferidos = self.queryset.query.deferred_loading
+            if campos and not diferidos:
+                self.queryset = self.queryset.only(*campos, *(nombre for nombre, _ in self._campos()))
+
+    def get_page(self, cursor):
+        datos = decodificar_cursor(cursor) if cursor else None
+        if cursor and datos is None:
+            self._invalido()
+        total = self._contar() if self.total else None
+        if self.orden is None:
+            return self._pagina_offset(datos, total)
+        return self._pagina_keyset(datos, total)
+
+    def _contar(self):
+        return contar_cacheado(self.queryset)
+
+    def _invalido(self):
+        if self.estricto:
+            raise CursorInvalido('Cursor no válido')
+
+    # Cursor por valores de orden
+
+    def _campos(self):
+        return [(campo.lstrip('-'), campo.startswith('-')) for campo in self.orden]
+
+    def _valores(self, objeto):
+        return [getattr(objeto, nombre) for nombre, _ in self._campos()]
+
+    def _desde(self, valores, hacia_atras):
+        # (a, b) > (va, vb)  ==  a > va OR (a = va AND b > vb), respetando
+        # la dirección de cada campo
+        modelo = self.queryset.model
+        condicion = Q()
+        iguales = {}
+        for (nombre, descendente), valor in zip(self._campos(), valores):
+            valor = modelo._meta.get_field(nombre).to_python(valor)
+            operador = 'lt' if descendente != hacia_atras else 'gt'
+            condicion |= Q(**iguales, **{f'{nombre}__{operador}': valor})
+            iguales[nombre] = valor
+        return condicion
+
+    def _filtro_cursor(self, datos, hacia_atras):
+        # None si los valores del cursor no sirven para los campos de orden
+        valores = datos.get('v')
+        if not isinstance(valores, list) or len(valores) != len(self.orden) or None in valores:
+            return None
+        try:
+            filtro = self._desde(valores, hacia_atras)
+            # filter() prepara los valores: aquí falla un cursor alterado
+            self.queryset.filter(filtro)
+        except (ValidationError, ValueError, TypeError):
+            return None
+        return filtro
+
+    def _pagina_keyset(self, datos, total):
+        hacia_atras = bool(datos) and datos.get('d') == 'p'
+        filtro = self._filtro_cursor(datos, hacia_atras) if datos else None
+        if filtro is None:
+            if datos:
+                self._invalido()
+            datos = None
+            hacia_atras = False
+
+        filas = self._leer(self.queryset, filtro, hacia_atras)
+        hay_mas = len(filas) > self.per_page
+        filas = filas[:self.per_page]
+        if hacia_atras:
+            filas.reverse()
+
+        if not filas:
+            if datos is not None:
+                return self._pagina_keyset(None, total)
+            return PaginaCursor(filas, None, None, total)
+        hay_siguiente = hay_mas if not hacia_atras else True
+        hay_anterior = hay_mas if hacia_atras else datos is not None
+        return PaginaCursor(
+            filas,
+            codificar_cursor({'d': 'n', 'v': self._valores(filas[-1])}) if hay_siguiente else None,
+            codificar_cursor({'d': 'p', 'v': self._valores(filas[0])}) if hay_anterior else None,
+            total,
+        )
+
+    def _leer(self, queryset, filtro, hacia_atras):
+        # per_page + 1 filas desde el cursor, en el orden de recorrido
+        if filtro is not None:
+            queryset = queryset.filter(filtro)
+        if hacia_atras:
+            queryset = queryset.reverse()
+        return list(queryset[:self.per_page + 1])
+
+    # Cursor por offset
+
+    def _pagina_offset(self, datos, total):
+        offset = datos.get('o', 0) if datos else 0
+        if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+            self._invalido()
+            offset = 0
+        filas = list(self.queryset[offset:offset + self.per_page + 1])
+        hay_siguiente = len(filas) > self.per_page
+        return PaginaCursor(
+            filas[:self.per_page],
+            codificar_cursor({'o': offset + self.per_page}) if hay_siguiente else None,
+            codificar_cursor({'o': max(offset - self.per_page, 0)}) if offset else None,
+            total,
+        )
+
+
+class KeysetPaginatorUnion(KeysetPaginator):
+    """
+    Pagina varios querysets con los mismos campos de ``orden`` como si fueran
+    uno solo (p. ej. una tabla y su archivo, con ids que no se repiten entre
+    ellos). Cada página lee per_page + 1 filas de cada queryset desde el
+    cursor y las mezcla en Python; el cursor es el mismo que el de
+    KeysetPaginator.
+    """
+
+    def __init__(self, querysets, per_page, orden, total=TOTALES):
+        super().__init__(querysets[0], per_page, orden=orden, total=total)
+        self.otros = [KeysetPaginator(queryset, per_page, orden=orden).queryset for queryset in querysets[1:]]
+
+    def _contar(self):
+        return sum(contar_cacheado(queryset) for queryset in [self.queryset, *self.otros])
+
+    def _comparar(self, a, b):
+        for (nombre, descendente), x, y in zip(self._campos(), self._valores(a), self._valores(b)):
+            if x != y:
+                return (-1 if x < y else 1) * (-1 if descendente else 1)
+        return 0
+
+    def _leer(self, queryset, filtro, hacia_atras):
+        filas = []
+        for actual in [queryset, *self.otros]:
+            filas.extend(super()._leer(actual, filtro, hacia_atras))
+        filas.sort(key=functools.cmp_to_key(self._comparar), reverse=hacia_atras)
+        return filas[:self.per_page + 1]
@@ -0,0 +1,110 @@
+"""
+Lecturas en réplicas para las vistas de consulta del CRM.
+
+ReplicaMiddleware elige una réplica (CRM_REPLICAS) para los GET de las vistas
+de VISTAS_REPLICA y ReplicaRouter dirige a ella las lecturas de ese pedido.
+Todo lo demás (escrituras, formularios, admin, comandos) va a la base
+principal. Después de un POST el navegador recibe una cookie que fija sus
+lecturas a la principal durante CRM_REPLICA_VENTANA segundos, para que vea
+sus propios cambios aunque la réplica vaya atrasada.
+
+Las exportaciones quedan fuera: su respuesta se lee después de que el
+middleware termina, cuando ya no hay réplica elegida.
+"""
+import contextvars
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+VISTAS_REPLICA = {
+    'crm_dashboard',
+    'contactos_list',
+    'contacto_detail',
+    'oportunidades_list',
+    'oportunidades_pipeline',
+    'actividades_list',
+    'api_lista',
+    'api_detalle',
+}
+COOKIE_PRINCIPAL = 'crm_principal_hasta'
+
+_alias_lectura = contextvars.ContextVar('alias_lectura', default=None)
+
+
+def _replicas():
+    return getattr(settings, 'CRM_REPLICAS', [])
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return _alias_lectura.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Las réplicas tienen los mismos datos que la principal
+        bases = {'default', *_replicas()}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas se copian de la principal, no se migran
+        if db in _replicas():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _alias_lectura.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _alias_lectura.reset(token)
+        return self._fijar_principal(request, response)
+
+    async def __acall__(self, request):
+        token = _alias_lectura.set(None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _alias_lectura.reset(token)
+        return self._fijar_principal(request, response)
+
+    def _fijar_principal(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and _replicas():
+            ventana = getattr(settings, 'CRM_REPLICA_VENTANA', 5)
+            response.set_cookie(
+                COOKIE_PRINCIPAL, str(int(time.time() + ventana)), max_age=ventana, httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replicas = _replicas()
+        if not replicas or request.method not in ('GET', 'HEAD'):
+            return None
+        if request.resolver_match is None or request.resolver_match.url_name not in VISTAS_REPLICA:
+            return None
+        try:
+            hasta = int(request.COOKIES.get(COOKIE_PRINCIPAL, 0))
+        except ValueError:
+            hasta = 0
+        if hasta > time.time():
+            return None
+        _alias_lectura.set(random.choice(replicas))
+        return None
@@ -0,0 +1,190 @@
+"""
+Índice de búsqueda de texto completo para Contacto.
+
+En SQLite se usa una tabla virtual FTS5 y en PostgreSQL una tabla con un
+tsvector y un índice GIN. Ambas son tablas auxiliares cuya clave es el id
+del contacto; las mantienen al día las señales de home/signals.py, por medio
+de las tareas de home/tareas.py (en el acto o con run_worker, según
+CRM_TAREAS). En cualquier otro motor se vuelve a la búsqueda con icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Contacto
+
+TABLA_SQLITE = 'home_contacto_fts'
+TABLA_POSTGRES = 'home_contacto_busqueda'
+
+_PALABRA = re.compile(r'\w+', re.UNICODE)
+
+
+def _terminos(texto):
+    return _PALABRA.findall(texto.lower())
+
+
+def _documento(nombre, correo, telefono, empresa):
+    return [nombre or '', correo or '', telefono or '', empresa or '']
+
+
+class BusquedaSqlite:
+    tabla = TABLA_SQLITE
+
+    def crear(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.tabla} USING fts5("
+            "nombre, correo, telefono, empresa, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def eliminar_tabla(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.tabla}')
+
+    def expresion(self, texto):
+        # Cada término se busca como prefijo y todos deben aparecer
+        return ' '.join(f'"{termino}"*' for termino in _terminos(texto))
+
+    def filtrar(self, queryset, texto):
+        return queryset.extra(
+            tables=[self.tabla],
+            where=[f'{self.tabla}.rowid = home_contacto.id', f'{self.tabla} MATCH %s'],
+            params=[self.expresion(texto)],
+            select={'rango_busqueda': f'bm25({self.tabla}, 10.0, 4.0, 4.0, 1.0)'},
+        )
+
+    def ordenar_por_rango(self, queryset):
+        # bm25() devuelve valores más bajos para los mejores resultados; los pesos
+        # por columna (nombre > correo, teléfono > empresa) siguen los de PostgreSQL
+        return queryset.extra(order_by=['rango_busqueda', 'nombre'])
+
+    def indexar(self, cursor, filas):
+        ids = [fila[0] for fila in filas]
+        self.borrar(cursor, ids)
+        cursor.executemany(
+            f'INSERT INTO {self.tabla} (rowid, nombre, correo, telefono, empresa) VALUES (%s, %s, %s, %s, %s)',
+            [[fila[0]] + _documento(*fila[1:]) for fila in filas],
+        )
+
+    def borrar(self, cursor, ids):
+        cursor.executemany(f'DELETE FROM {self.tabla} WHERE rowid = %s', [[i] for i in ids])
+
+    def poblar(self, cursor):
+        cursor.execute(f'DELETE FROM {self.tabla}')
+        cursor.execute(
+            f'INSERT INTO {self.tabla} (rowid, nombre, correo, telefono, empresa) '
+            "SELECT c.id, c.nombre, c.correo, COALESCE(c.telefono, ''), COALESCE(e.nombre, '') "
+            'FROM home_contacto c LEFT JOIN home_empresa e ON e.id = c.empresa_id'
+        )
+
+
+class BusquedaPostgres:
+    tabla = TABLA_POSTGRES
+    vector = (
+        "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'B') || setweight(to_tsvector('simple', %s), 'C')"
+    )
+
+    def crear(self, cursor):
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.tabla} ('
+            'contacto_id integer PRIMARY KEY REFERENCES home_contacto (id) ON DELETE CASCADE '
+            'DEFERRABLE INITIALLY DEFERRED, documento tsvector NOT NULL)'
+        )
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {self.tabla}_gin ON {self.tabla} USING gin (documento)')
+
+    def eliminar_tabla(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.tabla}')
+
+    def expresion(self, texto):
+        return ' & '.join(f'{termino}:*' for termino in _terminos(texto))
+
+    def filtrar(self, queryset, texto):
+        return queryset.extra(
+            tables=[self.tabla],
+            where=[f'{self.tabla}.contacto_id = home_contacto.id', f"{self.tabla}.documento @@ to_tsquery('simple', %s)"],
+            params=[self.expresion(texto)],
+            select={'rango_busqueda': f"ts_rank({self.tabla}.documento, to_tsquery('simple', %s))"},
+            select_params=[self.expresion(texto)],
+        )
+
+    def ordenar_por_rango(self, queryset):
+        return queryset.extra(order_by=['-rango_busqueda', 'nombre'])
+
+    def indexar(self, cursor, filas):
+        cursor.executemany(
+            f'INSERT INTO {self.tabla} (contacto_id, documento) VALUES (%s, {self.vector}) '
+            'ON CONFLICT (contacto_id) DO UPDATE SET documento = EXCLUDED.documento',
+            [[fila[0]] + _documento(*fila[1:]) for fila in filas],
+        )
+
+    def borrar(self, cursor, ids):
+        cursor.execute(f'DELETE FROM {self.tabla} WHERE contacto_id = ANY(%s)', [list(ids)])
+
+    def poblar(self, cursor):
+        cursor.execute(f'TRUNCATE {self.tabla}')
+        cursor.execute(
+            f'INSERT INTO {self.tabla} (contacto_id, documento) '
+            "SELECT c.id, " + self.vector.replace('%s', "COALESCE({}, '')").format(
+                'c.nombre', 'c.correo', 'c.telefono', 'e.nombre'
+            ) + ' FROM home_contacto c LEFT JOIN home_empresa e ON e.id = c.empresa_id'
+        )
+
+
+BACKENDS = {
+    'sqlite': BusquedaSqlite(),
+    'postgresql': BusquedaPostgres(),
+}
+
+
+def backend(conexion=None):
+    return BACKENDS.get((conexion or connection).vendor)
+
+
+def buscar_contactos(queryset, texto, ordenar=True):
+    """Filtra el queryset de contactos por texto y, si se pide, lo ordena por relevancia."""
+    busqueda = backend()
+    if busqueda is None:
+        return queryset.filter(
+            Q(nombre__icontains=texto) |
+            Q(correo__icontains=texto) |
+            Q(telefono__icontains=texto) |
+            Q(empresa__nombre__icontains=texto)
+        )
+    if not _terminos(texto):
+        # Solo signos ('@@'): nada que buscar, no toda la tabla
+        return queryset.none()
+    queryset = busqueda.filtrar(queryset, texto)
+    return busqueda.ordenar_por_rango(queryset) if ordenar else queryset
+
+
+def _filas(contactos):
+    return contactos.order_by().values_list('id', 'nombre', 'correo', 'telefono', 'empresa__nombre')
+
+
+def indexar_contactos(contactos):
+    """Agrega o reemplaza en el índice los contactos del queryset."""
+    busqueda = backend()
+    if busqueda is None:
+        return 0
+    filas = [list(fila) for fila in _filas(contactos)]
+    if filas:
+        with connection.cursor() as cursor:
+            busqueda.indexar(cursor, filas)
+    return len(filas)
+
+
+def borrar_contactos(ids):
+    busqueda = backend()
+    if busqueda is not None and ids:
+        with connection.cursor() as cursor:
+            busqueda.borrar(cursor, list(ids))
+
+
+def reconstruir_indice():
+    """Vacía el índice y lo vuelve a llenar desde home_contacto en una sola sentencia."""
+    busqueda = backend()
+    if busqueda is None:
+        return 0
+    with connection.cursor() as cursor:
+        busqueda.poblar(cursor)
+    return Contacto.objects.count()
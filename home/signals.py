@@ -0,0 +1,341 @@
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import analitica, contadores, listas
+from .fragmentos import invalidar
+from .instrumentacion import guardar_pendientes, medir_consulta
+from .models import Actividad, CambioEstado, Contacto, Empresa, Etiqueta, Oportunidad
+from .tareas import encolar
+from .stats import CLAVE_CONTACTOS, aplicar_delta, clave_oportunidades
+
+
+# Acumulados del dashboard (CrmStats)
+
+@receiver(post_save, sender=Contacto)
+def contacto_guardado(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        aplicar_delta(CLAVE_CONTACTOS, cantidad=1)
+
+
+@receiver(post_delete, sender=Contacto)
+def contacto_eliminado(sender, instance, **kwargs):
+    aplicar_delta(CLAVE_CONTACTOS, cantidad=-1)
+
+
+CAMPOS_STATS = {'estado', 'valor'}
+
+
+def _sin_cambios(update_fields, campos):
+    # save() con update_fields (CamposModificadosMixin) que no toca ``campos``
+    return update_fields is not None and not campos & set(update_fields)
+
+
+def _original(instance, *campos):
+    """Valores de ``campos`` al leer la fila (CamposModificadosMixin), o None si no se cargaron."""
+    originales = getattr(instance, '_originales', {})
+    if all(campo in originales for campo in campos):
+        return tuple(originales[campo] for campo in campos)
+    return None
+
+
+@receiver(pre_save, sender=Oportunidad)
+def oportunidad_antes_de_guardar(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._stats_anterior = None
+    if instance.pk and not raw and not _sin_cambios(update_fields, CAMPOS_STATS):
+        instance._stats_anterior = _original(instance, 'estado', 'valor') or (
+            Oportunidad.objects.filter(pk=instance.pk).values_list('estado', 'valor').first()
+        )
+
+
+@receiver(post_save, sender=Oportunidad)
+def oportunidad_guardada(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or _sin_cambios(update_fields, CAMPOS_STATS):
+        return
+    anterior = getattr(instance, '_stats_anterior', None)
+    valor_actual = _valor(instance)
+    if anterior:
+        estado, valor = anterior
+        if estado == instance.estado and valor == valor_actual:
+            return
+        aplicar_delta(clave_oportunidades(estado), cantidad=-1, valor=-valor)
+    aplicar_delta(clave_oportunidades(instance.estado), cantidad=1, valor=valor_actual)
+
+
+@receiver(post_delete, sender=Oportunidad)
+def oportunidad_eliminada(sender, instance, **kwargs):
+    aplicar_delta(clave_oportunidades(instance.estado), cantidad=-1, valor=-_valor(instance))
+
+
+def _valor(oportunidad):
+    # Las vistas asignan el valor tal como llega en request.POST
+    return Oportunidad._meta.get_field('valor').to_python(oportunidad.valor)
+
+
+# Historia de estados y analítica del embudo (home/analitica.py)
+
+CAMPOS_ANALITICA = {'estado', 'valor', 'fecha_estimada_cierre'}
+
+
+@receiver(post_save, sender=Oportunidad)
+def oportunidad_cambio_estado(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or _sin_cambios(update_fields, CAMPOS_ANALITICA):
+        return
+    # oportunidad_antes_de_guardar ya leyó el estado anterior
+    anterior = getattr(instance, '_stats_anterior', None)
+    if created or (anterior and anterior[0] != instance.estado):
+        CambioEstado.objects.create(
+            oportunidad_id=instance.pk, numero_oportunidad=instance.pk, estado_anterior=anterior[0] if anterior else '',
+            estado=instance.estado, valor=_valor(instance),
+        )
+    analitica.invalidar()
+
+
+@receiver(post_delete, sender=Oportunidad)
+def oportunidad_eliminada_analitica(sender, instance, **kwargs):
+    analitica.invalidar()
+
+
+# Contadores por contacto (home/contadores.py)
+
+CAMPOS_CONTADOR_OPORTUNIDAD = {'contacto', 'contacto_id', 'estado', 'valor'}
+CAMPOS_CONTADOR_ACTIVIDAD = {'contacto', 'contacto_id', 'fecha'}
+
+
+def _contacto_id(instance):
+    # Las vistas asignan contacto_id como texto de request.POST
+    return type(instance)._meta.get_field('contacto').to_python(instance.contacto_id)
+
+
+@receiver(pre_save, sender=Oportunidad)
+def oportunidad_contador_anterior(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._contador_anterior = None
+    if instance.pk and not raw and not _sin_cambios(update_fields, CAMPOS_CONTADOR_OPORTUNIDAD):
+        instance._contador_anterior = _original(instance, 'contacto_id', 'estado', 'valor') or (
+            Oportunidad.objects.filter(pk=instance.pk).values_list('contacto_id', 'estado', 'valor').first()
+        )
+
+
+@receiver(post_save, sender=Oportunidad)
+def oportunidad_contador(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or _sin_cambios(update_fields, CAMPOS_CONTADOR_OPORTUNIDAD):
+        return
+    deltas = {}
+    contadores.sumar_oportunidad(deltas, getattr(instance, '_contador_anterior', None), -1)
+    contadores.sumar_oportunidad(deltas, (_contacto_id(instance), instance.estado, _valor(instance)), 1)
+    contadores.ajustar(deltas)
+
+
+@receiver(post_delete, sender=Oportunidad)
+def oportunidad_eliminada_contador(sender, instance, origin=None, **kwargs):
+    if not contadores.por_borrado_de_contacto(origin):
+        deltas = {}
+        contadores.sumar_oportunidad(deltas, (instance.contacto_id, instance.estado, _valor(instance)), -1)
+        contadores.ajustar(deltas)
+
+
+@receiver(pre_save, sender=Actividad)
+def actividad_contador_anterior(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._contador_anterior = None
+    if instance.pk and not raw and not _sin_cambios(update_fields, CAMPOS_CONTADOR_ACTIVIDAD):
+        instance._contador_anterior = _original(instance, 'contacto_id') or (
+            Actividad.objects.filter(pk=instance.pk).values_list('contacto_id').first()
+        )
+
+
+@receiver(post_save, sender=Actividad)
+def actividad_contador(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or _sin_cambios(update_fields, CAMPOS_CONTADOR_ACTIVIDAD):
+        return
+    deltas = {}
+    anterior = getattr(instance, '_contador_anterior', None)
+    if created or anterior:
+        contadores.sumar_actividades(deltas, anterior[0] if anterior else None, -1)
+        contadores.sumar_actividades(deltas, _contacto_id(instance), 1)
+    # La fecha pudo cambiar: la última actividad se vuelve a leer del índice
+    contadores.ajustar(deltas, ultima={_contacto_id(instance), anterior[0] if anterior else None})
+
+
+@receiver(post_delete, sender=Actividad)
+def actividad_eliminada_contador(sender, instance, origin=None, **kwargs):
+    if not contadores.por_borrado_de_contacto(origin):
+        contadores.ajustar({instance.contacto_id: (0, 0, -1)}, ultima={instance.contacto_id})
+
+
+# Índice de búsqueda de contactos (home/search.py), por la cola de home/tareas.py
+
+@receiver(post_save, sender=Contacto)
+def indexar_contacto(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and not _sin_cambios(update_fields, {'nombre', 'correo', 'telefono', 'empresa', 'empresa_id'}):
+        encolar('indexar_contacto', clave=f'indexar_contacto:{instance.pk}', contacto_id=instance.pk)
+
+
+@receiver(post_delete, sender=Contacto)
+def desindexar_contacto(sender, instance, **kwargs):
+    encolar('desindexar_contactos', contactos_ids=[instance.pk])
+
+
+@receiver(pre_save, sender=Empresa)
+def empresa_antes_de_guardar(sender, instance, raw=False, **kwargs):
+    instance._nombre_anterior = None
+    if instance.pk and not raw:
+        original = _original(instance, 'nombre')
+        instance._nombre_anterior = original[0] if original else (
+            Empresa.objects.filter(pk=instance.pk).values_list('nombre', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Empresa)
+def reindexar_empresa(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw and instance._nombre_anterior != instance.nombre:
+        encolar('indexar_empresa', clave=f'indexar_empresa:{instance.pk}', empresa_id=instance.pk)
+
+
+@receiver(pre_delete, sender=Empresa)
+def empresa_antes_de_eliminar(sender, instance, **kwargs):
+    # Los contactos quedan con empresa nula (SET_NULL) sin emitir señales propias
+    instance._contactos_ids = list(instance.contactos.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Empresa)
+def reindexar_empresa_eliminada(sender, instance, **kwargs):
+    ids = getattr(instance, '_contactos_ids', [])
+    if ids:
+        encolar('indexar_lista', contactos_ids=ids)
+        # El SET_NULL no toca fecha_actualizacion (fragmentos y ETag de la API)
+        Contacto.objects.filter(pk__in=ids).update(fecha_actualizacion=timezone.now())
+
+
+# Versiones de la caché de fragmentos (home/fragmentos.py). Los cambios del
+# propio objeto ya cambian su fecha_actualizacion; aquí se cubren los datos
+# relacionados que muestran los fragmentos.
+
+@receiver(post_save, sender=Empresa)
+def empresa_guardada_fragmentos(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw and instance._nombre_anterior != instance.nombre:
+        invalidar('empresa')
+
+
+@receiver(post_delete, sender=Empresa)
+def empresa_eliminada_fragmentos(sender, instance, **kwargs):
+    invalidar('empresa')
+
+
+@receiver(post_save, sender=Etiqueta)
+def etiqueta_guardada_fragmentos(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        invalidar('etiqueta')
+
+
+@receiver(post_delete, sender=Etiqueta)
+def etiqueta_eliminada_fragmentos(sender, instance, **kwargs):
+    invalidar('etiqueta')
+
+
+@receiver(post_save, sender=Contacto)
+def contacto_guardado_fragmentos(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Las tarjetas del pipeline muestran el nombre del contacto
+    if not created and not raw and not _sin_cambios(update_fields, {'nombre'}):
+        invalidar('contacto')
+
+
+@receiver(pre_delete, sender=Etiqueta)
+def etiqueta_antes_de_eliminar(sender, instance, **kwargs):
+    # El CASCADE sobre la tabla intermedia no emite m2m_changed
+    instance._contactos_ids = list(instance.contactos.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Etiqueta)
+def etiqueta_eliminada_contactos(sender, instance, **kwargs):
+    ids = getattr(instance, '_contactos_ids', [])
+    if ids:
+        Contacto.objects.filter(pk__in=ids).update(fecha_actualizacion=timezone.now())
+
+
+@receiver(m2m_changed, sender=Contacto.etiquetas.through)
+def etiquetas_de_contacto_cambiadas(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._contactos_ids = list(instance.contactos.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action != 'post_clear' and not pk_set:
+        return
+    if reverse:
+        # Desde una etiqueta: pueden ser muchos contactos
+        invalidar('etiqueta')
+        ids = instance.__dict__.pop('_contactos_ids', []) if action == 'post_clear' else pk_set
+        contactos = Contacto.objects.filter(pk__in=ids)
+    else:
+        contactos = Contacto.objects.filter(pk=instance.pk)
+    # Las etiquetas también cambian el contacto (fragmentos y ETag de la API)
+    contactos.update(fecha_actualizacion=timezone.now())
+
+
+# Generaciones de la caché de listas (home/listas.py)
+
+@receiver(post_save, sender=Contacto)
+@receiver(post_delete, sender=Contacto)
+def contacto_cambiado_listas(sender, **kwargs):
+    listas.invalidar('contacto')
+
+
+@receiver(post_save, sender=Empresa)
+@receiver(post_delete, sender=Empresa)
+def empresa_cambiada_listas(sender, **kwargs):
+    listas.invalidar('empresa')
+
+
+@receiver(post_save, sender=Etiqueta)
+@receiver(post_delete, sender=Etiqueta)
+def etiqueta_cambiada_listas(sender, **kwargs):
+    listas.invalidar('etiqueta')
+
+
+@receiver(m2m_changed, sender=Contacto.etiquetas.through)
+def etiquetas_de_contacto_listas(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        listas.invalidar('contacto')
+
+
+@receiver(post_save, sender=Oportunidad)
+@receiver(post_delete, sender=Oportunidad)
+def oportunidad_cambiada_listas(sender, **kwargs):
+    listas.invalidar('oportunidad')
+
+
+@receiver(post_save, sender=Actividad)
+@receiver(post_delete, sender=Actividad)
+def actividad_cambiada_listas(sender, **kwargs):
+    listas.invalidar('actividad')
+
+
+# Ajustes de SQLite por conexión (CRM_SQLITE_PRAGMAS en settings.py)
+
+@receiver(connection_created)
+def configurar_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, valor in getattr(settings, 'CRM_SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {valor}')
+
+
+# Medición de consultas (home/instrumentacion.py); la lista de wrappers es del
+# objeto de conexión y sobrevive a las reconexiones
+
+@receiver(connection_created)
+def instrumentar_conexion(sender, connection, **kwargs):
+    if medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(medir_consulta)
+
+
+# Muestras de InstrumentacionMiddleware: se escriben después de responder.
+# Sin muestreo no se acumula nada y no se toca la base.
+
+@receiver(request_finished)
+def guardar_muestras(sender, **kwargs):
+    if getattr(settings, 'CRM_INSTRUMENTACION_MUESTREO', 0) > 0:
+        guardar_pendientes()
@@ -0,0 +1,75 @@
+// Autocompletado (home/crm/_autocompletar.html): consulta el endpoint
+// mientras se escribe y guarda el id elegido en el campo oculto
+document.querySelectorAll('.autocompletar').forEach(function(campo) {
+    var entrada = campo.querySelector('input[type="text"]');
+    var lista = campo.querySelector('datalist');
+    var multiple = campo.dataset.multiple !== undefined;
+    var oculto = multiple ? null : campo.querySelector('input[type="hidden"]');
+    var opciones = {};
+    var espera;
+
+    function seleccionar(resultado) {
+        if (!multiple) {
+            oculto.value = resultado.id;
+            entrada.value = resultado.texto;
+            return;
+        }
+        var seleccion = campo.querySelector('.autocompletar-seleccion');
+        if (seleccion.querySelector('input[value="' + resultado.id + '"]')) {
+            entrada.value = '';
+            return;
+        }
+        var chip = document.createElement('span');
+        chip.className = 'tag';
+        if (resultado.color) {
+            chip.style.backgroundColor = resultado.color + '20';
+            chip.style.color = resultado.color;
+        }
+        chip.appendChild(document.createTextNode(resultado.texto + ' '));
+        var valor = document.createElement('input');
+        valor.type = 'hidden';
+        valor.name = campo.dataset.nombre;
+        valor.value = resultado.id;
+        chip.appendChild(valor);
+        var quitar = document.createElement('a');
+        quitar.href = '#';
+        quitar.className = 'autocompletar-quitar';
+        quitar.innerHTML = '&times;';
+        chip.appendChild(quitar);
+        seleccion.appendChild(chip);
+        entrada.value = '';
+    }
+
+    entrada.addEventListener('input', function() {
+        if (opciones[entrada.value]) {
+            seleccionar(opciones[entrada.value]);
+            return;
+        }
+        if (oculto) {
+            oculto.value = '';
+        }
+        clearTimeout(espera);
+        espera = setTimeout(function() {
+            fetch(campo.dataset.url + '?q=' + encodeURIComponent(entrada.value))
+                .then(function(response) { return response.json(); })
+                .then(function(data) {
+                    lista.innerHTML = '';
+                    opciones = {};
+                    data.resultados.forEach(function(resultado) {
+                        var texto = resultado.detalle ? resultado.texto + ' - ' + resultado.detalle : resultado.texto;
+                        var opcion = document.createElement('option');
+                        opcion.value = texto;
+                        lista.appendChild(opcion);
+                        opciones[texto] = resultado;
+                    });
+                });
+        }, 200);
+    });
+
+    campo.addEventListener('click', function(event) {
+        if (event.target.classList.contains('autocompletar-quitar')) {
+            event.preventDefault();
+            event.target.parentNode.remove();
+        }
+    });
+});
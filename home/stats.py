@@ -0,0 +1,85 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import Contacto, CrmStats, Oportunidad
+
+CLAVE_CONTACTOS = 'contactos'
+PREFIJO_OPORTUNIDADES = 'oportunidades:'
+
+
+def clave_oportunidades(estado):
+    return f'{PREFIJO_OPORTUNIDADES}{estado}'
+
+
+def aplicar_delta(clave, cantidad=0, valor=0):
+    """Suma cantidad y valor al acumulado de la clave con un UPDATE atómico."""
+    if not cantidad and not valor:
+        return
+    cambios = {'cantidad': F('cantidad') + cantidad, 'valor': F('valor') + valor}
+    if not CrmStats.objects.filter(clave=clave).update(**cambios):
+        CrmStats.objects.get_or_create(clave=clave)
+        CrmStats.objects.filter(clave=clave).update(**cambios)
+
+
+def calcular_estadisticas(contactos=None, oportunidades=None):
+    """Calcula los acumulados desde las tablas, recorriéndolas completas."""
+    contactos = contactos if contactos is not None else Contacto.objects.all()
+    oportunidades = oportunidades if oportunidades is not None else Oportunidad.objects.all()
+    estadisticas = {CLAVE_CONTACTOS: (contactos.count(), Decimal('0'))}
+    for fila in oportunidades.order_by().values('estado').annotate(cantidad=Count('id'), valor=Sum('valor')):
+        estadisticas[clave_oportunidades(fila['estado'])] = (fila['cantidad'], fila['valor'] or Decimal('0'))
+    return estadisticas
+
+
+def leer_estadisticas():
+    return {
+        clave: (cantidad, valor)
+        for clave, cantidad, valor in CrmStats.objects.values_list('clave', 'cantidad', 'valor')
+    }
+
+
+def reconstruir_estadisticas():
+    estadisticas = calcular_estadisticas()
+    with transaction.atomic():
+        CrmStats.objects.all().delete()
+        CrmStats.objects.bulk_create([
+            CrmStats(clave=clave, cantidad=cantidad, valor=valor)
+            for clave, (cantidad, valor) in estadisticas.items()
+        ])
+    return estadisticas
+
+
+def diferencias_estadisticas():
+    """Devuelve [(clave, acumulado, real)] para cada clave que no coincide."""
+    acumuladas = leer_estadisticas()
+    reales = calcular_estadisticas()
+    vacio = (0, Decimal('0'))
+    diferencias = []
+    for clave in sorted(set(acumuladas) | set(reales)):
+        acumulada = acumuladas.get(clave, vacio)
+        real = reales.get(clave, vacio)
+        if acumulada[0] != real[0] or Decimal(acumulada[1]) != Decimal(real[1]):
+            diferencias.append((clave, acumulada, real))
+    return diferencias
+
+
+def resumen_dashboard():
+    estadisticas = leer_estadisticas()
+    por_estado = []
+    total_oportunidades = 0
+    valor_total = Decimal('0')
+    for estado, _ in Oportunidad.ESTADO_CHOICES:
+        cantidad, valor = estadisticas.get(clave_oportunidades(estado), (0, Decimal('0')))
+        total_oportunidades += cantidad
+        if estado != 'perdido':
+            valor_total += valor
+        if cantidad:
+            por_estado.append({'estado': estado, 'count': cantidad})
+    return {
+        'total_contactos': estadisticas.get(CLAVE_CONTACTOS, (0, 0))[0],
+        'total_oportunidades': total_oportunidades,
+        'valor_total_oportunidades': valor_total,
+        'oportunidades_por_estado': por_estado,
+    }
@@ -0,0 +1,186 @@
+"""
+Cola de tareas en la base de datos, sin intermediario externo.
+
+Las vistas y señales llaman a encolar() con el nombre de una tarea
+registrada y argumentos serializables en JSON. Con CRM_TAREAS='cola' se
+inserta una fila de Tarea, dentro de la misma transacción que la escritura
+que la origina, y el comando run_worker la ejecuta después en un pool de
+procesos. Con CRM_TAREAS='inmediato' (por omisión fuera de producción) la
+tarea se ejecuta en el acto, como antes de existir la cola.
+
+Reclamar tareas es un solo UPDATE condicionado al estado, así dos workers
+no toman la misma fila. Una tarea reclamada tiene un plazo
+(CRM_TAREAS_PLAZO); si el worker muere, vuelve a estar disponible al
+vencer. Los fallos se reintentan con espera exponencial
+(CRM_TAREAS_ESPERA_BASE * 2 ** (intentos - 1) segundos) hasta
+CRM_TAREAS_REINTENTOS intentos; después la fila queda como fallida. Un plazo
+vencido cuenta como fallo: la tarea que tumba a su worker en el último
+intento también queda fallida.
+
+La clave de idempotencia de encolar() solo agrupa tareas pendientes. Una
+tarea en curso ya leyó sus datos, así que la misma clave vuelve a encolarse
+para recoger los cambios posteriores; las tareas terminadas se borran.
+"""
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .listas import invalidar
+from .models import Contacto, Tarea
+from .search import borrar_contactos, indexar_contactos, reconstruir_indice
+from .stats import reconstruir_estadisticas
+
+logger = logging.getLogger(__name__)
+
+# Nombre -> función registrada con @tarea
+REGISTRO = {}
+
+
+def tarea(funcion):
+    """Registra ``funcion`` como tarea con su nombre."""
+    REGISTRO[funcion.__name__] = funcion
+    return funcion
+
+
+def modo():
+    return getattr(settings, 'CRM_TAREAS', 'inmediato')
+
+
+def encolar(nombre, clave=None, **argumentos):
+    """
+    Encola la tarea ``nombre`` con ``argumentos`` y devuelve su Tarea (None
+    si se ejecutó en el acto). Con ``clave``, si ya hay una tarea pendiente
+    con la misma clave no se agrega otra: se devuelve la existente. Las
+    tareas en curso o ya terminadas no cuentan.
+    """
+    if nombre not in REGISTRO:
+        raise ValueError(f'Tarea desconocida: {nombre}')
+    if modo() == 'inmediato':
+        REGISTRO[nombre](**argumentos)
+        return None
+    datos = {
+        'nombre': nombre, 'argumentos': argumentos, 'clave': clave,
+        'max_intentos': getattr(settings, 'CRM_TAREAS_REINTENTOS', 5),
+    }
+    if clave is None:
+        return Tarea.objects.create(**datos)
+    existente = Tarea.objects.filter(clave=clave, estado='pendiente').first()
+    if existente is not None:
+        return existente
+    try:
+        with transaction.atomic():
+            return Tarea.objects.create(**datos)
+    except IntegrityError:
+        # Otro pedido la encoló entre la lectura y el INSERT
+        return Tarea.objects.filter(clave=clave, estado='pendiente').first()
+
+
+def reclamar(cantidad, trabajador=None):
+    """Marca como en curso hasta ``cantidad`` tareas disponibles y las devuelve."""
+    trabajador = trabajador or uuid.uuid4().hex
+    ahora = timezone.now()
+    vencidas = Q(estado='en_curso', reclamada_hasta__lt=ahora)
+    agotadas = Tarea.objects.filter(vencidas, intentos__gte=F('max_intentos')).update(
+        estado='fallida', error='Venció el plazo en el último intento; el worker no terminó la tarea.',
+        reclamada_por='', reclamada_hasta=None, fecha_actualizacion=ahora,
+    )
+    if agotadas:
+        logger.warning('%d tareas quedaron fallidas al vencer el plazo de su último intento', agotadas)
+    disponibles = (
+        Q(estado='pendiente', disponible_desde__lte=ahora) | (vencidas & Q(intentos__lt=F('max_intentos')))
+    )
+    candidatas = Tarea.objects.filter(disponibles).order_by('disponible_desde', 'id').values('id')[:cantidad]
+    # El filtro se repite fuera de la subconsulta: si otro worker tomó la
+    # fila entre medio, el UPDATE ya no la alcanza
+    Tarea.objects.filter(disponibles, id__in=candidatas).update(
+        estado='en_curso', reclamada_por=trabajador, intentos=F('intentos') + 1,
+        reclamada_hasta=ahora + timedelta(seconds=getattr(settings, 'CRM_TAREAS_PLAZO', 300)),
+        fecha_actualizacion=ahora,
+    )
+    return list(Tarea.objects.filter(estado='en_curso', reclamada_por=trabajador).order_by('disponible_desde', 'id'))
+
+
+def ejecutar(nombre, argumentos):
+    """Corre una tarea; devuelve None si terminó bien o el traceback del error."""
+    try:
+        REGISTRO[nombre](**argumentos)
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def ejecutar_en_proceso(nombre, argumentos):
+    """ejecutar() para el pool de run_worker: cada proceso hijo cuida su propia conexión."""
+    close_old_connections()
+    try:
+        return ejecutar(nombre, argumentos)
+    finally:
+        close_old_connections()
+
+
+def terminar(tarea, error=None):
+    """Registra el resultado de una tarea reclamada: se borra, se reintenta o queda fallida."""
+    propia = Tarea.objects.filter(pk=tarea.pk, estado='en_curso', reclamada_por=tarea.reclamada_por)
+    if error is None:
+        propia.delete()
+        return
+    logger.warning('La tarea %s (%s) falló en el intento %d:\n%s', tarea.pk, tarea.nombre, tarea.intentos, error)
+    ahora = timezone.now()
+    if tarea.intentos >= tarea.max_intentos:
+        propia.update(estado='fallida', error=error, reclamada_por='', reclamada_hasta=None, fecha_actualizacion=ahora)
+        return
+    espera = getattr(settings, 'CRM_TAREAS_ESPERA_BASE', 5) * 2 ** (tarea.intentos - 1)
+    try:
+        with transaction.atomic():
+            propia.update(
+                estado='pendiente', error=error, reclamada_por='', reclamada_hasta=None,
+                disponible_desde=ahora + timedelta(seconds=espera), fecha_actualizacion=ahora,
+            )
+    except IntegrityError:
+        # Ya se encoló otra con la misma clave mientras corría; esa la reemplaza
+        propia.delete()
+
+
+# Tareas del CRM. Las del índice de búsqueda cambian la generación de
+# contactos de home/listas.py: con la cola el índice se actualiza después
+# de la escritura que ya la había cambiado.
+
+@tarea
+def indexar_contacto(contacto_id):
+    indexar_contactos(Contacto.objects.filter(pk=contacto_id))
+    invalidar('contacto')
+
+
+@tarea
+def indexar_empresa(empresa_id):
+    indexar_contactos(Contacto.objects.filter(empresa_id=empresa_id))
+    invalidar('contacto')
+
+
+@tarea
+def indexar_lista(contactos_ids):
+    indexar_contactos(Contacto.objects.filter(id__in=contactos_ids))
+    invalidar('contacto')
+
+
+@tarea
+def desindexar_contactos(contactos_ids):
+    borrar_contactos(contactos_ids)
+    invalidar('contacto')
+
+
+@tarea
+def reconstruir_busqueda():
+    reconstruir_indice()
+    invalidar('contacto')
+
+
+@tarea
+def reconstruir_acumulados():
+    reconstruir_estadisticas()
@@ -1,3 +1,1659 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib.util
+import json
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import analitica, exportacion, instrumentacion, listas, lotes, tareas, views
+from .archivo import alcanza_archivo, archivar_lote, horizonte
+from .arranque import TIEMPOS, plantillas_de_home, preparar_worker
+from .fragmentos import versiones
+from .generador import GeneradorCrm, vaciar_crm
+from .instrumentacion import Medicion, huella, reporte_vistas
+from .models import (
+    Contacto, CrmStats, Empresa, Etiqueta, Oportunidad, CambioEstado, Actividad, ActividadArchivada, MuestraVista, Tarea,
+)
+from .pagination import CursorInvalido, KeysetPaginator, codificar_cursor
+from .replicas import COOKIE_PRINCIPAL, ReplicaMiddleware, ReplicaRouter
+from .search import buscar_contactos
+from .stats import diferencias_estadisticas, resumen_dashboard
+from .urls import urlpatterns
+
+
+def crear_datos_crm(n):
+    """Crea n contactos con empresa, etiquetas, una oportunidad y una actividad cada uno."""
+    empresa = Empresa.objects.create(nombre='Acme')
+    etiquetas = [Etiqueta.objects.create(nombre=f'etiqueta-{i}') for i in range(2)]
+    for i in range(n):
+        contacto = Contacto.objects.create(
+            nombre=f'Contacto {i:03d}', correo=f'c{i}@example.com', empresa=empresa,
+        )
+        contacto.etiquetas.set(etiquetas)
+        oportunidad = Oportunidad.objects.create(
+            titulo=f'Oportunidad {i}', valor=100 + i, estado='nuevo',
+            fecha_estimada_cierre=date(2026, 1, 1), contacto=contacto,
+        )
+        Actividad.objects.create(
+            tipo='llamada', titulo=f'Llamada {i}', contacto=contacto, oportunidad=oportunidad,
+        )
+
+
+# Sin muestras de instrumentación: estas pruebas cuentan consultas
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=0)
+class ConsultasPorPaginaTests(TestCase):
+    """El número de consultas por página no debe crecer con el número de filas."""
+
+    # Vista -> consultas esperadas por página
+    CONSULTAS = {
+        'crm_dashboard': 2,
+        'contactos_list': 3,
+        'oportunidades_list': 2,
+        # El GROUP BY de totales y una consulta de tarjetas por estado
+        'oportunidades_pipeline': 1 + len(Oportunidad.ESTADO_CHOICES),
+        'actividades_list': 2,
+        # Los formularios ya no cargan tablas completas para sus listas
+        'contacto_create': 0,
+        'oportunidad_create': 0,
+        'actividad_create': 0,
+    }
+
+    def setUp(self):
+        cache.clear()
+        caches['listas'].clear()
+
+    def assertConsultasFijas(self, filas):
+        crear_datos_crm(filas)
+        for vista, consultas in self.CONSULTAS.items():
+            with self.subTest(vista=vista, filas=filas):
+                with self.assertNumQueries(consultas):
+                    response = self.client.get(reverse(vista))
+                self.assertEqual(response.status_code, 200)
+
+    def test_pocas_filas(self):
+        self.assertConsultasFijas(2)
+
+    def test_pagina_completa(self):
+        self.assertConsultasFijas(25)
+
+    def test_contacto_detail(self):
+        crear_datos_crm(3)
+        contacto = Contacto.objects.first()
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('contacto_detail', args=[contacto.pk]))
+        self.assertContains(response, 'Acme')
+
+
+class PipelineTests(TestCase):
+
+    def setUp(self):
+        crear_datos_crm(25)
+        Oportunidad.objects.filter(titulo__in=['Oportunidad 0', 'Oportunidad 1']).update(estado='ganado')
+
+    def test_columnas_con_totales_y_limite(self):
+        response = self.client.get(reverse('oportunidades_pipeline'))
+        columnas = {c['codigo']: c for c in response.context['columnas']}
+        self.assertEqual(columnas['nuevo']['count'], 23)
+        self.assertEqual(len(columnas['nuevo']['oportunidades']), views.PIPELINE_TARJETAS_POR_COLUMNA)
+        self.assertTrue(columnas['nuevo']['hay_mas'])
+        self.assertEqual(columnas['ganado']['count'], 2)
+        self.assertEqual(columnas['ganado']['total'], 201)
+        self.assertFalse(columnas['ganado']['hay_mas'])
+        self.assertEqual(columnas['perdido']['count'], 0)
+
+    def test_columna_json_pagina_el_resto(self):
+        url = reverse('oportunidades_pipeline_columna', args=['nuevo'])
+        data = self.client.get(url, {'offset': views.PIPELINE_TARJETAS_POR_COLUMNA}).json()
+        self.assertEqual(len(data['oportunidades']), 3)
+        self.assertIsNone(data['siguiente_offset'])
+
+        data = self.client.get(url, {'offset': 0, 'limite': 10}).json()
+        self.assertEqual(len(data['oportunidades']), 10)
+        self.assertEqual(data['siguiente_offset'], 10)
+
+    def test_columna_json_estado_invalido(self):
+        response = self.client.get(reverse('oportunidades_pipeline_columna', args=['otro']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_tarjetas_por_indice_sin_recorrer_la_tabla(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse('oportunidades_pipeline'))
+        tarjetas = [c['sql'] for c in consultas.captured_queries if ' LIMIT ' in c['sql']]
+        self.assertEqual(len(tarjetas), len(Oportunidad.ESTADO_CHOICES))
+        for sql in tarjetas:
+            with connection.cursor() as cursor:
+                cursor.execute(connection.ops.explain_query_prefix() + ' ' + sql)
+                plan = [str(fila[-1]) for fila in cursor.fetchall()]
+            with self.subTest(sql=sql[:120]):
+                self.assertNotIn('SCAN home_oportunidad', plan, 'recorrido completo sin índice')
+                self.assertTrue([paso for paso in plan if 'oport_estado_fecha_idx' in paso], plan)
+                self.assertFalse([paso for paso in plan if 'TEMP B-TREE' in paso], plan)
+
+
+class CrmStatsTests(TestCase):
+
+    def setUp(self):
+        crear_datos_crm(3)
+
+    def test_acumulados_coinciden_tras_cambios(self):
+        oportunidad = Oportunidad.objects.first()
+        oportunidad.estado = 'ganado'
+        oportunidad.valor = '250.50'
+        oportunidad.save()
+        Oportunidad.objects.last().delete()
+        Contacto.objects.create(nombre='Nuevo', correo='nuevo@example.com')
+        # Eliminar un contacto elimina en cascada sus oportunidades
+        Contacto.objects.get(nombre='Contacto 001').delete()
+
+        self.assertEqual(diferencias_estadisticas(), [])
+        resumen = resumen_dashboard()
+        self.assertEqual(resumen['total_contactos'], 3)
+        self.assertEqual(resumen['total_oportunidades'], 1)
+        self.assertEqual(resumen['valor_total_oportunidades'], Decimal('250.50'))
+
+    def test_check_y_reconstruccion(self):
+        CrmStats.objects.filter(clave='contactos').update(cantidad=99)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_crm_stats', '--check', stdout=StringIO())
+        call_command('rebuild_crm_stats', stdout=StringIO())
+        call_command('rebuild_crm_stats', '--check', stdout=StringIO())
+        self.assertEqual(resumen_dashboard()['total_contactos'], 3)
+
+
+class BusquedaContactosTests(TestCase):
+
+    def setUp(self):
+        self.empresa = Empresa.objects.create(nombre='Lumen Industrias')
+        Contacto.objects.create(nombre='José Pérez', correo='jose@perez.mx', empresa=self.empresa)
+        Contacto.objects.create(nombre='Ana Gómez', correo='ana@otra.com', telefono='5551234')
+        Contacto.objects.create(nombre='Josefina Ruiz', correo='fina@otra.com')
+
+    def buscar(self, texto):
+        response = self.client.get(reverse('contactos_list'), {'q': texto})
+        return [contacto.nombre for contacto in response.context['page_obj']]
+
+    def test_prefijo_sin_acentos(self):
+        self.assertCountEqual(self.buscar('jose'), ['José Pérez', 'Josefina Ruiz'])
+        self.assertEqual(self.buscar('perez jos'), ['José Pérez'])
+
+    def test_solo_signos_no_lista_todo(self):
+        self.assertEqual(self.buscar('@@'), [])
+        self.assertEqual(len(self.buscar('')), 3)
+
+    def test_correo_telefono_y_empresa(self):
+        self.assertCountEqual(self.buscar('otra'), ['Ana Gómez', 'Josefina Ruiz'])
+        self.assertEqual(self.buscar('555'), ['Ana Gómez'])
+        self.assertEqual(self.buscar('lumen'), ['José Pérez'])
+
+    def test_ordena_por_relevancia(self):
+        Contacto.objects.create(nombre='Lumen Soporte', correo='soporte@example.com')
+        self.assertEqual(self.buscar('lumen'), ['Lumen Soporte', 'José Pérez'])
+
+    def test_indice_sigue_a_empresa_y_contacto(self):
+        self.empresa.nombre = 'Aurora'
+        self.empresa.save()
+        self.assertEqual(self.buscar('lumen'), [])
+        self.assertEqual(self.buscar('aurora'), ['José Pérez'])
+
+        self.empresa.delete()
+        self.assertEqual(self.buscar('aurora'), [])
+
+        Contacto.objects.get(nombre='Ana Gómez').delete()
+        self.assertEqual(self.buscar('otra'), ['Josefina Ruiz'])
+
+    def test_reconstruir_indice(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.buscar('jose@perez'), ['José Pérez'])
+
+
+class PaginacionCursorTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        crear_datos_crm(7)
+        # Fechas repetidas: el id debe desempatar sin saltar ni repetir filas
+        fecha = timezone.now()
+        Actividad.objects.filter(id__lte=4).update(fecha=fecha)
+
+    def recorrer(self, paginator):
+        vistos = []
+        pagina = paginator.get_page(None)
+        paginas = [pagina]
+        vistos.extend(pagina)
+        while pagina.has_next():
+            pagina = paginator.get_page(pagina.next_cursor)
+            paginas.append(pagina)
+            vistos.extend(pagina)
+        return vistos, paginas
+
+    def test_recorre_adelante_y_atras(self):
+        queryset = Actividad.objects.all()
+        esperado = list(queryset.order_by('-fecha', '-id'))
+        paginator = KeysetPaginator(queryset, 3, orden=('-fecha', '-id'))
+        vistos, paginas = self.recorrer(paginator)
+        self.assertEqual(vistos, esperado)
+        self.assertEqual([len(p) for p in paginas], [3, 3, 1])
+        self.assertFalse(paginas[0].has_previous())
+        self.assertEqual(paginas[0].total, 7)
+
+        anterior = paginator.get_page(paginas[-1].previous_cursor)
+        self.assertEqual(list(anterior), list(paginas[1]))
+        primera = paginator.get_page(anterior.previous_cursor)
+        self.assertEqual(list(primera), list(paginas[0]))
+        self.assertFalse(primera.has_previous())
+
+    def test_offset_para_ordenes_sin_clave(self):
+        queryset = Contacto.objects.order_by('empresa__nombre', 'nombre', 'id')
+        vistos, _ = self.recorrer(KeysetPaginator(queryset, 3, total=False))
+        self.assertEqual(vistos, list(queryset))
+
+    def test_cursor_invalido_vuelve_al_inicio(self):
+        response = self.client.get(reverse('actividades_list'), {'cursor': 'no-es-un-cursor', 'tipo': 'llamada'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 7)
+        self.assertEqual(response.context['filtros'], 'tipo=llamada')
+
+    def test_cursor_alterado(self):
+        # Se decodifica bien pero sus valores no sirven para los campos de orden
+        casos = [
+            ('actividades_list', ['abc', 'x']),
+            ('contactos_list', ['a', 'x']),
+            ('oportunidades_list', [None, None]),
+            ('oportunidades_list', ['2026-01-01T00:00:00+00:00']),
+            ('actividades_list', 'abc'),
+        ]
+        for vista, valores in casos:
+            cursor = codificar_cursor({'d': 'n', 'v': valores})
+            with self.subTest(vista=vista, valores=valores):
+                response = self.client.get(reverse(vista), {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.context['page_obj'].has_previous())
+
+        cursor = codificar_cursor({'d': 'n', 'v': ['a', 'zz']})
+        response = self.client.get(reverse('api_lista', args=['contactos']), {'cursor': cursor})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('api_lista', args=['contactos']), {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, 400)
+        paginator = KeysetPaginator(Contacto.objects.all(), 3, total=False, estricto=True)
+        with self.assertRaises(CursorInvalido):
+            paginator.get_page(codificar_cursor({'o': -3}))
+
+    def test_total_opcional(self):
+        pagina = KeysetPaginator(Contacto.objects.all(), 3, orden=('nombre', 'id'), total=False).get_page(None)
+        self.assertIsNone(pagina.total)
+        self.assertTrue(pagina.has_next())
+
+
+@skipUnlessDBFeature('supports_explaining_query_execution')
+# Sin muestras de instrumentación: estas pruebas cuentan consultas
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=0)
+class PlanesDeConsultaTests(TestCase):
+    """Las consultas de las listas deben usar índices para filtrar y ordenar."""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_datos_crm(25)
+        cls.empresa = Empresa.objects.get()
+        cls.contacto = Contacto.objects.order_by('id').first()
+        cls.oportunidad = Oportunidad.objects.order_by('id').first()
+
+    def setUp(self):
+        cache.clear()
+        caches['listas'].clear()
+
+    def casos(self):
+        """(vista, args, parámetros, tablas cuyas consultas se revisan)."""
+        # El filtro por etiqueta se omite: parte de la tabla intermedia y el
+        # orden depende de las estadísticas del planificador.
+        empresa, contacto, oportunidad = self.empresa.pk, self.contacto.pk, self.oportunidad.pk
+        return [
+            ('contactos_list', [], {}, ['home_contacto', 'home_empresa']),
+            ('contactos_list', [], {'empresa': empresa}, ['home_contacto']),
+            ('contactos_list', [], {'orden': 'actividad'}, ['home_contacto', 'home_empresa']),
+            ('oportunidades_list', [], {}, ['home_oportunidad', 'home_contacto']),
+            ('oportunidades_list', [], {'estado': 'nuevo'}, ['home_oportunidad']),
+            ('oportunidades_list', [], {'contacto': contacto}, ['home_oportunidad']),
+            ('actividades_list', [], {}, ['home_actividad', 'home_contacto', 'home_oportunidad']),
+            ('actividades_list', [], {'completadas': 'no'}, ['home_actividad']),
+            ('actividades_list', [], {'tipo': 'llamada'}, ['home_actividad']),
+            ('actividades_list', [], {'fecha_desde': '2020-01-01', 'fecha_hasta': '2030-01-01'}, ['home_actividad']),
+            ('actividades_list', [], {'contacto': contacto}, ['home_actividad']),
+            ('actividades_list', [], {'oportunidad': oportunidad}, ['home_actividad']),
+            ('contacto_detail', [contacto], {}, ['home_oportunidad', 'home_actividad']),
+            ('autocompletar', ['empresas'], {'q': 'ac'}, ['home_empresa']),
+            ('autocompletar', ['oportunidades'], {'q': 'oport'}, ['home_oportunidad']),
+        ]
+
+    def plan(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(connection.ops.explain_query_prefix() + ' ' + sql, params)
+            return [str(fila[-1]) for fila in cursor.fetchall()]
+
+    def test_sin_recorridos_completos_ni_ordenamientos_temporales(self):
+        for vista, args, params, tablas in self.casos():
+            with CaptureQueriesContext(connection) as consultas:
+                self.client.get(reverse(vista, args=args), params)
+            for consulta in consultas.captured_queries:
+                sql = consulta['sql']
+                tabla = next((t for t in tablas if f' FROM "{t}"' in sql), None)
+                if tabla is None or not sql.startswith('SELECT'):
+                    continue
+                # El SQL capturado ya trae los parámetros interpolados
+                plan = self.plan(sql, None)
+                with self.subTest(vista=vista, params=params, sql=sql[:120]):
+                    self.assertNotIn(f'SCAN {tabla}', plan, 'recorrido completo sin índice')
+                    self.assertFalse(
+                        [paso for paso in plan if 'TEMP B-TREE' in paso],
+                        f'ordenamiento temporal: {plan}',
+                    )
+
+
+# Sin muestras de instrumentación: estas pruebas cuentan consultas
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=0)
+class AutocompletarTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        crear_datos_crm(15)
+        Empresa.objects.create(nombre='acero del norte')
+        Empresa.objects.create(nombre='Bravo')
+
+    def resultados(self, modelo, **params):
+        response = self.client.get(reverse('autocompletar', args=[modelo]), params)
+        self.assertEqual(response.status_code, 200)
+        return [r['texto'] for r in response.json()['resultados']]
+
+    def test_prefijo_sin_distinguir_mayusculas(self):
+        self.assertEqual(self.resultados('empresas', q='AC'), ['acero del norte', 'Acme'])
+        self.assertEqual(self.resultados('empresas', q='cme'), [])
+        self.assertEqual(self.resultados('etiquetas', q='etiq'), ['etiqueta-0', 'etiqueta-1'])
+
+    def test_limite(self):
+        self.assertEqual(len(self.resultados('contactos', q='contacto')), views.AUTOCOMPLETAR_LIMITE)
+        self.assertEqual(len(self.resultados('oportunidades', q='oport', limite=3)), 3)
+        self.assertEqual(len(self.resultados('contactos', limite=1000)), 15)
+
+    def test_respuesta_en_cache(self):
+        self.resultados('contactos', q='contacto 01')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.resultados('contactos', q='contacto 01')), 5)
+
+    def test_modelo_invalido(self):
+        response = self.client.get(reverse('autocompletar', args=['productos']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_formulario_muestra_seleccion_actual(self):
+        actividad = Actividad.objects.select_related('contacto', 'oportunidad').first()
+        response = self.client.get(reverse('actividad_edit', args=[actividad.pk]))
+        self.assertContains(response, f'value="{actividad.contacto.nombre}"')
+        self.assertContains(response, f'value="{actividad.oportunidad.titulo}"')
+        # Solo el contacto elegido, no la tabla completa
+        self.assertNotContains(response, 'Contacto 000')
+
+
+class ImportacionContactosTests(TestCase):
+
+    CSV = (
+        'nombre,correo,telefono,empresa,etiquetas\n'
+        'Ana Gómez,ana@example.com,555,Acme,vip;norte\n'
+        'Luis Mora,luis@example.com,,acme,VIP\n'
+        'Sin Correo,,,,\n'
+        'Marta Ríos,marta@example.com,,Nueva SA,\n'
+    )
+
+    def setUp(self):
+        Empresa.objects.create(nombre='Acme')
+        Etiqueta.objects.create(nombre='vip')
+
+    def test_comando_csv_en_lotes(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as archivo:
+            archivo.write(self.CSV)
+        self.addCleanup(os.remove, archivo.name)
+        salida = StringIO()
+        call_command('import_contactos', archivo.name, '--lote', '2', stdout=salida, stderr=StringIO())
+        self.assertIn('3 contactos creados de 4 filas (1 errores)', salida.getvalue())
+
+        ana = Contacto.objects.get(correo='ana@example.com')
+        self.assertEqual(ana.empresa.nombre, 'Acme')
+        self.assertCountEqual([e.nombre for e in ana.etiquetas.all()], ['vip', 'norte'])
+        self.assertEqual(Contacto.objects.get(correo='luis@example.com').empresa_id, ana.empresa_id)
+        self.assertEqual(Empresa.objects.count(), 2)
+        self.assertEqual(Etiqueta.objects.count(), 2)
+        # Los acumulados y el índice de búsqueda incluyen los contactos importados
+        self.assertEqual(diferencias_estadisticas(), [])
+        response = self.client.get(reverse('contactos_list'), {'q': 'marta'})
+        self.assertEqual([c.nombre for c in response.context['page_obj']], ['Marta Ríos'])
+
+    def test_subida_jsonl_reporta_errores(self):
+        contenido = (
+            '{"nombre": "Ana", "correo": "ana@example.com", "etiquetas": ["vip"]}\n'
+            'no es json\n'
+            '{"nombre": "Luis", "correo": "correo-invalido"}\n'
+            '{"nombre": 5, "correo": "cinco@example.com"}\n'
+            '{"nombre": "Eva", "correo": "eva@example.com", "etiquetas": [1, "vip"]}\n'
+            '{"nombre": "Sol", "correo": "sol@example.com", "telefono": {"casa": "555"}}\n'
+        ).encode()
+        response = self.client.post(reverse('contactos_importar'), {
+            'formato': 'jsonl',
+            'archivo': SimpleUploadedFile('contactos.jsonl', contenido),
+        })
+        resultado = response.context['resultado']
+        self.assertEqual(resultado.creados, 1)
+        self.assertEqual([linea for linea, _ in resultado.errores], [2, 3, 4, 5, 6])
+        self.assertEqual(Contacto.objects.get().etiquetas.get().nombre, 'vip')
+
+
+# Sin muestras de instrumentación: estas pruebas cuentan consultas
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=0)
+class ExportacionTests(TestCase):
+
+    def setUp(self):
+        crear_datos_crm(3)
+
+    def _contenido(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_contactos_csv_respeta_filtros(self):
+        otra = Empresa.objects.create(nombre='Otra')
+        Contacto.objects.create(nombre='Fuera', correo='fuera@example.com', empresa=otra)
+        empresa = Empresa.objects.get(nombre='Acme')
+        response = self.client.get(reverse('contactos_exportar'), {'empresa': empresa.pk})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="contactos-', response['Content-Disposition'])
+
+        filas = list(csv.DictReader(StringIO(self._contenido(response))))
+        self.assertEqual([fila['nombre'] for fila in filas], ['Contacto 000', 'Contacto 001', 'Contacto 002'])
+        self.assertEqual(filas[0]['empresa'], 'Acme')
+        self.assertEqual(sorted(filas[0]['etiquetas'].split(';')), ['etiqueta-0', 'etiqueta-1'])
+
+    def test_contactos_busqueda(self):
+        response = self.client.get(reverse('contactos_exportar'), {'q': 'contacto 001'})
+        filas = list(csv.DictReader(StringIO(self._contenido(response))))
+        self.assertEqual([fila['nombre'] for fila in filas], ['Contacto 001'])
+
+    def test_jsonl_por_accept(self):
+        Oportunidad.objects.filter(titulo='Oportunidad 1').update(estado='ganado')
+        response = self.client.get(
+            reverse('oportunidades_exportar'), {'estado': 'ganado'}, HTTP_ACCEPT='application/x-ndjson',
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        filas = [json.loads(linea) for linea in self._contenido(response).splitlines()]
+        self.assertEqual(len(filas), 1)
+        self.assertEqual(filas[0]['titulo'], 'Oportunidad 1')
+        self.assertEqual(filas[0]['contacto'], 'Contacto 001')
+        self.assertEqual(filas[0]['valor'], '101.00')
+
+    def test_actividades_formato_explicito(self):
+        Actividad.objects.filter(titulo='Llamada 2').update(completada=True)
+        response = self.client.get(
+            reverse('actividades_exportar'), {'completadas': 'si', 'formato': 'jsonl'}, HTTP_ACCEPT='text/csv',
+        )
+        filas = [json.loads(linea) for linea in self._contenido(response).splitlines()]
+        self.assertEqual([(fila['titulo'], fila['oportunidad']) for fila in filas], [('Llamada 2', 'Oportunidad 2')])
+
+    def test_consultas_no_dependen_del_tamano(self):
+        # Una consulta por bloque de contactos más el prefetch de sus etiquetas
+        with CaptureQueriesContext(connection) as consultas:
+            filas = list(exportacion.filas_contactos(Contacto.objects.order_by('id'), tamano_bloque=2))
+        self.assertEqual(len(filas), 3)
+        self.assertLessEqual(len(consultas), 4)
+
+
+# Sin muestras de instrumentación: estas pruebas cuentan consultas
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=0)
+class ApiTests(TestCase):
+
+    def setUp(self):
+        crear_datos_crm(5)
+
+    def test_campos_y_relaciones_con_consultas_constantes(self):
+        url = reverse('api_lista', args=['contactos'])
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url, {'fields': 'nombre', 'embed': 'empresa,etiquetas', 'limit': 3})
+        # La página, la empresa y las etiquetas: una consulta por relación
+        self.assertEqual(len(consultas), 3)
+        datos = response.json()
+        self.assertEqual(list(datos['resultados'][0]), ['id', 'nombre', 'empresa', 'etiquetas'])
+        self.assertEqual(datos['resultados'][0]['nombre'], 'Contacto 000')
+        self.assertEqual(datos['resultados'][0]['empresa']['nombre'], 'Acme')
+        self.assertEqual([e['nombre'] for e in datos['resultados'][0]['etiquetas']], ['etiqueta-0', 'etiqueta-1'])
+
+        siguiente = self.client.get(url, {'fields': 'nombre', 'limit': 3, 'cursor': datos['siguiente']}).json()
+        self.assertEqual([c['nombre'] for c in siguiente['resultados']], ['Contacto 003', 'Contacto 004'])
+        self.assertIsNone(siguiente['siguiente'])
+
+    def test_filtros_de_la_lista(self):
+        Oportunidad.objects.filter(titulo='Oportunidad 2').update(estado='ganado')
+        response = self.client.get(reverse('api_lista', args=['oportunidades']), {'estado': 'ganado', 'embed': 'contacto'})
+        resultados = response.json()['resultados']
+        self.assertEqual([(o['titulo'], o['valor'], o['contacto']['nombre']) for o in resultados], [
+            ('Oportunidad 2', '102.00', 'Contacto 002'),
+        ])
+
+    def test_etag_y_304(self):
+        contacto = Contacto.objects.get(nombre='Contacto 001')
+        url = reverse('api_detalle', args=['contactos', contacto.pk])
+        response = self.client.get(url, {'embed': 'empresa'})
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url, {'embed': 'empresa'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # Sin cargar la relación ni serializar
+        self.assertEqual(len(consultas), 1)
+
+        # Otra representación u otra versión de la empresa cambian el ETag
+        self.assertNotEqual(self.client.get(url, {'fields': 'nombre'})['ETag'], etag)
+        contacto.empresa.telefono = '5550000'
+        contacto.empresa.save()
+        self.assertEqual(self.client.get(url, {'embed': 'empresa'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_con_etiquetas_y_empresa_eliminada(self):
+        contacto = Contacto.objects.get(nombre='Contacto 001')
+        url = reverse('api_detalle', args=['contactos', contacto.pk])
+
+        def etag(**params):
+            return self.client.get(url, params)['ETag']
+
+        con_etiquetas = etag(embed='etiquetas')
+        etiqueta = contacto.etiquetas.first()
+        etiqueta.color = '#000000'
+        etiqueta.save()
+        self.assertNotEqual(etag(embed='etiquetas'), con_etiquetas)
+
+        con_etiquetas = etag(embed='etiquetas')
+        etiqueta.delete()
+        self.assertNotEqual(etag(embed='etiquetas'), con_etiquetas)
+
+        # El SET_NULL de la empresa cambia aunque no se pida la relación
+        sin_relaciones = etag(fields='nombre,empresa_id')
+        contacto.empresa.delete()
+        self.assertNotEqual(etag(fields='nombre,empresa_id'), sin_relaciones)
+
+    def test_errores(self):
+        self.assertEqual(self.client.get(reverse('api_lista', args=['contactos']), {'fields': 'clave'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_lista', args=['contactos']), {'embed': 'actividades'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_lista', args=['productos'])).status_code, 404)
+        for recurso, params in [('contactos', {'empresa': 'abc'}), ('oportunidades', {'contacto': 'x'}),
+                                ('actividades', {'oportunidad': 'y'})]:
+            with self.subTest(recurso=recurso, params=params):
+                response = self.client.get(reverse('api_lista', args=[recurso]), params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        self.assertEqual(self.client.get(reverse('api_detalle', args=['empresas', 999])).status_code, 404)
+        self.assertEqual(self.client.post(reverse('api_lista', args=['empresas'])).status_code, 405)
+
+
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=1, CRM_INSTRUMENTACION_LOTE=1, CRM_INSTRUMENTACION_DIAS=0)
+class InstrumentacionTests(TestCase):
+
+    def setUp(self):
+        instrumentacion._pendientes.clear()
+        instrumentacion._ultima_purga = None
+
+    def test_muestra_por_vista(self):
+        crear_datos_crm(3)
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse('contactos_list'))
+        muestra = MuestraVista.objects.get()
+        self.assertEqual(muestra.vista, 'contactos_list')
+        self.assertEqual((muestra.metodo, muestra.estado), ('GET', 200))
+        # Todas menos el INSERT de la propia muestra, ya fuera de la medición
+        self.assertEqual(muestra.consultas, len(consultas) - 1)
+        self.assertEqual(muestra.consultas_repetidas, 0)
+        self.assertGreater(muestra.tiempo_plantillas_ms, 0)
+        self.assertGreater(muestra.tamano_respuesta, 0)
+
+    @override_settings(CRM_INSTRUMENTACION_MUESTREO=0)
+    def test_sin_muestreo(self):
+        self.client.get(reverse('contactos_list'))
+        self.assertFalse(MuestraVista.objects.exists())
+
+    @override_settings(CRM_INSTRUMENTACION_LOTE=3, CRM_INSTRUMENTACION_DIAS=7)
+    def test_escritura_por_lotes_y_purga(self):
+        vieja = MuestraVista.objects.create(
+            vista='vieja', metodo='GET', estado=200, duracion_ms=1, consultas=1, tiempo_sql_ms=1,
+            consultas_repetidas=0, tiempo_plantillas_ms=1, fecha=timezone.now() - timezone.timedelta(days=8),
+        )
+        for _ in range(2):
+            self.client.get(reverse('autocompletar', args=['empresa']))
+        # Todavía en memoria: el pedido no escribió nada
+        self.assertEqual(list(MuestraVista.objects.values_list('vista', flat=True)), ['vieja'])
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse('autocompletar', args=['empresa']))
+        self.assertEqual(MuestraVista.objects.filter(vista='autocompletar').count(), 3)
+        self.assertEqual(sum(c['sql'].startswith('INSERT') for c in consultas), 1)
+        self.assertFalse(MuestraVista.objects.filter(pk=vieja.pk).exists())
+
+        # Un lote incompleto se escribe al vencer la espera
+        self.client.get(reverse('autocompletar', args=['empresa']))
+        instrumentacion._pendientes[0].fecha -= timezone.timedelta(minutes=5)
+        self.client.get(reverse('autocompletar', args=['empresa']))
+        self.assertEqual(MuestraVista.objects.count(), 5)
+
+    def test_consultas_repetidas(self):
+        self.assertEqual(
+            huella('SELECT * FROM t WHERE id IN (%s, %s, %s) LIMIT 21'),
+            'SELECT * FROM t WHERE id IN (...) LIMIT ?',
+        )
+        crear_datos_crm(3)
+        medicion = Medicion()
+        with connection.execute_wrapper(medicion):
+            for contacto in Contacto.objects.all():
+                contacto.empresa.nombre
+        self.assertEqual(medicion.consultas, 4)
+        repetidas, peor = medicion.repetidas()
+        self.assertEqual(repetidas, 2)
+        self.assertTrue(peor.startswith('3x SELECT'))
+
+    def test_reporte_por_p95(self):
+        for vista, duraciones in [('rapida', [1, 2, 3]), ('lenta', [5, 6, 90])]:
+            for duracion in duraciones:
+                MuestraVista.objects.create(
+                    vista=vista, metodo='GET', estado=200, duracion_ms=duracion, consultas=2,
+                    tiempo_sql_ms=1, consultas_repetidas=0, tiempo_plantillas_ms=1, tamano_respuesta=100,
+                )
+        filas = reporte_vistas()
+        self.assertEqual([(fila['vista'], fila['p95_ms']) for fila in filas], [('lenta', 90), ('rapida', 3)])
+
+        salida = StringIO()
+        call_command('slow_views', stdout=salida)
+        self.assertLess(salida.getvalue().index('lenta'), salida.getvalue().index('rapida'))
+        # La misma ventana que el admin: horas enteras, acotadas
+        for horas in ['inf', 'nan', '1e20']:
+            with self.subTest(horas=horas), self.assertRaises(CommandError):
+                call_command('slow_views', '--horas', horas, stdout=StringIO())
+        for horas in ['0', '99999999999999999999']:
+            with self.subTest(horas=horas):
+                salida = StringIO()
+                call_command('slow_views', '--horas', horas, stdout=salida)
+                self.assertIn('lenta', salida.getvalue())
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.client.login(username='admin', password='clave')
+        response = self.client.get(reverse('admin:home_muestravista_reporte'))
+        self.assertContains(response, 'lenta')
+        for horas, esperadas in [('inf', 24), ('nan', 24), ('1e20', 24), ('0', 1), ('99999999999999999999', 24 * 90)]:
+            with self.subTest(horas=horas):
+                response = self.client.get(reverse('admin:home_muestravista_reporte'), {'horas': horas})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['horas'], esperadas)
+
+
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=0)
+class GeneradorYBenchmarkTests(TestCase):
+
+    def _generar(self):
+        referencia = timezone.now().replace(microsecond=0)
+        GeneradorCrm(semilla=7, tamano_lote=10, referencia=referencia).generar(25)
+        return (
+            list(Contacto.objects.order_by('id').values_list('nombre', 'correo', 'telefono')),
+            list(Oportunidad.objects.order_by('id').values_list('titulo', 'valor', 'estado')),
+            Actividad.objects.count(),
+            Contacto.etiquetas.through.objects.count(),
+        )
+
+    def test_generador_reproducible(self):
+        primera = self._generar()
+        self.assertEqual(len(primera[0]), 25)
+        self.assertEqual(Empresa.objects.count(), 1)
+        self.assertEqual(diferencias_estadisticas(), [])
+
+        vaciar_crm()
+        self.assertFalse(Contacto.objects.exists())
+        self.assertEqual(self._generar(), primera)
+        # El índice de búsqueda se reconstruyó con los contactos generados
+        nombre = primera[0][0][0]
+        response = self.client.get(reverse('autocompletar', args=['contactos']), {'q': nombre})
+        self.assertIn(nombre, [r['texto'] for r in response.json()['resultados']])
+
+    def test_benchmark_guarda_y_compara(self):
+        call_command('generate_crm_data', '30', stdout=StringIO())
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as archivo:
+            pass
+        self.addCleanup(os.remove, archivo.name)
+        opciones = {'repeticiones': 1, 'calentamiento': 1, 'stdout': StringIO(), 'stderr': StringIO()}
+        call_command('benchmark_routes', guardar=archivo.name, **opciones)
+        with open(archivo.name) as f:
+            base = json.load(f)
+        self.assertEqual(set(base['rutas']), {patron.name for patron in urlpatterns})
+        self.assertTrue(all(medida['estado'] < 400 for medida in base['rutas'].values()))
+        # Las rutas que escriben se revierten
+        self.assertEqual(diferencias_estadisticas(), [])
+
+        base['rutas']['contactos_list']['consultas'] = 0
+        with open(archivo.name, 'w') as f:
+            json.dump(base, f)
+        with self.assertRaisesMessage(CommandError, '1 regresiones'):
+            # Con una sola repetición la latencia es ruido: solo cuentan las consultas
+            call_command(
+                'benchmark_routes', comparar=archivo.name, rutas=['contactos_list'], umbral=1000, **opciones,
+            )
+
+
+class ConfiguracionSqliteTests(TestCase):
+
+    def test_pragmas_al_conectar(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Solo SQLite')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.CRM_SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], settings.CRM_SQLITE_PRAGMAS['cache_size'])
+
+
+@override_settings(CRM_REPLICAS=['replica_1'], CRM_REPLICA_VENTANA=5)
+class ReplicasTests(TestCase):
+
+    def _pedir(self, metodo, ruta, cookies=None):
+        """Alias de lectura que elige el router dentro de la vista, y la respuesta."""
+        elegido = {}
+
+        def vista(request):
+            middleware.process_view(request, None, (), {})
+            elegido['alias'] = ReplicaRouter().db_for_read(Contacto)
+            return HttpResponse()
+
+        middleware = ReplicaMiddleware(vista)
+        request = getattr(RequestFactory(), metodo)(ruta)
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = resolve(ruta)
+        response = middleware(request)
+        return elegido['alias'], response
+
+    def test_lecturas_de_listas_a_la_replica(self):
+        for ruta in [reverse('crm_dashboard'), reverse('contactos_list'), reverse('contacto_detail', args=[1])]:
+            self.assertEqual(self._pedir('get', ruta)[0], 'replica_1')
+        # Después de la vista ya no hay réplica elegida
+        self.assertIsNone(ReplicaRouter().db_for_read(Contacto))
+
+    def test_escrituras_y_admin_en_la_principal(self):
+        self.assertIsNone(self._pedir('get', reverse('contacto_create'))[0])
+        self.assertIsNone(self._pedir('post', reverse('contactos_list'))[0])
+        self.assertIsNone(self._pedir('get', reverse('admin:index'))[0])
+        self.assertEqual(ReplicaRouter().db_for_write(Contacto), 'default')
+        self.assertFalse(ReplicaRouter().allow_migrate('replica_1', 'home'))
+
+    def test_lee_sus_escrituras_tras_un_post(self):
+        _, response = self._pedir('post', reverse('actividad_toggle_completada', args=[1]))
+        cookie = response.cookies[COOKIE_PRINCIPAL]
+        self.assertEqual(cookie['max-age'], 5)
+        self.assertIsNone(self._pedir('get', reverse('actividades_list'), {COOKIE_PRINCIPAL: cookie.value})[0])
+        # Pasada la ventana vuelve a la réplica
+        vencida = str(int(cookie.value) - 10)
+        self.assertEqual(self._pedir('get', reverse('actividades_list'), {COOKIE_PRINCIPAL: vencida})[0], 'replica_1')
+
+    @override_settings(CRM_REPLICAS=[])
+    def test_sin_replicas(self):
+        self.assertIsNone(self._pedir('get', reverse('contactos_list'))[0])
+        _, response = self._pedir('post', reverse('contactos_list'))
+        self.assertNotIn(COOKIE_PRINCIPAL, response.cookies)
+
+
+
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=0)
+class LotesTests(TestCase):
+
+    def setUp(self):
+        crear_datos_crm(5)
+        self.oportunidades = list(Oportunidad.objects.order_by('id').values_list('id', flat=True))
+        self.actividades = list(Actividad.objects.order_by('id').values_list('id', flat=True))
+
+    def _post(self, nombre, datos):
+        return self.client.post(reverse(nombre), datos)
+
+    def test_estado_en_un_update(self):
+        Oportunidad.objects.filter(pk=self.oportunidades[0]).update(estado='ganado')
+        anterior = Oportunidad.objects.get(pk=self.oportunidades[1]).fecha_actualizacion
+        with CaptureQueriesContext(connection) as consultas:
+            response = self._post('oportunidades_lote', {
+                'accion': 'estado', 'estado': 'ganado', 'ids': ','.join(map(str, self.oportunidades[:4])),
+            })
+        self.assertEqual(response.json(), {'accion': 'estado', 'afectadas': 3})
+        updates = [c['sql'] for c in consultas.captured_queries if c['sql'].startswith('UPDATE "home_oportunidad"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Oportunidad.objects.filter(estado='ganado').count(), 4)
+        self.assertGreater(Oportunidad.objects.get(pk=self.oportunidades[1]).fecha_actualizacion, anterior)
+
+    def test_estado_mantiene_acumulados(self):
+        self._post('oportunidades_lote', {'accion': 'estado', 'estado': 'perdido', 'ids': self.oportunidades[:2]})
+        self.assertEqual(diferencias_estadisticas(), [])
+        # Valores 100 a 104; los perdidos no suman
+        self.assertEqual(resumen_dashboard()['valor_total_oportunidades'], Decimal('309'))
+
+    def test_eliminar_oportunidades(self):
+        response = self._post('oportunidades_lote', {'accion': 'eliminar', 'ids': self.oportunidades[:3]})
+        self.assertEqual(response.json()['afectadas'], 3)
+        self.assertEqual(Oportunidad.objects.count(), 2)
+        self.assertEqual(Actividad.objects.filter(oportunidad__isnull=False).count(), 2)
+        self.assertEqual(diferencias_estadisticas(), [])
+
+    def test_borrados_sin_collector_resuelven_cada_relacion(self):
+        # Una relación nueva hacia estos modelos debe resolverse en lotes.py
+        # (y agregarse a RELACIONES_RESUELTAS) antes de borrar sin Collector
+        for modelo in lotes.RELACIONES_RESUELTAS:
+            with self.subTest(modelo=modelo.__name__):
+                self.assertEqual(lotes.relaciones_sin_resolver(modelo), [])
+        with mock.patch.dict(lotes.RELACIONES_RESUELTAS, {Oportunidad: {'actividades'}}):
+            with self.assertRaises(ImproperlyConfigured):
+                lotes.eliminar_oportunidades(self.oportunidades[:1])
+        self.assertEqual(Oportunidad.objects.count(), 5)
+
+    def test_actividades(self):
+        response = self._post('actividades_lote', {'accion': 'completar', 'ids': self.actividades[:3]})
+        self.assertEqual(response.json()['afectadas'], 3)
+        self.assertEqual(Actividad.objects.filter(completada=True).count(), 3)
+        response = self._post('actividades_lote', {'accion': 'pendiente', 'ids': self.actividades})
+        self.assertEqual(response.json()['afectadas'], 3)
+        response = self._post('actividades_lote', {'accion': 'eliminar', 'ids': self.actividades[:2]})
+        self.assertEqual(response.json()['afectadas'], 2)
+        self.assertEqual(Actividad.objects.count(), 3)
+
+    def test_pedidos_no_validos(self):
+        for nombre, datos in [
+            ('oportunidades_lote', {'accion': 'estado', 'estado': 'otro', 'ids': '1'}),
+            ('oportunidades_lote', {'accion': 'mover', 'ids': '1'}),
+            ('actividades_lote', {'accion': 'completar', 'ids': 'a,b'}),
+            ('actividades_lote', {'accion': 'completar'}),
+        ]:
+            with self.subTest(datos=datos):
+                response = self._post(nombre, datos)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        self.assertEqual(self.client.get(reverse('actividades_lote')).status_code, 405)
+
+
+
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=0)
+class CamposModificadosTests(TestCase):
+
+    def setUp(self):
+        crear_datos_crm(1)
+        self.contacto = Contacto.objects.get()
+        self.datos = {
+            'nombre': self.contacto.nombre, 'correo': self.contacto.correo, 'telefono': '',
+            'empresa': str(self.contacto.empresa_id), 'notas': '',
+            'etiquetas': [str(pk) for pk in self.contacto.etiquetas.values_list('pk', flat=True)],
+        }
+        Contacto.objects.update(telefono='', notas='')
+
+    def _editar(self, nombre, pk, datos):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.post(reverse(nombre, args=[pk]), datos)
+        self.assertEqual(response.status_code, 302)
+        return [c['sql'] for c in consultas.captured_queries if not c['sql'].startswith('SELECT')]
+
+    def test_sin_cambios_no_escribe(self):
+        self.assertEqual(self._editar('contacto_edit', self.contacto.pk, self.datos), [])
+
+    def test_solo_columnas_cambiadas(self):
+        escrituras = self._editar('contacto_edit', self.contacto.pk, {**self.datos, 'nombre': 'Otro nombre'})
+        update = next(sql for sql in escrituras if sql.startswith('UPDATE "home_contacto"'))
+        self.assertIn('"nombre"', update)
+        self.assertIn('"fecha_actualizacion"', update)
+        self.assertNotIn('"notas"', update)
+        # Las etiquetas no cambiaron: ni DELETE ni INSERT en la tabla intermedia
+        self.assertFalse([sql for sql in escrituras if 'home_contacto_etiquetas' in sql])
+
+    def test_oportunidad_y_actividad(self):
+        oportunidad = Oportunidad.objects.get()
+        datos = {
+            'titulo': oportunidad.titulo, 'valor': '100.00', 'estado': 'nuevo',
+            'fecha_estimada_cierre': '2026-01-01', 'contacto': str(self.contacto.pk), 'notas': '',
+        }
+        Oportunidad.objects.update(notas='')
+        self.assertEqual(self._editar('oportunidad_edit', oportunidad.pk, datos), [])
+        escrituras = self._editar('oportunidad_edit', oportunidad.pk, {**datos, 'valor': '250.5', 'estado': 'ganado'})
+        self.assertEqual(len([sql for sql in escrituras if sql.startswith('UPDATE "home_oportunidad"')]), 1)
+        self.assertEqual(diferencias_estadisticas(), [])
+
+        actividad = Actividad.objects.get()
+        escrituras = self._editar('actividad_toggle_completada', actividad.pk, {})
+        self.assertIn('"completada"', escrituras[0])
+        self.assertNotIn('"descripcion"', escrituras[0])
+
+    def test_segundo_guardado_con_valores_de_texto(self):
+        oportunidad = Oportunidad.objects.create(
+            titulo='Texto', valor='100', estado='nuevo', fecha_estimada_cierre='2026-01-01', contacto=self.contacto,
+        )
+        oportunidad.estado = 'ganado'
+        oportunidad.save()
+        self.assertEqual(oportunidad.campos_modificados(), [])
+        self.assertEqual(diferencias_estadisticas(), [])
+
+    def test_refresh_from_db_actualiza_originales(self):
+        oportunidad = Oportunidad.objects.get()
+        Oportunidad.objects.filter(pk=oportunidad.pk).update(estado='ganado')
+        oportunidad.refresh_from_db()
+        oportunidad.estado = 'nuevo'
+        self.assertEqual(oportunidad.campos_modificados(), ['estado'])
+        oportunidad.save()
+        self.assertEqual(Oportunidad.objects.get().estado, 'nuevo')
+
+        oportunidad.refresh_from_db(fields=['estado'])
+        Oportunidad.objects.filter(pk=oportunidad.pk).update(estado='perdido')
+        oportunidad.refresh_from_db(fields=['estado'])
+        self.assertEqual(oportunidad._originales['estado'], 'perdido')
+
+
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=1, CRM_INSTRUMENTACION_LOTE=1)
+class FragmentosTests(TestCase):
+
+    def setUp(self):
+        instrumentacion._pendientes.clear()
+        caches['fragmentos'].clear()
+        crear_datos_crm(3)
+
+    def _muestra(self, ruta):
+        MuestraVista.objects.all().delete()
+        response = self.client.get(ruta)
+        return response, MuestraVista.objects.get()
+
+    def test_filas_desde_la_cache(self):
+        _, primera = self._muestra(reverse('contactos_list'))
+        self.assertEqual((primera.fragmentos_aciertos, primera.fragmentos_fallos), (0, 3))
+        response, segunda = self._muestra(reverse('contactos_list'))
+        self.assertEqual((segunda.fragmentos_aciertos, segunda.fragmentos_fallos), (3, 0))
+        self.assertContains(response, 'etiqueta-1')
+        self.assertEqual(reporte_vistas()[0]['fragmentos_aciertos'], 1)
+
+    def test_cambios_relacionados_invalidan(self):
+        self.client.get(reverse('contactos_list'))
+        empresa = Empresa.objects.get()
+        empresa.nombre = 'Acme Global'
+        empresa.save()
+        etiqueta = Etiqueta.objects.get(nombre='etiqueta-0')
+        etiqueta.nombre = 'renombrada'
+        etiqueta.save()
+        response = self.client.get(reverse('contactos_list'))
+        self.assertContains(response, 'Acme Global', count=3)
+        self.assertContains(response, 'renombrada', count=3)
+
+        contacto = Contacto.objects.get(nombre='Contacto 000')
+        contacto.etiquetas.add(Etiqueta.objects.create(nombre='nueva'))
+        response = self.client.get(reverse('contactos_list'))
+        self.assertContains(response, 'nueva', count=1)
+
+    def test_pipeline_y_dashboard(self):
+        self.client.get(reverse('oportunidades_pipeline'))
+        version = versiones()['contacto']
+        contacto = Contacto.objects.get(nombre='Contacto 001')
+        contacto.nombre = 'Renombrado'
+        contacto.save()
+        self.assertNotEqual(versiones()['contacto'], version)
+        response, muestra = self._muestra(reverse('oportunidades_pipeline'))
+        self.assertContains(response, 'Renombrado')
+        # El formulario de estado queda fuera de la caché (tres tarjetas y la
+        # plantilla de "Cargar más")
+        self.assertContains(response, 'name="estado"', count=4)
+        self.assertEqual(muestra.fragmentos_fallos, 3)
+
+        self.client.get(reverse('crm_dashboard'))
+        actividad = Actividad.objects.get(titulo='Llamada 2')
+        actividad.completada = True
+        actividad.save()
+        _, muestra = self._muestra(reverse('crm_dashboard'))
+        self.assertEqual((muestra.fragmentos_aciertos, muestra.fragmentos_fallos), (2, 1))
+
+    def test_cache_en_archivos(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            with override_settings(CACHES={
+                **settings.CACHES,
+                'fragmentos': {'BACKEND': 'home.fragmentos.FileBasedCacheMedida', 'LOCATION': directorio},
+            }):
+                self.client.get(reverse('contactos_list'))
+                _, muestra = self._muestra(reverse('contactos_list'))
+                self.assertEqual(muestra.fragmentos_aciertos, 3)
+                self.assertTrue(os.listdir(directorio))
+
+
+class ArranqueTests(TestCase):
+
+    @override_settings(CRM_PRECOMPILAR_PLANTILLAS=True)
+    def test_precompila_las_plantillas_de_home(self):
+        nombres = plantillas_de_home()
+        self.assertIn('home/crm/base.html', nombres)
+        self.assertIn('admin/home/muestravista/reporte.html', nombres)
+        preparar_worker(time.perf_counter())
+        self.assertEqual(TIEMPOS['plantillas'], len(nombres))
+        self.assertGreaterEqual(TIEMPOS['total_ms'], TIEMPOS['urlconf_ms'] + TIEMPOS['plantillas_ms'])
+
+    @override_settings(CRM_PRECOMPILAR_PLANTILLAS=False)
+    def test_sin_precompilar(self):
+        preparar_worker(time.perf_counter())
+        self.assertEqual(TIEMPOS['plantillas'], 0)
+
+
+# Las vistas asíncronas consultan desde otros hilos, con otras conexiones:
+# los datos tienen que estar confirmados
+@override_settings(ROOT_URLCONF='thelightspeed.urls_asgi', CRM_INSTRUMENTACION_MUESTREO=1, CRM_INSTRUMENTACION_LOTE=1)
+class VistasAsincronasTests(TransactionTestCase):
+
+    def setUp(self):
+        instrumentacion._pendientes.clear()
+        caches['fragmentos'].clear()
+        crear_datos_crm(3)
+
+    async def test_dashboard(self):
+        response = await self.async_client.get(reverse('crm_dashboard'))
+        self.assertContains(response, 'Llamada 2')
+        self.assertEqual(response.context['total_contactos'], 3)
+        muestra = await MuestraVista.objects.aget()
+        # CrmStats y las actividades recientes, cada una desde su hilo
+        self.assertEqual((muestra.vista, muestra.consultas), ('crm_dashboard', 2))
+
+    async def test_contacto_detail(self):
+        contacto = await Contacto.objects.aget(nombre='Contacto 001')
+        response = await self.async_client.get(reverse('contacto_detail', args=[contacto.pk]))
+        self.assertContains(response, 'Acme')
+        self.assertContains(response, 'etiqueta-1')
+        self.assertContains(response, 'Oportunidades (1)')
+        self.assertContains(response, 'Llamada 1')
+        muestra = await MuestraVista.objects.aget()
+        self.assertEqual(muestra.consultas, 4)
+
+        response = await self.async_client.get(reverse('contacto_detail', args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=0, CRM_ARCHIVO_DIAS=365)
+class ArchivoActividadesTests(TestCase):
+
+    def setUp(self):
+        crear_datos_crm(1)
+        self.contacto = Contacto.objects.get()
+        ahora = timezone.now()
+        # 30 viejas (días 400 a 429, completadas las pares) y 30 recientes
+        for dia in list(range(400, 430)) + list(range(30)):
+            Actividad.objects.create(
+                tipo='correo', titulo=f'Dia {dia}', contacto=self.contacto,
+                fecha=ahora - timezone.timedelta(days=dia), completada=dia % 2 == 0,
+            )
+
+    def _filtro(self, dias):
+        return (timezone.localdate() - timezone.timedelta(days=dias)).isoformat()
+
+    def test_archivar_por_lotes(self):
+        corte = horizonte()
+        self.assertEqual(archivar_lote(corte, 10), 10)
+        self.assertEqual(archivar_lote(corte, 10), 5)
+        self.assertEqual(archivar_lote(corte, 10), 0)
+        self.assertEqual(ActividadArchivada.objects.count(), 15)
+        self.assertFalse(Actividad.objects.filter(completada=True, fecha__lt=corte).exists())
+        # Las pendientes viejas se quedan, y el id se conserva
+        self.assertEqual(Actividad.objects.filter(fecha__lt=corte).count(), 15)
+        self.assertTrue(ActividadArchivada.objects.filter(titulo='Dia 400', completada=True).exists())
+
+    def test_comando(self):
+        salida = StringIO()
+        call_command('archive_actividades', '--lote', '4', stdout=salida)
+        self.assertIn('15 actividades archivadas en 4 lotes', salida.getvalue())
+        call_command('archive_actividades', '--dias', '10', '--lote', '4', '--max-lotes', '1', stdout=salida)
+        self.assertEqual(ActividadArchivada.objects.count(), 19)
+
+    def test_lista_solo_une_el_archivo_si_el_filtro_llega(self):
+        url = reverse('actividades_list')
+        self.assertFalse(alcanza_archivo({'fecha_desde': self._filtro(500)}))
+        call_command('archive_actividades', stdout=StringIO())
+
+        for params, alcanza in [
+            ({}, False),
+            ({'fecha_desde': self._filtro(20)}, False),
+            ({'fecha_desde': self._filtro(500), 'completadas': 'no'}, False),
+            ({'fecha_desde': self._filtro(500)}, True),
+            ({'fecha_hasta': self._filtro(20)}, True),
+        ]:
+            with self.subTest(params=params):
+                self.assertEqual(alcanza_archivo(params), alcanza)
+                with CaptureQueriesContext(connection) as consultas:
+                    self.client.get(url, params)
+                archivo = [c for c in consultas.captured_queries if 'home_actividadarchivada' in c['sql']]
+                # A lo sumo la consulta del límite del archivo, salvo que se una
+                self.assertEqual(len(archivo) > 1, alcanza)
+
+    def test_paginacion_sobre_la_union(self):
+        call_command('archive_actividades', stdout=StringIO())
+        params = {'fecha_desde': self._filtro(500)}
+        esperado = [
+            a.pk for a in sorted(
+                [*Actividad.objects.all(), *ActividadArchivada.objects.all()],
+                key=lambda a: (a.fecha, a.pk), reverse=True,
+            )
+        ]
+        vistos, cursor = [], None
+        while True:
+            response = self.client.get(reverse('actividades_list'), {**params, **({'cursor': cursor} if cursor else {})})
+            page_obj = response.context['page_obj']
+            vistos.extend(a.pk for a in page_obj)
+            self.assertEqual(page_obj.total, len(esperado))
+            if not page_obj.has_next():
+                break
+            cursor = page_obj.next_cursor
+        self.assertEqual(vistos, esperado)
+        # Y hacia atrás desde la última página
+        anterior = self.client.get(reverse('actividades_list'), {**params, 'cursor': page_obj.previous_cursor})
+        self.assertEqual([a.pk for a in anterior.context['page_obj']], esperado[40:60])
+        self.assertContains(anterior, 'Archivada')
+
+    def test_exportar_y_borrados(self):
+        call_command('archive_actividades', stdout=StringIO())
+        response = self.client.get(reverse('actividades_exportar'), {'fecha_desde': self._filtro(500)})
+        filas = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(len(filas) - 1, Actividad.objects.count() + 15)
+        # Las pendientes viejas quedan entre las archivadas: una sola secuencia por fecha
+        fecha, titulo = filas[0].index('fecha'), filas[0].index('titulo')
+        fechas = [fila[fecha] for fila in filas[1:]]
+        self.assertEqual(fechas, sorted(fechas, reverse=True))
+        viejas = [fila[titulo] for fila in filas[1:] if fila[titulo] in ('Dia 400', 'Dia 401', 'Dia 402')]
+        self.assertEqual(viejas, ['Dia 400', 'Dia 401', 'Dia 402'])
+
+        # Las archivadas siguen las cascadas de su oportunidad y su contacto
+        oportunidad = Oportunidad.objects.get()
+        ActividadArchivada.objects.filter(pk__in=ActividadArchivada.objects.values('pk')[:3]).update(oportunidad=oportunidad)
+        self.client.post(reverse('oportunidades_lote'), {'accion': 'eliminar', 'ids': oportunidad.pk})
+        self.assertEqual(ActividadArchivada.objects.count(), 12)
+        self.contacto.delete()
+        self.assertFalse(ActividadArchivada.objects.exists())
+
+    def test_detalle_aclara_que_el_total_incluye_archivadas(self):
+        call_command('archive_actividades', stdout=StringIO())
+        response = self.client.get(reverse('contacto_detail', args=[self.contacto.pk]))
+        self.assertContains(response, '61 en total, incluidas las archivadas')
+        self.assertEqual(len(response.context['actividades']), 46)
+
+
+@override_settings(CRM_TAREAS='cola', CRM_TAREAS_ESPERA_BASE=10, CRM_TAREAS_REINTENTOS=2, CRM_INSTRUMENTACION_MUESTREO=0)
+class TareasTests(TestCase):
+
+    def buscar(self, texto):
+        return [contacto.nombre for contacto in buscar_contactos(Contacto.objects.all(), texto)]
+
+    def trabajar(self):
+        salida = StringIO()
+        call_command('run_worker', '--procesos', '0', '--una-vez', stdout=salida, stderr=StringIO())
+        return salida.getvalue()
+
+    def test_la_vista_encola_y_el_worker_indexa(self):
+        response = self.client.post(reverse('contacto_create'), {'nombre': 'Lidia Ortega', 'correo': 'lidia@example.com'})
+        self.assertEqual(response.status_code, 302)
+        tarea = Tarea.objects.get()
+        self.assertEqual((tarea.nombre, tarea.argumentos['contacto_id']), ('indexar_contacto', Contacto.objects.get().pk))
+        self.assertEqual(self.buscar('lidia'), [])
+
+        self.assertIn('1 tareas terminadas, 0 con error', self.trabajar())
+        self.assertEqual(self.buscar('lidia'), ['Lidia Ortega'])
+        self.assertFalse(Tarea.objects.exists())
+
+    def test_clave_de_idempotencia(self):
+        contacto = Contacto.objects.create(nombre='Uno', correo='uno@example.com')
+        for nombre in ['Dos', 'Tres']:
+            contacto.nombre = nombre
+            contacto.save()
+        self.assertEqual(Tarea.objects.filter(clave=f'indexar_contacto:{contacto.pk}').count(), 1)
+        # Una vez reclamada, un cambio nuevo vuelve a encolarse
+        tarea, = tareas.reclamar(5)
+        contacto.nombre = 'Cuatro'
+        contacto.save()
+        self.assertEqual(Tarea.objects.filter(estado='pendiente').count(), 1)
+        tareas.terminar(tarea)
+        self.trabajar()
+        self.assertEqual(self.buscar('cuatro'), ['Cuatro'])
+
+    def test_reintentos_con_espera_exponencial(self):
+        falla = mock.Mock(side_effect=RuntimeError('sin red'))
+        with mock.patch.dict(tareas.REGISTRO, {'falla': falla}):
+            tarea = tareas.encolar('falla', destino='x')
+            with self.assertLogs('home.tareas', 'WARNING'):
+                self.assertIn('0 tareas terminadas, 1 con error', self.trabajar())
+            tarea.refresh_from_db()
+            self.assertEqual((tarea.estado, tarea.intentos), ('pendiente', 1))
+            self.assertIn('sin red', tarea.error)
+            self.assertAlmostEqual((tarea.disponible_desde - timezone.now()).total_seconds(), 10, delta=2)
+            # Todavía esperando: el worker no la toma
+            self.assertIn('0 tareas terminadas, 0 con error', self.trabajar())
+
+            Tarea.objects.update(disponible_desde=timezone.now())
+            with self.assertLogs('home.tareas', 'WARNING'):
+                self.trabajar()
+            tarea.refresh_from_db()
+            self.assertEqual((tarea.estado, tarea.intentos), ('fallida', 2))
+        falla.assert_called_with(destino='x')
+        self.assertEqual(falla.call_count, 2)
+
+    def test_plazo_vencido_vuelve_a_la_cola(self):
+        tareas.encolar('reconstruir_acumulados')
+        tarea, = tareas.reclamar(1)
+        self.assertEqual(tareas.reclamar(1), [])
+        Tarea.objects.update(reclamada_hasta=timezone.now() - timezone.timedelta(seconds=1))
+        otra, = tareas.reclamar(1, trabajador='otro')
+        self.assertEqual((otra.pk, otra.intentos, otra.reclamada_por), (tarea.pk, 2, 'otro'))
+        # El primer worker ya no puede cerrarla
+        tareas.terminar(tarea)
+        self.assertTrue(Tarea.objects.filter(pk=tarea.pk).exists())
+        tareas.terminar(otra)
+        self.assertFalse(Tarea.objects.exists())
+
+    def test_plazo_vencido_en_el_ultimo_intento(self):
+        with override_settings(CRM_TAREAS_REINTENTOS=2):
+            tarea = tareas.encolar('reconstruir_acumulados')
+        for _ in range(2):
+            self.assertEqual([t.pk for t in tareas.reclamar(1)], [tarea.pk])
+            Tarea.objects.update(reclamada_hasta=timezone.now() - timezone.timedelta(seconds=1))
+        # Tumbó a su worker dos veces: no se vuelve a correr
+        with self.assertLogs('home.tareas', 'WARNING'):
+            self.assertEqual(tareas.reclamar(1), [])
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos, tarea.reclamada_hasta), ('fallida', 2, None))
+        self.assertIn('plazo', tarea.error)
+
+    def test_pool_roto_se_vuelve_a_crear(self):
+        class Pool:
+            # El primero se rompe en el primer submit, como tras un OOM de un hijo
+            creados = []
+
+            def __init__(self, **kwargs):
+                self.roto = not Pool.creados
+                Pool.creados.append(self)
+
+            def submit(self, funcion, *args):
+                if self.roto:
+                    raise BrokenProcessPool('un proceso hijo murió')
+                futuro = Future()
+                futuro.set_result(funcion(*args))
+                return futuro
+
+            def shutdown(self, **kwargs):
+                pass
+
+        primera = tareas.encolar('reconstruir_acumulados')
+        tareas.encolar('reconstruir_busqueda')
+        salida, errores = StringIO(), StringIO()
+        with mock.patch('home.management.commands.run_worker.ProcessPoolExecutor', Pool), \
+                self.assertLogs('home.tareas', 'WARNING'):
+            call_command('run_worker', '--procesos', '2', '--una-vez', stdout=salida, stderr=errores)
+        self.assertEqual(len(Pool.creados), 2)
+        self.assertIn('pool de procesos se rompió', errores.getvalue())
+        self.assertIn('0 tareas terminadas, 2 con error', salida.getvalue())
+        primera.refresh_from_db()
+        self.assertEqual((primera.estado, primera.intentos), ('pendiente', 1))
+
+        # Vencida la espera, el pool nuevo las corre
+        Tarea.objects.update(disponible_desde=timezone.now())
+        salida = StringIO()
+        with mock.patch('home.management.commands.run_worker.ProcessPoolExecutor', Pool):
+            call_command('run_worker', '--procesos', '2', '--una-vez', stdout=salida, stderr=StringIO())
+        self.assertIn('2 tareas terminadas, 0 con error', salida.getvalue())
+        self.assertFalse(Tarea.objects.exists())
+
+    def test_inmediato_y_desconocida(self):
+        with self.assertRaises(ValueError):
+            tareas.encolar('no_existe')
+        with override_settings(CRM_TAREAS='inmediato'):
+            Contacto.objects.create(nombre='Marta', correo='marta@example.com')
+        self.assertFalse(Tarea.objects.exists())
+        self.assertEqual(self.buscar('marta'), ['Marta'])
+
+
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=0)
+class ContadoresContactoTests(TestCase):
+
+    def setUp(self):
+        crear_datos_crm(3)
+        self.contactos = list(Contacto.objects.order_by('nombre'))
+
+    def contadores(self, contacto):
+        contacto.refresh_from_db()
+        return (contacto.oportunidades_abiertas, contacto.valor_abierto, contacto.actividades_total)
+
+    def assertSinDesvios(self):
+        call_command('rebuild_contact_counters', '--check', stdout=StringIO())
+
+    def test_altas_y_cambios_de_oportunidades(self):
+        primero, segundo, _ = self.contactos
+        self.assertEqual(self.contadores(primero), (1, Decimal('100'), 1))
+        oportunidad = primero.oportunidades.get()
+        self.client.post(reverse('oportunidad_update_estado', args=[oportunidad.pk]), {'estado': 'ganado'})
+        self.assertEqual(self.contadores(primero), (0, Decimal('0'), 1))
+
+        # Reabierta, con otro valor y en otro contacto
+        self.client.post(reverse('oportunidad_edit', args=[oportunidad.pk]), {
+            'titulo': 'Movida', 'valor': '50', 'estado': 'en_progreso', 'fecha_estimada_cierre': '2026-01-01',
+            'contacto': str(segundo.pk), 'notas': '',
+        })
+        self.assertEqual(self.contadores(primero)[:2], (0, Decimal('0')))
+        self.assertEqual(self.contadores(segundo)[:2], (2, Decimal('151')))
+        oportunidad.refresh_from_db()
+        oportunidad.delete()
+        self.assertEqual(self.contadores(segundo)[:2], (1, Decimal('101')))
+        self.assertSinDesvios()
+
+    def test_actividades_y_ultima_fecha(self):
+        contacto = self.contactos[0]
+        ahora = timezone.now()
+        vieja = Actividad.objects.create(tipo='tarea', titulo='Vieja', contacto=contacto, fecha=ahora - timezone.timedelta(days=9))
+        contacto.refresh_from_db()
+        self.assertEqual(contacto.actividades_total, 2)
+        reciente = contacto.ultima_actividad
+        self.assertGreater(reciente, vieja.fecha)
+
+        # Se adelanta la fecha de la vieja y luego se la lleva a otro contacto
+        vieja.fecha = ahora + timezone.timedelta(days=1)
+        vieja.save()
+        contacto.refresh_from_db()
+        self.assertEqual(contacto.ultima_actividad, vieja.fecha)
+        self.client.post(reverse('actividad_edit', args=[vieja.pk]), {
+            'tipo': 'tarea', 'titulo': 'Vieja', 'fecha': vieja.fecha.isoformat(), 'contacto': str(self.contactos[1].pk),
+        })
+        contacto.refresh_from_db()
+        self.assertEqual((contacto.actividades_total, contacto.ultima_actividad), (1, reciente))
+        self.assertEqual(self.contadores(self.contactos[1])[2], 2)
+
+        Actividad.objects.filter(contacto=contacto).get().delete()
+        contacto.refresh_from_db()
+        self.assertEqual((contacto.actividades_total, contacto.ultima_actividad), (0, None))
+        self.assertSinDesvios()
+
+    def test_lotes_archivo_y_reparacion(self):
+        oportunidades = list(Oportunidad.objects.order_by('pk').values_list('pk', flat=True))
+        lotes.cambiar_estado_oportunidades(oportunidades[:2], 'perdido')
+        self.assertSinDesvios()
+        for actividad in Actividad.objects.all():
+            actividad.completada, actividad.fecha = True, timezone.now() - timezone.timedelta(days=400)
+            actividad.save()
+        call_command('archive_actividades', stdout=StringIO())
+        self.assertEqual(self.contadores(self.contactos[2])[2], 1)
+        lotes.eliminar_oportunidades(oportunidades[2:])
+        lotes.eliminar_actividades(list(Actividad.objects.values_list('pk', flat=True)))
+        self.assertSinDesvios()
+        self.assertEqual(self.contadores(self.contactos[2]), (0, Decimal('0'), 0))
+
+        Contacto.objects.update(actividades_total=7)
+        with self.assertRaises(CommandError):
+            self.assertSinDesvios()
+        salida = StringIO()
+        call_command('rebuild_contact_counters', '--lote', '2', stdout=salida)
+        self.assertIn('3 contactos corregidos', salida.getvalue())
+        self.assertSinDesvios()
+
+    def test_borrar_contacto_no_ajusta_contadores(self):
+        contacto = self.contactos[0]
+        with CaptureQueriesContext(connection) as consultas:
+            contacto.delete()
+        self.assertFalse([c for c in consultas.captured_queries if c['sql'].startswith('UPDATE "home_contacto"')])
+
+    def test_lista_por_actividad_reciente(self):
+        ahora = timezone.now()
+        for dias, contacto in zip([3, 1, 2], self.contactos):
+            Actividad.objects.filter(contacto=contacto).update(fecha=ahora - timezone.timedelta(days=dias))
+        Actividad.objects.filter(contacto=self.contactos[2]).delete()
+        # update() no pasa por las señales
+        call_command('rebuild_contact_counters', stdout=StringIO())
+        response = self.client.get(reverse('contactos_list'), {'orden': 'actividad'})
+        self.assertEqual([c.pk for c in response.context['page_obj']], [self.contactos[1].pk, self.contactos[0].pk])
+        self.assertContains(response, (ahora - timezone.timedelta(days=1)).astimezone().strftime('%d/%m/%Y'))
+
+
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=0)
+class AnaliticaTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        crear_datos_crm(4)
+        self.oportunidades = list(Oportunidad.objects.order_by('pk'))
+
+    def historia(self, oportunidad):
+        return list(oportunidad.cambios_estado.values_list('estado_anterior', 'estado'))
+
+    def cambiar(self, oportunidad, estado):
+        self.client.post(reverse('oportunidad_update_estado', args=[oportunidad.pk]), {'estado': estado})
+
+    def preparar_embudo(self):
+        # Ganada desde nueva; perdida, abierta en progreso y nueva
+        ganada, perdida, en_progreso, _ = self.oportunidades
+        self.cambiar(ganada, 'ganado')
+        lotes.cambiar_estado_oportunidades([perdida.pk, en_progreso.pk], 'en_progreso')
+        self.cambiar(perdida, 'perdido')
+        inicio = timezone.now() - timezone.timedelta(days=30)
+        for oportunidad, dias in zip(self.oportunidades, [[0, 2], [0, 1, 4], [0, 3], [0]]):
+            for cambio, dia in zip(oportunidad.cambios_estado.order_by('id'), dias):
+                CambioEstado.objects.filter(pk=cambio.pk).update(fecha=inicio + timezone.timedelta(days=dia))
+
+    def test_historia_de_estados(self):
+        oportunidad = self.oportunidades[0]
+        self.assertEqual(self.historia(oportunidad), [('', 'nuevo')])
+        self.cambiar(oportunidad, 'en_progreso')
+        # Editarla sin cambiar el estado no agrega cambios
+        self.client.post(reverse('oportunidad_edit', args=[oportunidad.pk]), {
+            'titulo': 'Editada', 'valor': '75', 'estado': 'en_progreso', 'fecha_estimada_cierre': '2026-02-01',
+            'contacto': str(oportunidad.contacto_id), 'notas': '',
+        })
+        lotes.cambiar_estado_oportunidades([oportunidad.pk, self.oportunidades[1].pk], 'ganado')
+        self.assertEqual(
+            self.historia(oportunidad), [('', 'nuevo'), ('nuevo', 'en_progreso'), ('en_progreso', 'ganado')],
+        )
+        self.assertEqual(oportunidad.cambios_estado.last().valor, Decimal('75'))
+        self.assertEqual(self.historia(self.oportunidades[1]), [('', 'nuevo'), ('nuevo', 'ganado')])
+
+
+    def test_la_historia_sobrevive_a_la_oportunidad(self):
+        self.preparar_embudo()
+        antes = analitica.calcular()
+        ganada, perdida = self.oportunidades[:2]
+        numeros = [ganada.pk, perdida.pk]
+        historia = list(CambioEstado.objects.order_by('id').values_list('numero_oportunidad', 'estado'))
+
+        lotes.eliminar_oportunidades([ganada.pk])
+        perdida.delete()
+        self.assertEqual(list(CambioEstado.objects.order_by('id').values_list('numero_oportunidad', 'estado')), historia)
+        self.assertFalse(CambioEstado.objects.filter(numero_oportunidad__in=numeros, oportunidad__isnull=False).exists())
+        # El embudo, los tiempos y las probabilidades no cambian
+        self.assertEqual(analitica.calcular()['embudo'], antes['embudo'])
+
+    def test_embudo_y_pronostico(self):
+        self.preparar_embudo()
+        datos = analitica.calcular()
+        embudo = {fila['estado']: fila for fila in datos['embudo']}
+        nuevo, en_progreso = embudo['nuevo'], embudo['en_progreso']
+        self.assertEqual(nuevo['entradas'], 4)
+        self.assertEqual(
+            [(c['estado'], c['cantidad'], c['fraccion']) for c in nuevo['conversion']],
+            [('nuevo', 0, 0.0), ('en_progreso', 2, 0.5), ('ganado', 1, 0.25), ('perdido', 0, 0.0)],
+        )
+        # Las estancias abiertas (la oportunidad todavía nueva) no cuentan
+        self.assertEqual((round(nuevo['dias'], 6), nuevo['estancias']), (2, 3))
+        self.assertEqual((round(en_progreso['dias'], 6), en_progreso['estancias']), (3, 1))
+        self.assertEqual((nuevo['probabilidad'], en_progreso['probabilidad']), (0.5, 0.0))
+
+        # Abiertas: en progreso (102 al 0%) y nueva (103 al 50%)
+        self.assertEqual(datos['pronostico'], [{
+            'mes': date(2026, 1, 1), 'cantidad': 2, 'valor': Decimal('205'), 'ponderado': Decimal('51.50'),
+        }])
+        self.assertEqual(analitica.calcular(2025)['pronostico'], [])
+
+    def test_probabilidad_sin_historia_cerrada(self):
+        # Nada cerrado pasó por en_progreso: se usa la fracción ganada de todas
+        lotes.cambiar_estado_oportunidades([self.oportunidades[0].pk], 'ganado')
+        lotes.cambiar_estado_oportunidades([self.oportunidades[3].pk], 'en_progreso')
+        probabilidades = analitica.probabilidad_de_ganar()
+        self.assertEqual((probabilidades['nuevo'], probabilidades['en_progreso']), (1.0, 1.0))
+
+    def test_reporte_en_cache_por_anio(self):
+        self.preparar_embudo()
+        analitica.reporte()
+        with self.assertNumQueries(0):
+            analitica.reporte()
+        response = self.client.get(reverse('oportunidades_analitica'))
+        self.assertContains(response, 'Embudo')
+        self.assertEqual(response.context['anio'], None)
+
+        # Un cambio de estado invalida los reportes guardados
+        self.cambiar(self.oportunidades[3], 'ganado')
+        with self.assertNumQueries(4):
+            datos = analitica.reporte()
+        self.assertEqual({fila['estado']: fila['entradas'] for fila in datos['embudo']}['ganado'], 2)
+        for texto, anio in [('2025', 2025), ('x', None), ('20255', None)]:
+            response = self.client.get(reverse('oportunidades_analitica'), {'anio': texto})
+            self.assertEqual(response.context['anio'], anio)
+
+
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=0)
+class CacheHttpTests(TestCase):
+
+    def setUp(self):
+        crear_datos_crm(3)
+
+    def test_paginas_comprimidas_y_revalidadas(self):
+        url = reverse('contactos_list')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        html = gzip.decompress(response.content).decode()
+        self.assertIn('home/crm/crm.css', html)
+        self.assertNotIn('<style>', html)
+        self.assertLess(len(response.content), len(html) / 3)
+        self.assertEqual(set(response['Cache-Control'].split(', ')), {'private', 'no-cache'})
+
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        Contacto.objects.create(nombre='Nuevo', correo='nuevo@example.com')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pipeline_revalidado_sin_token_en_el_html(self):
+        # El token CSRF va en la cookie: el HTML no cambia entre respuestas
+        url = reverse('oportunidades_pipeline')
+        response = self.client.get(url)
+        self.assertNotContains(response, 'type="hidden" name="csrfmiddlewaretoken"')
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        cliente = self.client_class(enforce_csrf_checks=True)
+        cliente.get(url)
+        oportunidad = Oportunidad.objects.first()
+        response = cliente.post(reverse('oportunidad_update_estado', args=[oportunidad.pk]), {
+            'estado': 'ganado', 'csrfmiddlewaretoken': cliente.cookies[settings.CSRF_COOKIE_NAME].value,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Oportunidad.objects.get(pk=oportunidad.pk).estado, 'ganado')
+
+    @skipUnless(importlib.util.find_spec('whitenoise'), 'requiere whitenoise')
+    def test_estaticos_con_hash_por_whitenoise(self):
+        middleware = list(settings.MIDDLEWARE)
+        middleware.insert(middleware.index('django.middleware.security.SecurityMiddleware') + 1,
+                          'whitenoise.middleware.WhiteNoiseMiddleware')
+        with tempfile.TemporaryDirectory() as directorio, override_settings(
+            STATIC_ROOT=directorio, MIDDLEWARE=middleware,
+            STORAGES={**settings.STORAGES, 'staticfiles': {
+                'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+            }},
+        ):
+            call_command('collectstatic', '--noinput', verbosity=0)
+            html = self.client.get(reverse('crm_dashboard')).content.decode()
+            hasheado = re.search(r'href="(/static/home/crm/crm\.[0-9a-f]{12}\.css)"', html).group(1)
+
+            # Se sirve la copia comprimida por collectstatic, sin pasar por las vistas
+            response = self.client.get(hasheado, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('immutable', response['Cache-Control'])
+            response.close()
+            response = self.client.get('/static/home/crm/crm.css')
+            self.assertEqual(response['Cache-Control'], 'max-age=300, public')
+            response.close()
+
+
+@override_settings(CRM_INSTRUMENTACION_MUESTREO=0)
+class CacheListasTests(TestCase):
+
+    def setUp(self):
+        caches['listas'].clear()
+        crear_datos_crm(3)
+
+    def pedir(self, vista, params=None):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse(vista), params or {})
+        return [objeto.pk for objeto in response.context['page_obj']], consultas.captured_queries
+
+    def paginadas(self, consultas):
+        # La consulta filtrada y ordenada de la página pide per_page + 1 filas
+        return [c for c in consultas if 'LIMIT 21' in c['sql']]
+
+    def test_acierto_lee_solo_por_pk(self):
+        ids, consultas = self.pedir('contactos_list', {'empresa': '', 'otro': 'x'})
+        self.assertTrue(self.paginadas(consultas))
+        # Mismos filtros una vez normalizados
+        self.assertEqual(listas.filtros('contactos_list', {'empresa': ' ', 'q': ''}), ())
+        ids_cache, consultas = self.pedir('contactos_list')
+        self.assertEqual(ids_cache, ids)
+        contactos = [c['sql'] for c in consultas if ' FROM "home_contacto"' in c['sql']]
+        self.assertEqual(len(contactos), 1)
+        self.assertIn('"home_contacto"."id" IN (', contactos[0])
+        self.assertFalse(self.paginadas(consultas))
+
+    def test_escrituras_invalidan_por_generacion(self):
+        self.pedir('oportunidades_list', {'estado': 'nuevo'})
+        oportunidad = Oportunidad.objects.order_by('pk').first()
+        lotes.cambiar_estado_oportunidades([oportunidad.pk], 'ganado')
+        ids, _ = self.pedir('oportunidades_list', {'estado': 'nuevo'})
+        self.assertNotIn(oportunidad.pk, ids)
+        self.assertEqual(len(ids), 2)
+
+        self.pedir('contactos_list')
+        Contacto.objects.create(nombre='Aaron', correo='aaron@example.com')
+        ids, _ = self.pedir('contactos_list')
+        self.assertEqual(len(ids), 4)
+
+        # La página no cambia con escrituras de modelos de los que no depende
+        self.pedir('actividades_list')
+        Oportunidad.objects.filter(pk=oportunidad.pk).get().save()
+        _, consultas = self.pedir('actividades_list')
+        self.assertFalse(self.paginadas(consultas))
+        lotes.eliminar_actividades([Actividad.objects.order_by('pk').first().pk])
+        ids, _ = self.pedir('actividades_list')
+        self.assertEqual(len(ids), 2)
+
+    def test_union_con_el_archivo(self):
+        contacto = Contacto.objects.order_by('pk').first()
+        vieja = timezone.now() - timezone.timedelta(days=400)
+        Actividad.objects.create(tipo='correo', titulo='Vieja', contacto=contacto, fecha=vieja, completada=True)
+        call_command('archive_actividades', stdout=StringIO())
+        params = {'fecha_desde': (timezone.localdate() - timezone.timedelta(days=500)).isoformat()}
+        primera = self.client.get(reverse('actividades_list'), params).context['page_obj']
+        segunda = self.client.get(reverse('actividades_list'), params).context['page_obj']
+        self.assertEqual(
+            [(type(a), a.pk) for a in segunda.object_list], [(type(a), a.pk) for a in primera.object_list],
+        )
+        self.assertEqual([a.titulo for a in segunda.object_list if isinstance(a, ActividadArchivada)], ['Vieja'])
+        self.assertEqual(segunda.total, 4)
+
+    @override_settings(CACHES={**settings.CACHES, 'listas': {**settings.CACHES['listas'], 'TIMEOUT': 0}})
+    def test_ttl_cero_desactiva(self):
+        self.pedir('contactos_list')
+        _, consultas = self.pedir('contactos_list')
+        self.assertTrue(self.paginadas(consultas))
@@ -1,5 +1,5 @@
 from django.urls import path
-from home import views
+from home import api, views
 
 urlpatterns = [
     path("",views.index, name='index'),
@@ -7,10 +7,17 @@ urlpatterns = [
     
     # URLs del CRM - Dashboard
     path('crm/', views.crm_dashboard, name='crm_dashboard'),
+    path('crm/autocompletar/<str:modelo>/', views.autocompletar, name='autocompletar'),
+    
+    # API JSON de solo lectura
+    path('crm/api/v1/<str:recurso>/', api.lista, name='api_lista'),
+    path('crm/api/v1/<str:recurso>/<int:pk>/', api.detalle, name='api_detalle'),
     
     # URLs de Contactos
     path('crm/contactos/', views.contactos_list, name='contactos_list'),
     path('crm/contactos/nuevo/', views.contacto_create, name='contacto_create'),
+    path('crm/contactos/importar/', views.contactos_importar, name='contactos_importar'),
+    path('crm/contactos/exportar/', views.contactos_exportar, name='contactos_exportar'),
     path('crm/contactos/<int:pk>/', views.contacto_detail, name='contacto_detail'),
     path('crm/contactos/<int:pk>/editar/', views.contacto_edit, name='contacto_edit'),
     path('crm/contactos/<int:pk>/eliminar/', views.contacto_delete, name='contacto_delete'),
@@ -18,15 +25,21 @@ urlpatterns = [
     # URLs de Oportunidades
     path('crm/oportunidades/', views.oportunidades_list, name='oportunidades_list'),
     path('crm/oportunidades/pipeline/', views.oportunidades_pipeline, name='oportunidades_pipeline'),
+    path('crm/oportunidades/pipeline/<str:estado>/', views.oportunidades_pipeline_columna, name='oportunidades_pipeline_columna'),
+    path('crm/oportunidades/analitica/', views.oportunidades_analitica, name='oportunidades_analitica'),
+    path('crm/oportunidades/exportar/', views.oportunidades_exportar, name='oportunidades_exportar'),
     path('crm/oportunidades/nueva/', views.oportunidad_create, name='oportunidad_create'),
     path('crm/oportunidades/<int:pk>/editar/', views.oportunidad_edit, name='oportunidad_edit'),
     path('crm/oportunidades/<int:pk>/eliminar/', views.oportunidad_delete, name='oportunidad_delete'),
     path('crm/oportunidades/<int:pk>/actualizar-estado/', views.oportunidad_update_estado, name='oportunidad_update_estado'),
+    path('crm/oportunidades/lote/', views.oportunidades_lote, name='oportunidades_lote'),
     
     # URLs de Actividades
     path('crm/actividades/', views.actividades_list, name='actividades_list'),
+    path('crm/actividades/exportar/', views.actividades_exportar, name='actividades_exportar'),
     path('crm/actividades/nueva/', views.actividad_create, name='actividad_create'),
     path('crm/actividades/<int:pk>/editar/', views.actividad_edit, name='actividad_edit'),
     path('crm/actividades/<int:pk>/eliminar/', views.actividad_delete, name='actividad_delete'),
     path('crm/actividades/<int:pk>/toggle-completada/', views.actividad_toggle_completada, name='actividad_toggle_completada'),
+    path('crm/actividades/lote/', views.actividades_lote, name='actividades_lote'),
 ]
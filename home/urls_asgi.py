@@ -0,0 +1,14 @@
+"""Las rutas de home/urls.py con la versión asíncrona de las vistas que la tienen."""
+from django.urls import path
+
+from home import urls, views
+
+VISTAS_ASYNC = {
+    'crm_dashboard': views.crm_dashboard_async,
+    'contacto_detail': views.contacto_detail_async,
+}
+
+urlpatterns = [
+    path(str(patron.pattern), VISTAS_ASYNC[patron.name], name=patron.name) if patron.name in VISTAS_ASYNC else patron
+    for patron in urls.urlpatterns
+]
@@ -1,12 +1,204 @@
+import asyncio
+import heapq
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse
-from django.db.models import Q, Sum, Count
-from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import close_old_connections
+from django.db.models import Sum, Count
+from django.db.models.functions import Lower
 from django.contrib import messages
 from django.utils import timezone
+from django.views.decorators.cache import cache_control, cache_page
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_POST
 from datetime import datetime, timedelta
 
-from .models import Producto, Contacto, Empresa, Etiqueta, Oportunidad, Actividad
+from .models import Producto, Contacto, Empresa, Etiqueta, Oportunidad, Actividad, ActividadArchivada
+from . import analitica, archivo, exportacion, listas, lotes
+from .fragmentos import versiones
+from .importacion import ImportadorContactos, leer_filas
+from .pagination import KeysetPaginator, KeysetPaginatorUnion
+from .search import buscar_contactos
+from .stats import resumen_dashboard
+
+
+# Vistas de lectura: el navegador guarda la página pero la revalida en cada
+# visita con el ETag de ConditionalGetMiddleware; si no cambió recibe un 304
+# sin cuerpo. Privada porque incluye los mensajes de la sesión.
+lectura = cache_control(private=True, no_cache=True)
+
+
+# Plan de consulta por vista: relaciones que se cargan por adelantado y
+# columnas que realmente usa cada template, para evitar consultas N+1.
+QUERY_SPECS = {
+    'crm_dashboard': {
+        'only': ('tipo', 'titulo', 'fecha', 'completada', 'fecha_actualizacion'),
+    },
+    'contactos_list': {
+        'select_related': ('empresa',),
+        'prefetch_related': ('etiquetas',),
+        'only': (
+            'nombre', 'correo', 'telefono', 'fecha_actualizacion', 'oportunidades_abiertas', 'ultima_actividad',
+            'empresa', 'empresa__nombre',
+        ),
+    },
+    'contacto_detail': {
+        'select_related': ('empresa',),
+        'prefetch_related': ('etiquetas',),
+    },
+    'oportunidades_list': {
+        'select_related': ('contacto',),
+        'only': ('titulo', 'valor', 'estado', 'fecha_estimada_cierre', 'contacto', 'contacto__nombre'),
+    },
+    'oportunidades_pipeline': {
+        'select_related': ('contacto',),
+        'only': (
+            'titulo', 'valor', 'estado', 'fecha_estimada_cierre', 'fecha_actualizacion',
+            'contacto', 'contacto__nombre',
+        ),
+    },
+    'actividades_list': {
+        'select_related': ('contacto', 'oportunidad'),
+        'only': (
+            'tipo', 'titulo', 'descripcion', 'fecha', 'completada',
+            'contacto', 'contacto__nombre', 'oportunidad', 'oportunidad__titulo',
+        ),
+    },
+}
+
+
+# Orden de cada lista paginada; el último campo es único para que el cursor sea exacto
+ORDEN_PAGINACION = {
+    'contactos_list': ('nombre', 'id'),
+    'contactos_actividad': ('-ultima_actividad', '-id'),
+    'oportunidades_list': ('-fecha_creacion', '-id'),
+    'actividades_list': ('-fecha', '-id'),
+}
+
+
+def aplicar_query_spec(queryset, vista):
+    spec = QUERY_SPECS[vista]
+    if spec.get('select_related'):
+        queryset = queryset.select_related(*spec['select_related'])
+    if spec.get('prefetch_related'):
+        queryset = queryset.prefetch_related(*spec['prefetch_related'])
+    if spec.get('only'):
+        queryset = queryset.only(*spec['only'])
+    return queryset
+
+
+# Filtros de las listas, compartidos con la exportación
+def filtrar_contactos(contactos, params):
+    query = params.get('q', '')
+    empresa_id = params.get('empresa', '')
+    etiqueta_id = params.get('etiqueta', '')
+    grupo = params.get('grupo', '')
+    
+    if query:
+        contactos = buscar_contactos(contactos, query, ordenar=not grupo)
+    
+    # Actividad reciente: solo los contactos con alguna actividad, por el índice de ultima_actividad
+    if params.get('orden') == 'actividad':
+        contactos = contactos.filter(ultima_actividad__isnull=False)
+        if not (query or grupo):
+            contactos = contactos.order_by(*ORDEN_PAGINACION['contactos_actividad'])
+    
+    if empresa_id:
+        contactos = contactos.filter(empresa_id=empresa_id)
+    
+    if etiqueta_id:
+        contactos = contactos.filter(etiquetas__id=etiqueta_id)
+    
+    # Agrupar por empresa o etiqueta
+    if grupo == 'empresa':
+        contactos = contactos.order_by('empresa__nombre', 'nombre', 'id')
+    elif grupo == 'etiqueta':
+        contactos = contactos.order_by('etiquetas__nombre', 'nombre', 'id')
+    
+    return contactos
+
+
+def filtrar_oportunidades(oportunidades, params):
+    estado = params.get('estado', '')
+    contacto_id = params.get('contacto', '')
+    
+    if estado:
+        oportunidades = oportunidades.filter(estado=estado)
+    
+    if contacto_id:
+        oportunidades = oportunidades.filter(contacto_id=contacto_id)
+    
+    return oportunidades
+
+
+def filtrar_actividades(actividades, params):
+    tipo = params.get('tipo', '')
+    contacto_id = params.get('contacto', '')
+    oportunidad_id = params.get('oportunidad', '')
+    fecha_desde = params.get('fecha_desde', '')
+    fecha_hasta = params.get('fecha_hasta', '')
+    completadas = params.get('completadas', '')
+    
+    if tipo:
+        actividades = actividades.filter(tipo=tipo)
+    
+    if contacto_id:
+        actividades = actividades.filter(contacto_id=contacto_id)
+    
+    if oportunidad_id:
+        actividades = actividades.filter(oportunidad_id=oportunidad_id)
+    
+    if fecha_desde:
+        try:
+            fecha_desde_dt = datetime.strptime(fecha_desde, '%Y-%m-%d')
+            actividades = actividades.filter(fecha__gte=fecha_desde_dt)
+        except:
+            pass
+    
+    if fecha_hasta:
+        try:
+            fecha_hasta_dt = datetime.strptime(fecha_hasta, '%Y-%m-%d') + timedelta(days=1)
+            actividades = actividades.filter(fecha__lt=fecha_hasta_dt)
+        except:
+            pass
+    
+    if completadas == 'si':
+        actividades = actividades.filter(completada=True)
+    elif completadas == 'no':
+        actividades = actividades.filter(completada=False)
+    
+    return actividades
+
+
+def _seleccion(queryset, pk):
+    # Objeto elegido en un filtro o formulario, para mostrar su nombre en el autocompletado
+    if not pk:
+        return None
+    try:
+        return queryset.filter(pk=pk).first()
+    except (ValueError, TypeError):
+        return None
+
+
+def _filtros_querystring(request):
+    # Filtros actuales para repetirlos en los enlaces de paginación
+    filtros = request.GET.copy()
+    filtros.pop('cursor', None)
+    filtros.pop('page', None)
+    return filtros.urlencode()
+
+
+# Exportación de listas (home/exportacion.py): CSV o JSONL en streaming
+def _exportar(request, nombre, filas, columnas):
+    formato = exportacion.formato_pedido(request)
+    contenido = exportacion.ESCRITORES[formato](filas, columnas)
+    response = StreamingHttpResponse(contenido, content_type=exportacion.FORMATOS[formato])
+    fecha = timezone.localdate().isoformat()
+    response['Content-Disposition'] = f'attachment; filename="{nombre}-{fecha}.{formato}"'
+    response['Vary'] = 'Accept'
+    return response
 
 
 # Vista principal
@@ -24,64 +216,117 @@ def productos_ordenados(request):
 
 
 # Vistas del CRM - Dashboard
+@lectura
 def crm_dashboard(request):
-    total_contactos = Contacto.objects.count()
-    total_oportunidades = Oportunidad.objects.count()
-    valor_total_oportunidades = Oportunidad.objects.exclude(estado='perdido').aggregate(
-        total=Sum('valor')
-    )['total'] or 0
-    
-    oportunidades_por_estado = Oportunidad.objects.values('estado').annotate(
-        count=Count('id')
+    # Totales desde los acumulados de CrmStats, mantenidos por señales
+    context = resumen_dashboard()
+    context['actividades_recientes'] = _actividades_recientes()
+    context['fragmentos'] = versiones()
+    return render(request, 'home/crm/dashboard.html', context)
+
+
+def _actividades_recientes():
+    return list(aplicar_query_spec(Actividad.objects.all(), 'crm_dashboard')[:10])
+
+
+# Versiones asíncronas para thelightspeed/asgi.py (home/urls_asgi.py): las
+# consultas independientes se ejecutan a la vez, cada una en un hilo con su
+# propia conexión, y la latencia queda acotada por la más lenta.
+def _en_hilo_propio(consulta):
+    def ejecutar():
+        try:
+            return consulta()
+        finally:
+            # Como al terminar un pedido: se cierra según CONN_MAX_AGE
+            close_old_connections()
+    return sync_to_async(ejecutar, thread_sensitive=False)
+
+
+async def _consultas_concurrentes(*consultas):
+    return await asyncio.gather(*(_en_hilo_propio(consulta)() for consulta in consultas))
+
+
+@lectura
+async def crm_dashboard_async(request):
+    resumen, recientes, fragmentos = await _consultas_concurrentes(
+        resumen_dashboard, _actividades_recientes, versiones,
     )
+    context = {**resumen, 'actividades_recientes': recientes, 'fragmentos': fragmentos}
+    # La plantilla puede leer la sesión (mensajes): se renderiza en el hilo del pedido
+    return await sync_to_async(render)(request, 'home/crm/dashboard.html', context)
+
+
+# Autocompletado para formularios y filtros
+AUTOCOMPLETAR_LIMITE = 10
+AUTOCOMPLETAR_MAXIMO = 50
+AUTOCOMPLETAR_TTL = 30
+
+
+def _por_prefijo(queryset, campo, texto):
+    # Rango sobre LOWER(campo) para que use el índice funcional del modelo
+    minusculas = Lower(campo)
+    if texto:
+        queryset = queryset.alias(prefijo=minusculas).filter(
+            prefijo__gte=texto.lower(), prefijo__lt=texto.lower() + '\U0010ffff'
+        )
+    return queryset.order_by(minusculas, 'id')
+
+
+@cache_page(AUTOCOMPLETAR_TTL)
+def autocompletar(request, modelo):
+    texto = request.GET.get('q', '').strip()
+    try:
+        limite = min(max(int(request.GET.get('limite', AUTOCOMPLETAR_LIMITE)), 1), AUTOCOMPLETAR_MAXIMO)
+    except ValueError:
+        limite = AUTOCOMPLETAR_LIMITE
+    
+    if modelo == 'contactos':
+        contactos = Contacto.objects.only('nombre', 'correo')
+        contactos = buscar_contactos(contactos, texto) if texto else contactos.order_by('nombre', 'id')
+        resultados = [
+            {'id': c.pk, 'texto': c.nombre, 'detalle': c.correo} for c in contactos[:limite]
+        ]
+    elif modelo == 'empresas':
+        empresas = _por_prefijo(Empresa.objects.only('nombre'), 'nombre', texto)
+        resultados = [{'id': e.pk, 'texto': e.nombre} for e in empresas[:limite]]
+    elif modelo == 'etiquetas':
+        etiquetas = _por_prefijo(Etiqueta.objects.all(), 'nombre', texto)
+        resultados = [{'id': e.pk, 'texto': e.nombre, 'color': e.color} for e in etiquetas[:limite]]
+    elif modelo == 'oportunidades':
+        oportunidades = _por_prefijo(
+            Oportunidad.objects.select_related('contacto').only('titulo', 'contacto__nombre'), 'titulo', texto
+        )
+        resultados = [
+            {'id': o.pk, 'texto': o.titulo, 'detalle': o.contacto.nombre} for o in oportunidades[:limite]
+        ]
+    else:
+        return JsonResponse({'error': 'Modelo no válido'}, status=404)
     
-    actividades_recientes = Actividad.objects.all()[:10]
-    
-    context = {
-        'total_contactos': total_contactos,
-        'total_oportunidades': total_oportunidades,
-        'valor_total_oportunidades': valor_total_oportunidades,
-        'oportunidades_por_estado': oportunidades_por_estado,
-        'actividades_recientes': actividades_recientes,
-    }
-    return render(request, 'home/crm/dashboard.html', context)
+    return JsonResponse({'resultados': resultados})
 
 
 # Vistas de Contactos
+@lectura
 def contactos_list(request):
     query = request.GET.get('q', '')
     empresa_id = request.GET.get('empresa', '')
     etiqueta_id = request.GET.get('etiqueta', '')
     grupo = request.GET.get('grupo', '')
-    
-    contactos = Contacto.objects.all()
-    
-    if query:
-        contactos = contactos.filter(
-            Q(nombre__icontains=query) |
-            Q(correo__icontains=query) |
-            Q(telefono__icontains=query) |
-            Q(empresa__nombre__icontains=query)
-        )
-    
-    if empresa_id:
-        contactos = contactos.filter(empresa_id=empresa_id)
-    
-    if etiqueta_id:
-        contactos = contactos.filter(etiquetas__id=etiqueta_id)
-    
-    # Agrupar por empresa o etiqueta
-    if grupo == 'empresa':
-        contactos = contactos.order_by('empresa__nombre', 'nombre')
-    elif grupo == 'etiqueta':
-        contactos = contactos.order_by('etiquetas__nombre', 'nombre')
-    
-    paginator = Paginator(contactos, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    empresas = Empresa.objects.all()
-    etiquetas = Etiqueta.objects.all()
+    orden_lista = request.GET.get('orden', '')
+    
+    contactos = filtrar_contactos(aplicar_query_spec(Contacto.objects.all(), 'contactos_list'), request.GET)
+    
+    # Agrupados o por relevancia de búsqueda se pagina por offset; si no, por cursor
+    if grupo or query:
+        orden = None
+    elif orden_lista == 'actividad':
+        orden = ORDEN_PAGINACION['contactos_actividad']
+    else:
+        orden = ORDEN_PAGINACION['contactos_list']
+    paginator = KeysetPaginator(contactos, 20, orden=orden)
+    page_obj = listas.pagina(
+        'contactos_list', request.GET, paginator, [aplicar_query_spec(Contacto.objects.all(), 'contactos_list')],
+    )
     
     context = {
         'page_obj': page_obj,
@@ -89,16 +334,21 @@ def contactos_list(request):
         'empresa_id': empresa_id,
         'etiqueta_id': etiqueta_id,
         'grupo': grupo,
-        'empresas': empresas,
-        'etiquetas': etiquetas,
+        'orden': orden_lista,
+        'filtros': _filtros_querystring(request),
+        'empresa_filtro': _seleccion(Empresa.objects.only('nombre'), empresa_id),
+        'etiqueta_filtro': _seleccion(Etiqueta.objects.all(), etiqueta_id),
+        'fragmentos': versiones(),
     }
     return render(request, 'home/crm/contactos_list.html', context)
 
 
+def contactos_exportar(request):
+    contactos = filtrar_contactos(Contacto.objects.order_by('nombre', 'id'), request.GET)
+    return _exportar(request, 'contactos', exportacion.filas_contactos(contactos), exportacion.COLUMNAS_CONTACTOS)
+
+
 def contacto_create(request):
-    empresas = Empresa.objects.all()
-    etiquetas = Etiqueta.objects.all()
-    
     if request.method == 'POST':
         try:
             contacto = Contacto.objects.create(
@@ -116,20 +366,35 @@ def contacto_create(request):
         except Exception as e:
             messages.error(request, f'Error al crear contacto: {str(e)}')
     
-    context = {
-        'empresas': empresas,
-        'etiquetas': etiquetas,
-    }
-    return render(request, 'home/crm/contacto_form.html', context)
+    return render(request, 'home/crm/contacto_form.html', {})
+
+
+def contactos_importar(request):
+    resultado = None
+    if request.method == 'POST':
+        archivo = request.FILES.get('archivo')
+        formato = request.POST.get('formato', 'csv')
+        if not archivo:
+            messages.error(request, 'Seleccione un archivo para importar.')
+        elif formato not in ('csv', 'jsonl'):
+            messages.error(request, 'Formato no soportado.')
+        else:
+            try:
+                resultado = ImportadorContactos().importar(leer_filas(archivo, formato))
+                messages.success(request, f'{resultado.creados} contactos importados.')
+            except Exception as e:
+                messages.error(request, f'Error al importar contactos: {str(e)}')
+    
+    context = {'resultado': resultado}
+    return render(request, 'home/crm/contactos_import.html', context)
 
 
 def contacto_edit(request, pk):
-    contacto = get_object_or_404(Contacto, pk=pk)
-    empresas = Empresa.objects.all()
-    etiquetas = Etiqueta.objects.all()
+    contacto = get_object_or_404(Contacto.objects.select_related('empresa').prefetch_related('etiquetas'), pk=pk)
     
     if request.method == 'POST':
         try:
+            # save() escribe solo las columnas que cambiaron (CamposModificadosMixin)
             contacto.nombre = request.POST.get('nombre')
             contacto.correo = request.POST.get('correo')
             contacto.telefono = request.POST.get('telefono', '')
@@ -137,8 +402,9 @@ def contacto_edit(request, pk):
             contacto.notas = request.POST.get('notas', '')
             contacto.save()
             
-            etiquetas_ids = request.POST.getlist('etiquetas')
-            contacto.etiquetas.set(etiquetas_ids)
+            etiquetas_ids = set(request.POST.getlist('etiquetas'))
+            if etiquetas_ids != {str(etiqueta.pk) for etiqueta in contacto.etiquetas.all()}:
+                contacto.etiquetas.set(etiquetas_ids)
             
             messages.success(request, 'Contacto actualizado exitosamente.')
             return redirect('contactos_list')
@@ -147,8 +413,7 @@ def contacto_edit(request, pk):
     
     context = {
         'contacto': contacto,
-        'empresas': empresas,
-        'etiquetas': etiquetas,
+        'etiquetas_contacto': contacto.etiquetas.all(),
     }
     return render(request, 'home/crm/contacto_form.html', context)
 
@@ -164,8 +429,9 @@ def contacto_delete(request, pk):
     return render(request, 'home/crm/contacto_confirm_delete.html', context)
 
 
+@lectura
 def contacto_detail(request, pk):
-    contacto = get_object_or_404(Contacto, pk=pk)
+    contacto = get_object_or_404(aplicar_query_spec(Contacto.objects.all(), 'contacto_detail'), pk=pk)
     oportunidades = contacto.oportunidades.all()
     actividades = contacto.actividades.all()
     
@@ -177,51 +443,156 @@ def contacto_detail(request, pk):
     return render(request, 'home/crm/contacto_detail.html', context)
 
 
+@lectura
+async def contacto_detail_async(request, pk):
+    contacto, oportunidades, actividades = await _consultas_concurrentes(
+        lambda: aplicar_query_spec(Contacto.objects.all(), 'contacto_detail').filter(pk=pk).first(),
+        lambda: list(Oportunidad.objects.filter(contacto_id=pk)),
+        lambda: list(Actividad.objects.filter(contacto_id=pk)),
+    )
+    if contacto is None:
+        raise Http404('No existe el contacto.')
+    
+    context = {
+        'contacto': contacto,
+        'oportunidades': oportunidades,
+        'actividades': actividades,
+    }
+    return await sync_to_async(render)(request, 'home/crm/contacto_detail.html', context)
+
+
 # Vistas de Oportunidades
+@lectura
 def oportunidades_list(request):
     estado = request.GET.get('estado', '')
     contacto_id = request.GET.get('contacto', '')
     
-    oportunidades = Oportunidad.objects.all()
-    
-    if estado:
-        oportunidades = oportunidades.filter(estado=estado)
+    oportunidades = filtrar_oportunidades(aplicar_query_spec(Oportunidad.objects.all(), 'oportunidades_list'), request.GET)
     
-    if contacto_id:
-        oportunidades = oportunidades.filter(contacto_id=contacto_id)
-    
-    oportunidades = oportunidades.order_by('-fecha_creacion')
-    
-    paginator = Paginator(oportunidades, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    contactos = Contacto.objects.all()
+    paginator = KeysetPaginator(oportunidades, 20, orden=ORDEN_PAGINACION['oportunidades_list'])
+    page_obj = listas.pagina(
+        'oportunidades_list', request.GET, paginator,
+        [aplicar_query_spec(Oportunidad.objects.all(), 'oportunidades_list')],
+    )
     
     context = {
         'page_obj': page_obj,
         'estado': estado,
         'contacto_id': contacto_id,
-        'contactos': contactos,
+        'filtros': _filtros_querystring(request),
+        'contacto_filtro': _seleccion(Contacto.objects.only('nombre'), contacto_id),
         'estados': Oportunidad.ESTADO_CHOICES,
     }
     return render(request, 'home/crm/oportunidades_list.html', context)
 
 
+PIPELINE_TARJETAS_POR_COLUMNA = 20
+PIPELINE_TARJETAS_MAXIMO = 100
+
+
+def oportunidades_exportar(request):
+    oportunidades = filtrar_oportunidades(Oportunidad.objects.order_by('-fecha_creacion', '-id'), request.GET)
+    return _exportar(
+        request, 'oportunidades', exportacion.filas_oportunidades(oportunidades), exportacion.COLUMNAS_OPORTUNIDADES
+    )
+
+
+def _pipeline_tarjetas(queryset):
+    return aplicar_query_spec(queryset, 'oportunidades_pipeline').order_by('-fecha_creacion', '-id')
+
+
+def _pipeline_tarjeta_json(oportunidad):
+    return {
+        'id': oportunidad.pk,
+        'titulo': oportunidad.titulo,
+        'contacto': oportunidad.contacto.nombre,
+        'valor': str(oportunidad.valor),
+        'estado': oportunidad.estado,
+        'fecha_estimada_cierre': oportunidad.fecha_estimada_cierre.isoformat(),
+    }
+
+
+def _pipeline_primeras_tarjetas(limite):
+    """Las primeras ``limite`` tarjetas de cada columna, {estado: [oportunidades]}."""
+    # Un SELECT ... LIMIT por estado: cada uno lee solo su tramo de
+    # oport_estado_fecha_idx, sin numerar las filas de toda la tabla. SQLite
+    # no admite LIMIT dentro de un UNION ALL, así que son consultas aparte.
+    return {
+        codigo: list(_pipeline_tarjetas(Oportunidad.objects.filter(estado=codigo))[:limite])
+        for codigo, _ in Oportunidad.ESTADO_CHOICES
+    }
+
+
+@lectura
+@ensure_csrf_cookie
 def oportunidades_pipeline(request):
-    estados = ['nuevo', 'en_progreso', 'ganado', 'perdido']
-    pipeline = {}
+    limite = PIPELINE_TARJETAS_POR_COLUMNA
+    
+    # Conteo y valor de cada columna en un solo GROUP BY
+    totales = {
+        fila['estado']: fila
+        for fila in Oportunidad.objects.order_by().values('estado').annotate(
+            count=Count('id'), total=Sum('valor')
+        )
+    }
+    
+    tarjetas = _pipeline_primeras_tarjetas(limite)
     
-    for estado in estados:
-        pipeline[estado] = Oportunidad.objects.filter(estado=estado).order_by('-fecha_creacion')
+    columnas = []
+    for codigo, nombre in Oportunidad.ESTADO_CHOICES:
+        total = totales.get(codigo, {})
+        columnas.append({
+            'codigo': codigo,
+            'nombre': nombre,
+            'count': total.get('count', 0),
+            'total': total.get('total') or 0,
+            'oportunidades': tarjetas[codigo],
+            'hay_mas': total.get('count', 0) > limite,
+        })
     
     context = {
-        'pipeline': pipeline,
+        'columnas': columnas,
         'estados': Oportunidad.ESTADO_CHOICES,
+        'limite': limite,
+        'fragmentos': versiones(),
+        'csrf_cookie': settings.CSRF_COOKIE_NAME,
     }
     return render(request, 'home/crm/oportunidades_pipeline.html', context)
 
 
+@lectura
+def oportunidades_pipeline_columna(request, estado):
+    if estado not in dict(Oportunidad.ESTADO_CHOICES):
+        return JsonResponse({'error': 'Estado no válido'}, status=404)
+    
+    try:
+        offset = max(int(request.GET.get('offset', 0)), 0)
+        limite = min(max(int(request.GET.get('limite', PIPELINE_TARJETAS_POR_COLUMNA)), 1), PIPELINE_TARJETAS_MAXIMO)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros de paginación no válidos'}, status=400)
+    
+    # Se pide una tarjeta de más para saber si quedan otras sin contar la columna
+    oportunidades = list(_pipeline_tarjetas(Oportunidad.objects.filter(estado=estado))[offset:offset + limite + 1])
+    hay_mas = len(oportunidades) > limite
+    
+    return JsonResponse({
+        'estado': estado,
+        'oportunidades': [_pipeline_tarjeta_json(o) for o in oportunidades[:limite]],
+        'siguiente_offset': offset + limite if hay_mas else None,
+    })
+
+
+@lectura
+def oportunidades_analitica(request):
+    # Embudo y pronóstico de home/analitica.py, en caché por año
+    anio = analitica.periodo_valido(request.GET.get('anio', ''))
+    context = analitica.reporte(anio)
+    context['estados'] = Oportunidad.ESTADO_CHOICES
+    hoy = timezone.localdate()
+    context['anios'] = range(hoy.year + 1, hoy.year - 4, -1)
+    return render(request, 'home/crm/oportunidades_analitica.html', context)
+
+
 def oportunidad_create(request):
     if request.method == 'POST':
         try:
@@ -238,16 +609,14 @@ def oportunidad_create(request):
         except Exception as e:
             messages.error(request, f'Error al crear oportunidad: {str(e)}')
     
-    contactos = Contacto.objects.all()
     context = {
-        'contactos': contactos,
         'estados': Oportunidad.ESTADO_CHOICES,
     }
     return render(request, 'home/crm/oportunidad_form.html', context)
 
 
 def oportunidad_edit(request, pk):
-    oportunidad = get_object_or_404(Oportunidad, pk=pk)
+    oportunidad = get_object_or_404(Oportunidad.objects.select_related('contacto'), pk=pk)
     
     if request.method == 'POST':
         try:
@@ -264,10 +633,8 @@ def oportunidad_edit(request, pk):
         except Exception as e:
             messages.error(request, f'Error al actualizar oportunidad: {str(e)}')
     
-    contactos = Contacto.objects.all()
     context = {
         'oportunidad': oportunidad,
-        'contactos': contactos,
         'estados': Oportunidad.ESTADO_CHOICES,
     }
     return render(request, 'home/crm/oportunidad_form.html', context)
@@ -297,7 +664,42 @@ def oportunidad_update_estado(request, pk):
     return redirect('oportunidades_pipeline')
 
 
+# Operaciones por lote (home/lotes.py): ids repetidos o separados por comas
+def _ids_del_lote(request):
+    valores = [parte.strip() for valor in request.POST.getlist('ids') for parte in valor.split(',')]
+    try:
+        ids = {int(valor) for valor in valores if valor}
+    except ValueError:
+        raise ValueError('Los ids deben ser números enteros')
+    if not ids:
+        raise ValueError('Falta la lista de ids')
+    if len(ids) > lotes.LOTE_MAXIMO:
+        raise ValueError(f'Como máximo {lotes.LOTE_MAXIMO} ids por lote')
+    return ids
+
+
+@require_POST
+def oportunidades_lote(request):
+    accion = request.POST.get('accion')
+    estado = request.POST.get('estado')
+    try:
+        ids = _ids_del_lote(request)
+        if accion not in ('estado', 'eliminar'):
+            raise ValueError('Acción no válida')
+        if accion == 'estado' and estado not in dict(Oportunidad.ESTADO_CHOICES):
+            raise ValueError('Estado no válido')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    if accion == 'estado':
+        afectadas = lotes.cambiar_estado_oportunidades(ids, estado)
+    else:
+        afectadas = lotes.eliminar_oportunidades(ids)
+    return JsonResponse({'accion': accion, 'afectadas': afectadas})
+
+
 # Vistas de Actividades
+@lectura
 def actividades_list(request):
     tipo = request.GET.get('tipo', '')
     contacto_id = request.GET.get('contacto', '')
@@ -306,42 +708,17 @@ def actividades_list(request):
     fecha_hasta = request.GET.get('fecha_hasta', '')
     completadas = request.GET.get('completadas', '')
     
-    actividades = Actividad.objects.all()
+    actividades = filtrar_actividades(aplicar_query_spec(Actividad.objects.all(), 'actividades_list'), request.GET)
     
-    if tipo:
-        actividades = actividades.filter(tipo=tipo)
-    
-    if contacto_id:
-        actividades = actividades.filter(contacto_id=contacto_id)
-    
-    if oportunidad_id:
-        actividades = actividades.filter(oportunidad_id=oportunidad_id)
-    
-    if fecha_desde:
-        try:
-            fecha_desde_dt = datetime.strptime(fecha_desde, '%Y-%m-%d')
-            actividades = actividades.filter(fecha__gte=fecha_desde_dt)
-        except:
-            pass
-    
-    if fecha_hasta:
-        try:
-            fecha_hasta_dt = datetime.strptime(fecha_hasta, '%Y-%m-%d') + timedelta(days=1)
-            actividades = actividades.filter(fecha__lt=fecha_hasta_dt)
-        except:
-            pass
-    
-    if completadas == 'si':
-        actividades = actividades.filter(completada=True)
-    elif completadas == 'no':
-        actividades = actividades.filter(completada=False)
-    
-    paginator = Paginator(actividades, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    contactos = Contacto.objects.all()
-    oportunidades = Oportunidad.objects.all()
+    orden = ORDEN_PAGINACION['actividades_list']
+    tablas = [aplicar_query_spec(Actividad.objects.all(), 'actividades_list')]
+    if archivo.alcanza_archivo(request.GET):
+        tablas.append(aplicar_query_spec(ActividadArchivada.objects.all(), 'actividades_list'))
+        archivadas = filtrar_actividades(tablas[1], request.GET)
+        paginator = KeysetPaginatorUnion([actividades, archivadas], 20, orden=orden)
+    else:
+        paginator = KeysetPaginator(actividades, 20, orden=orden)
+    page_obj = listas.pagina('actividades_list', request.GET, paginator, tablas)
     
     context = {
         'page_obj': page_obj,
@@ -351,13 +728,25 @@ def actividades_list(request):
         'fecha_desde': fecha_desde,
         'fecha_hasta': fecha_hasta,
         'completadas': completadas,
-        'contactos': contactos,
-        'oportunidades': oportunidades,
+        'filtros': _filtros_querystring(request),
+        'contacto_filtro': _seleccion(Contacto.objects.only('nombre'), contacto_id),
+        'oportunidad_filtro': _seleccion(Oportunidad.objects.only('titulo'), oportunidad_id),
         'tipos': Actividad.TIPO_CHOICES,
     }
     return render(request, 'home/crm/actividades_list.html', context)
 
 
+def actividades_exportar(request):
+    filas = exportacion.filas_actividades(filtrar_actividades(Actividad.objects.order_by('-fecha', '-id'), request.GET))
+    if archivo.alcanza_archivo(request.GET):
+        # Ambas tablas ya vienen por (-fecha, -id): se mezclan sin cargarlas en memoria
+        archivadas = filtrar_actividades(ActividadArchivada.objects.order_by('-fecha', '-id'), request.GET)
+        filas = heapq.merge(
+            filas, exportacion.filas_actividades(archivadas), key=lambda fila: (fila['fecha'], fila['id']), reverse=True,
+        )
+    return _exportar(request, 'actividades', filas, exportacion.COLUMNAS_ACTIVIDADES)
+
+
 def actividad_create(request):
     if request.method == 'POST':
         try:
@@ -375,18 +764,14 @@ def actividad_create(request):
         except Exception as e:
             messages.error(request, f'Error al crear actividad: {str(e)}')
     
-    contactos = Contacto.objects.all()
-    oportunidades = Oportunidad.objects.all()
     context = {
-        'contactos': contactos,
-        'oportunidades': oportunidades,
         'tipos': Actividad.TIPO_CHOICES,
     }
     return render(request, 'home/crm/actividad_form.html', context)
 
 
 def actividad_edit(request, pk):
-    actividad = get_object_or_404(Actividad, pk=pk)
+    actividad = get_object_or_404(Actividad.objects.select_related('contacto', 'oportunidad'), pk=pk)
     
     if request.method == 'POST':
         try:
@@ -404,12 +789,8 @@ def actividad_edit(request, pk):
         except Exception as e:
             messages.error(request, f'Error al actualizar actividad: {str(e)}')
     
-    contactos = Contacto.objects.all()
-    oportunidades = Oportunidad.objects.all()
     context = {
         'actividad': actividad,
-        'contactos': contactos,
-        'oportunidades': oportunidades,
         'tipos': Actividad.TIPO_CHOICES,
     }
     return render(request, 'home/crm/actividad_form.html', context)
@@ -432,3 +813,20 @@ def actividad_toggle_completada(request, pk):
     actividad.save()
     messages.success(request, f'Actividad marcada como {"completada" if actividad.completada else "pendiente"}.')
     return redirect('actividades_list')
+
+
+@require_POST
+def actividades_lote(request):
+    accion = request.POST.get('accion')
+    try:
+        ids = _ids_del_lote(request)
+        if accion not in ('completar', 'pendiente', 'eliminar'):
+            raise ValueError('Acción no válida')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    if accion == 'eliminar':
+        afectadas = lotes.eliminar_actividades(ids)
+    else:
+        afectadas = lotes.marcar_actividades(ids, accion == 'completar')
+    return JsonResponse({'accion': accion, 'afectadas': afectadas})
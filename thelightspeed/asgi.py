@@ -0,0 +1,27 @@
+"""
+ASGI config for thelightspeed project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Serves the URLconf in thelightspeed/urls_asgi.py, where the dashboard and the
+contact detail are async views.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+"""
+
+import os
+import time
+
+_inicio = time.perf_counter()
+
+from django.core.asgi import get_asgi_application  # noqa: E402
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'thelightspeed.settings')
+os.environ.setdefault('CRM_URLCONF', 'thelightspeed.urls_asgi')
+
+application = get_asgi_application()
+
+# URLconf y plantillas listos antes del primer pedido (home/arranque.py)
+from home.arranque import preparar_worker  # noqa: E402
+
+preparar_worker(_inicio)
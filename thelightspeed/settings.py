@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 
 import os
 
+import django
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -22,10 +24,15 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = '!smvgiuv#wr(+hc^5k#b#-t8&08x8uupphc*(j+jnhjcv+ba@h'
 
+# Perfil de despliegue: CRM_PERFIL=produccion apaga DEBUG, toma los hosts de
+# CRM_HOSTS (separados por comas) y fija el cargador de plantillas en caché;
+# thelightspeed/wsgi.py además precompila las plantillas de cada worker.
+CRM_PERFIL = os.environ.get('CRM_PERFIL', 'desarrollo')
+
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = CRM_PERFIL != 'produccion'
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('CRM_HOSTS', '').split(',') if host.strip()]
 
 
 # Application definition
@@ -41,7 +48,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'home.instrumentacion.InstrumentacionMiddleware',
+    'home.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Comprime las respuestas si el cliente acepta gzip (con la mitigación de
+    # BREACH de Django); ConditionalGet va después para calcular el ETag sobre
+    # el contenido sin comprimir y responder 304 si no cambió
+    'django.middleware.gzip.GZipMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -50,11 +64,27 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'thelightspeed.urls'
+# Estáticos servidos por WhiteNoise (paquete whitenoise) desde STATIC_ROOT,
+# antes de las demás capas; sin él, el servidor web de delante debe servir
+# STATIC_ROOT. Ver STORAGES más abajo.
+CRM_SERVIR_ESTATICOS = os.environ.get(
+    'CRM_SERVIR_ESTATICOS', '1' if CRM_PERFIL == 'produccion' else '0'
+) == '1'
+
+if CRM_SERVIR_ESTATICOS:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+        'whitenoise.middleware.WhiteNoiseMiddleware',
+    )
+
+# thelightspeed/asgi.py usa thelightspeed.urls_asgi, con las vistas asíncronas
+ROOT_URLCONF = os.environ.get('CRM_URLCONF', 'thelightspeed.urls')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'home.instrumentacion.DjangoTemplatesMedidos',
+        # El alias se tomaría del módulo del backend ('instrumentacion')
+        'NAME': 'django',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -68,17 +98,141 @@ TEMPLATES = [
     },
 ]
 
+if CRM_PERFIL == 'produccion':
+    # Explícito en lugar de APP_DIRS: cada plantilla se compila una vez por
+    # proceso y no se vuelve a revisar en disco
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
+# Precompilar las plantillas de home/templates al cargar thelightspeed/wsgi.py
+CRM_PRECOMPILAR_PLANTILLAS = os.environ.get(
+    'CRM_PRECOMPILAR_PLANTILLAS', '1' if CRM_PERFIL == 'produccion' else '0'
+) == '1'
+
 WSGI_APPLICATION = 'thelightspeed.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
+#
+# Se elige con variables de entorno. CRM_DB_MOTOR=postgresql usa conexiones
+# persistentes (CRM_DB_CONN_MAX_AGE segundos, con verificación antes de
+# reutilizarlas) o, con CRM_DB_POOL=1, el pool de psycopg 3. Por omisión se
+# usa SQLite, con los PRAGMA de CRM_SQLITE_PRAGMAS aplicados al abrir cada
+# conexión (home/signals.py).
+
+CRM_DB_MOTOR = os.environ.get('CRM_DB_MOTOR', 'sqlite')
+
+if CRM_DB_MOTOR == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('CRM_DB_NOMBRE', 'thelightspeed'),
+            'USER': os.environ.get('CRM_DB_USUARIO', ''),
+            'PASSWORD': os.environ.get('CRM_DB_CLAVE', ''),
+            'HOST': os.environ.get('CRM_DB_HOST', ''),
+            'PORT': os.environ.get('CRM_DB_PUERTO', ''),
+            'CONN_MAX_AGE': int(os.environ.get('CRM_DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if os.environ.get('CRM_DB_POOL') == '1':
+        # El pool reemplaza a las conexiones persistentes (Django 5.1+, psycopg 3)
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('CRM_DB_POOL_MIN', '2')),
+                'max_size': int(os.environ.get('CRM_DB_POOL_MAX', '10')),
+            },
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('CRM_DB_NOMBRE', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': int(os.environ.get('CRM_DB_CONN_MAX_AGE', '0')),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if django.VERSION >= (5, 1):
+        # Las transacciones toman el bloqueo de escritura al empezar: una
+        # transacción diferida que lee y luego escribe falla sin esperar a
+        # busy_timeout si otro escribió en medio.
+        DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'}
+
+# Réplicas de lectura (home/replicas.py): CRM_DB_REPLICAS lista, separados por
+# comas, los archivos (SQLite) o los hosts (PostgreSQL) de cada réplica, que
+# se agregan como replica_1, replica_2, ... En las pruebas apuntan a default.
+for numero, destino in enumerate(filter(None, os.environ.get('CRM_DB_REPLICAS', '').split(',')), start=1):
+    replica = dict(DATABASES['default'])
+    replica['HOST' if CRM_DB_MOTOR == 'postgresql' else 'NAME'] = destino.strip()
+    replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica_{numero}'] = replica
+
+CRM_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+CRM_REPLICA_VENTANA = int(os.environ.get('CRM_REPLICA_VENTANA', '5'))
+DATABASE_ROUTERS = ['home.replicas.ReplicaRouter']
+
+# WAL deja leer mientras otro escribe; synchronous=NORMAL es seguro con WAL
+# (solo se pierde la última transacción ante un corte de energía) y
+# busy_timeout hace esperar en lugar de fallar con "database is locked".
+CRM_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('CRM_SQLITE_BUSY_TIMEOUT', '5000')),
+    'cache_size': -20000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+# Caché de fragmentos de plantilla (home/fragmentos.py). CRM_CACHE_FRAGMENTOS
+# elige entre la memoria de cada proceso (memoria) o archivos en
+# CRM_CACHE_FRAGMENTOS_DIR compartidos por todos los procesos (archivo).
+CRM_FRAGMENTOS_TTL = int(os.environ.get('CRM_FRAGMENTOS_TTL', '600'))
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+if os.environ.get('CRM_CACHE_FRAGMENTOS', 'memoria') == 'archivo':
+    _cache_fragmentos = {
+        'BACKEND': 'home.fragmentos.FileBasedCacheMedida',
+        'LOCATION': os.environ.get('CRM_CACHE_FRAGMENTOS_DIR', os.path.join(BASE_DIR, 'cache', 'fragmentos')),
     }
+else:
+    _cache_fragmentos = {'BACKEND': 'home.fragmentos.LocMemCacheMedida', 'LOCATION': 'fragmentos'}
+
+# Páginas de las listas ya resueltas (home/listas.py): ids, cursores y total
+# por combinación de filtros, hasta CRM_LISTAS_TTL segundos y CRM_LISTAS_MAX
+# entradas (en memoria se expulsan las menos usadas). CRM_CACHE_LISTAS elige
+# memoria o archivo como CRM_CACHE_FRAGMENTOS; con varios procesos, archivo
+# comparte también las generaciones que la invalidan (se escriben con set(),
+# que no depende de un incr() atómico). CRM_LISTAS_TTL=0 la
+# desactiva.
+CRM_LISTAS_TTL = int(os.environ.get('CRM_LISTAS_TTL', '300'))
+
+if os.environ.get('CRM_CACHE_LISTAS', 'memoria') == 'archivo':
+    _cache_listas = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CRM_CACHE_LISTAS_DIR', os.path.join(BASE_DIR, 'cache', 'listas')),
+    }
+else:
+    _cache_listas = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'listas'}
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'listas': {
+        **_cache_listas,
+        'TIMEOUT': CRM_LISTAS_TTL,
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CRM_LISTAS_MAX', '2000'))},
+    },
+    'fragmentos': {
+        **_cache_fragmentos,
+        'TIMEOUT': CRM_FRAGMENTOS_TTL,
+        # Una entrada por fila o tarjeta: el máximo por omisión (300) no alcanza
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CRM_FRAGMENTOS_MAX', '10000'))},
+    },
 }
 
 
@@ -120,5 +274,56 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# En producción collectstatic copia los estáticos a STATIC_ROOT con el hash del
+# contenido en el nombre; hay que ejecutarlo en cada despliegue. Con
+# CRM_SERVIR_ESTATICOS además los deja comprimidos (.gz, y .br si está brotli)
+# y WhiteNoise sirve las copias con hash con caché de un año (immutable) y el
+# resto con WHITENOISE_MAX_AGE. Sin WhiteNoise, esas cabeceras las pone el
+# servidor web.
+STATIC_ROOT = os.environ.get('CRM_STATIC_ROOT', os.path.join(BASE_DIR, 'staticfiles'))
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': (
+            'whitenoise.storage.CompressedManifestStaticFilesStorage' if CRM_SERVIR_ESTATICOS
+            else 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage' if CRM_PERFIL == 'produccion'
+            else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+    },
+}
+
+WHITENOISE_MAX_AGE = 300
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Instrumentación por vista (home/instrumentacion.py): fracción de los pedidos
+# que se miden y se guardan como MuestraVista; 0 la desactiva. Las muestras se
+# escriben por lotes de CRM_INSTRUMENTACION_LOTE (o tras CRM_INSTRUMENTACION_ESPERA
+# segundos) y se conservan CRM_INSTRUMENTACION_DIAS días (0: sin límite).
+CRM_INSTRUMENTACION_MUESTREO = float(os.environ.get('CRM_INSTRUMENTACION_MUESTREO', '0.05'))
+CRM_INSTRUMENTACION_LOTE = int(os.environ.get('CRM_INSTRUMENTACION_LOTE', '50'))
+CRM_INSTRUMENTACION_ESPERA = int(os.environ.get('CRM_INSTRUMENTACION_ESPERA', '60'))
+CRM_INSTRUMENTACION_DIAS = int(os.environ.get('CRM_INSTRUMENTACION_DIAS', '7'))
+
+# Archivo de actividades (home/archivo.py): las completadas con más de
+# CRM_ARCHIVO_DIAS días se mueven a ActividadArchivada con archive_actividades.
+CRM_ARCHIVO_DIAS = int(os.environ.get('CRM_ARCHIVO_DIAS', '365'))
+
+# Tareas diferidas (home/tareas.py): con CRM_TAREAS=cola los efectos
+# secundarios de las escrituras (índice de búsqueda, etc.) se guardan en la
+# tabla Tarea y los ejecuta manage.py run_worker; con inmediato se ejecutan
+# dentro del pedido. Los fallos se reintentan CRM_TAREAS_REINTENTOS veces con
+# espera exponencial desde CRM_TAREAS_ESPERA_BASE segundos, y una tarea
+# reclamada vuelve a la cola si no termina en CRM_TAREAS_PLAZO segundos.
+CRM_TAREAS = os.environ.get('CRM_TAREAS', 'cola' if CRM_PERFIL == 'produccion' else 'inmediato')
+CRM_TAREAS_REINTENTOS = int(os.environ.get('CRM_TAREAS_REINTENTOS', '5'))
+CRM_TAREAS_ESPERA_BASE = float(os.environ.get('CRM_TAREAS_ESPERA_BASE', '5'))
+CRM_TAREAS_PLAZO = int(os.environ.get('CRM_TAREAS_PLAZO', '300'))
+
+# Analítica del embudo (home/analitica.py): el reporte de cada año se guarda
+# en la caché por omisión hasta CRM_ANALITICA_TTL segundos o hasta que una
+# oportunidad cambie.
+CRM_ANALITICA_TTL = int(os.environ.get('CRM_ANALITICA_TTL', '600'))
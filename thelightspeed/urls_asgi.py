@@ -0,0 +1,9 @@
+"""URLconf de thelightspeed/asgi.py: las mismas rutas que urls.py, con home/urls_asgi.py."""
+from django.contrib import admin
+from django.urls import path, include
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('home/', include('home.urls_asgi')),
+    path('', include('home.urls_asgi'))
+]
@@ -8,9 +8,17 @@ https://docs.djangoproject.com/en/2.1/howto/deployment/wsgi/
 """
 
 import os
+import time
 
-from django.core.wsgi import get_wsgi_application
+_inicio = time.perf_counter()
+
+from django.core.wsgi import get_wsgi_application  # noqa: E402
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'thelightspeed.settings')
 
 application = get_wsgi_application()
+
+# URLconf y plantillas listos antes del primer pedido (home/arranque.py)
+from home.arranque import preparar_worker  # noqa: E402
+
+preparar_worker(_inicio)